@@ -0,0 +1,202 @@
+"""
+Achievements granted by rules over player_stats.
+
+A rule is an achievement name and description plus minimum values for
+player_stats columns, so "10 wins" is `Rule("Ten Wins", ..., wins=10)` and
+"played every role" needs one game in each of the role columns. A player
+earns the achievement once every threshold is met. Rules find their
+achievement by name. `python -m app.manage bootstrap` adds the missing ones
+to the catalog, in one process; evaluating rules without them fails loudly
+instead, so pre-forked workers cannot each add their own copy.
+
+Evaluation is set based. One SELECT finds every (player, achievement) pair
+in scope whose thresholds are met and that is not granted yet, a UNION ALL
+with one branch per rule. The pairs go into achieves in one bulk insert.
+Both statements cost the same for one player or thousands.
+
+Players of ended matches are evaluated by a game_ended outbox handler, in
+the same transaction that delivers the events. player_stats was updated by
+EndGame before the event was committed, so the handler sees the new totals.
+`python -m app.manage backfill-achievements` evaluates the whole player base,
+split into ranges of usernames that are evaluated concurrently, one
+transaction each. Granting is idempotent, so a range can be retried and a
+backfill can run next to the handler. Achievements are never taken back,
+even when a re-ended match lowers a player's totals.
+"""
+import asyncio
+import logging
+import time
+from sqlalchemy import select, insert, func, literal, exists, union_all
+from app.config import ACHIEVEMENT_RULES, ACHIEVEMENT_BACKFILL_CHUNK, ACHIEVEMENT_BACKFILL_WORKERS
+from app.database import AsyncSessionLocal
+from app.metrics import Histogram, TIME_BUCKETS
+from app.models import Achievement, Achieves, PlayerStats, Plays
+from app.utils import insert_ignore
+from app.cache import invalidate_catalog, invalidate_player_achievements
+from app.outbox import outbox, record_events, ACHIEVEMENT_GRANTED, GAME_ENDED
+
+logger = logging.getLogger("app.achievement_rules")
+
+
+class MissingRuleAchievements(RuntimeError):
+    pass
+
+
+class Rule:
+    def __init__(self, name: str, description: str, **thresholds: int):
+        for column in thresholds:
+            if column not in PlayerStats.__table__.columns or column == "username":
+                raise ValueError(f"Rule '{name}' uses unknown player_stats column '{column}'")
+        self.name = name
+        self.description = description
+        self.thresholds = thresholds
+
+    def condition(self):
+        return [getattr(PlayerStats, column) >= minimum for column, minimum in self.thresholds.items()]
+
+
+RULES = (
+    Rule("First Victory", "Win a match", wins=1),
+    Rule("Ten Wins", "Win 10 matches", wins=10),
+    Rule("Hundred Wins", "Win 100 matches", wins=100),
+    Rule("Veteran", "Finish 100 matches", games_played=100),
+    Rule("Jack of All Trades", "Play every role", manager_games=1, miner_games=1, warrior_games=1),
+    Rule("Master Miner", "Win 25 matches as a miner", miner_wins=25),
+)
+
+
+class AchievementRules:
+    def __init__(self, rules=RULES):
+        self.rules = list(rules)
+        self._achieve_ids: dict[str, int] = {}  # rule name -> achieve_id, resolved once per process
+        self.evaluate_seconds = Histogram(TIME_BUCKETS)
+        self.evaluations = 0
+        self.granted = 0
+
+    async def achieve_ids(self, db, add_missing: bool = False) -> dict[str, int]:
+        """achieve_id of every rule. Missing achievements are added to the catalog
+        with `add_missing` (caller commits), and raise MissingRuleAchievements otherwise."""
+        if len(self._achieve_ids) == len(self.rules):
+            return self._achieve_ids
+        names = [rule.name for rule in self.rules]
+        query = (
+            select(Achievement.name, func.min(Achievement.achieve_id))
+            .where(Achievement.name.in_(names))
+            .group_by(Achievement.name)
+        )
+        found = {name: achieve_id for name, achieve_id in await db.execute(query)}
+        missing = [rule for rule in self.rules if rule.name not in found]
+        if missing and not add_missing:
+            raise MissingRuleAchievements(
+                f"Rule achievements missing from the catalog ({', '.join(rule.name for rule in missing)}), "
+                "run `python -m app.manage bootstrap`"
+            )
+        if missing:
+            await db.execute(insert(Achievement), [{"name": rule.name, "description": rule.description} for rule in missing])
+            found = {name: achieve_id for name, achieve_id in await db.execute(query)}
+            invalidate_catalog()
+            logger.info("Added rule achievements: %s", ", ".join(rule.name for rule in missing))
+        self._achieve_ids = found
+        return found
+
+    async def evaluate(self, db, *scope) -> list[dict]:
+        """Grant every rule achievement earned by the player_stats rows matching `scope`.
+
+        Runs in the caller's transaction and returns the new {username, achieve_id} rows.
+        """
+        start = time.perf_counter()
+        achieve_ids = await self.achieve_ids(db)
+        earned = union_all(*(
+            select(PlayerStats.username, literal(achieve_ids[rule.name]).label("achieve_id"))
+            .where(*scope, *rule.condition())
+            .where(~exists().where(
+                Achieves.username == PlayerStats.username,
+                Achieves.achieve_id == achieve_ids[rule.name],
+            ))
+            for rule in self.rules
+        ))
+        rows = [{"username": username, "achieve_id": achieve_id} for username, achieve_id in await db.execute(earned)]
+        if rows:
+            # A concurrent grant of the same pair is fine, skip it
+            await db.execute(insert_ignore(Achieves, db.get_bind().dialect.name), rows)
+            await record_events(db, ACHIEVEMENT_GRANTED, rows)
+        self.evaluations += 1
+        self.granted += len(rows)
+        self.evaluate_seconds.observe(time.perf_counter() - start)
+        return rows
+
+    async def _chunk_bounds(self, chunk_size: int) -> list[tuple[str | None, str | None]]:
+        # Keyset walk over the player_stats primary key, one (after, up_to) username range per chunk
+        bounds, lower = [], None
+        async with AsyncSessionLocal() as db:
+            while True:
+                query = select(PlayerStats.username).order_by(PlayerStats.username).offset(chunk_size - 1).limit(1)
+                if lower is not None:
+                    query = query.where(PlayerStats.username > lower)
+                upper = await db.scalar(query)
+                bounds.append((lower, upper))
+                if upper is None:
+                    return bounds
+                lower = upper
+
+    async def backfill(self, chunk_size: int = ACHIEVEMENT_BACKFILL_CHUNK, workers: int = ACHIEVEMENT_BACKFILL_WORKERS) -> dict:
+        """Evaluate every player in username ranges of `chunk_size`, `workers` ranges at a time."""
+        start = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            await self.achieve_ids(db)
+            await db.commit()
+            players = await db.scalar(select(func.count()).select_from(PlayerStats))
+        bounds = await self._chunk_bounds(chunk_size)
+        semaphore = asyncio.Semaphore(workers)
+        granted = 0
+
+        async def run_chunk(lower, upper):
+            nonlocal granted
+            scope = []
+            if lower is not None:
+                scope.append(PlayerStats.username > lower)
+            if upper is not None:
+                scope.append(PlayerStats.username <= upper)
+            async with semaphore, AsyncSessionLocal() as db:
+                rows = await self.evaluate(db, *scope)
+                await db.commit()
+            granted += len(rows)
+
+        await asyncio.gather(*(run_chunk(lower, upper) for lower, upper in bounds))
+        if granted:
+            outbox.notify()
+        elapsed = time.perf_counter() - start
+        return {
+            "players": players,
+            "chunks": len(bounds),
+            "granted": granted,
+            "seconds": round(elapsed, 3),
+            "players_per_second": round(players / elapsed) if elapsed else 0,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "enabled": ACHIEVEMENT_RULES,
+            "rules": len(self.rules),
+            "evaluations": self.evaluations,
+            "granted": self.granted,
+            "evaluate_seconds": self.evaluate_seconds.snapshot(),
+        }
+
+
+achievement_rules = AchievementRules()
+
+
+if ACHIEVEMENT_RULES:
+    @outbox.handler(GAME_ENDED)
+    async def grant_rule_achievements(db, events: list[dict]):
+        match_ids = list({event["match_id"] for event in events})
+        players = select(Plays.username).where(Plays.match_id.in_(match_ids))
+        await achievement_rules.evaluate(db, PlayerStats.username.in_(players))
+
+
+@outbox.handler(ACHIEVEMENT_GRANTED)
+async def forget_cached_achievements(db, events: list[dict]):
+    # Grants made outside a request (rules, backfill) are committed by now, drop the cached lists
+    for username in {event["username"] for event in events}:
+        invalidate_player_achievements(username)
@@ -0,0 +1,243 @@
+"""
+Admission control in front of the routers: per-client rate limits and a
+global limit on requests in flight, so bursts are shed at the door instead
+of piling up in the connection pool and the bcrypt workers.
+
+Rate limits are token buckets per (client, route). A route in
+RATE_LIMIT_ROUTES (path templates like /players/{username}/history work)
+has its own bucket per client, every other route draws from the client's
+RATE_LIMIT_DEFAULT bucket. An empty bucket answers 429 with Retry-After set
+to when the next token arrives. Clients are told apart by address, or by the
+first X-Forwarded-For hop with RATE_LIMIT_TRUST_FORWARDED. Buckets live in
+an LRU of RATE_LIMIT_MAX_CLIENTS entries, an evicted client starts over with
+a full bucket. Buckets are per worker process, unless the server runs with
+SERVER_SHARED_MEMORY (app/shared.py), then one limit holds for all workers.
+
+At most ADMISSION_MAX_IN_FLIGHT requests run at once, by default the primary
+pool size plus overflow. Up to ADMISSION_MAX_QUEUE more wait, each for at
+most ADMISSION_QUEUE_TIMEOUT, anything beyond gets 503 with Retry-After at
+once. ADMISSION_EXEMPT_ROUTES (no database work, e.g. the matchmaking
+long-poll) skip this limit, not the rate limits.
+
+This is plain ASGI middleware, so a streamed response keeps its slot until
+its last chunk is sent.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from starlette.responses import JSONResponse
+from starlette.routing import compile_path
+from app import shared
+from app.config import (
+    RATE_LIMIT_DEFAULT, RATE_LIMIT_ROUTES, RATE_LIMIT_MAX_CLIENTS, RATE_LIMIT_TRUST_FORWARDED,
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT, ADMISSION_EXEMPT_ROUTES,
+)
+
+logger = logging.getLogger("app.admission")
+
+DEFAULT_ROUTE = "*"
+
+
+def parse_rate(spec: str) -> tuple[float, float] | None:
+    # "<requests per second>/<burst>", the burst defaults to one second's worth
+    if not spec:
+        return None
+    rate, _, burst = spec.partition("/")
+    rate = float(rate)
+    burst = float(burst) if burst else max(rate, 1.0)
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"Invalid rate limit '{spec}', expected '<requests per second>/<burst>'")
+    return rate, burst
+
+
+class RateLimiter:
+    def __init__(self, default: str, routes: list[str], max_clients: int):
+        self.default = parse_rate(default)
+        self._exact = {}
+        self._patterns = []
+        for route in routes:
+            path, _, spec = route.partition("=")
+            limit = parse_rate(spec)
+            if "{" in path:
+                regex, _, _ = compile_path(path)
+                self._patterns.append((regex, path, limit))
+            else:
+                self._exact[path] = limit
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[tuple[str, str], tuple[float, float]] = OrderedDict()  # -> (tokens, updated)
+        self.shared = None  # SharedBuckets across the server's workers, see app/shared.py
+        self.admitted = 0
+        self.rejected: dict[str, int] = {}
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.default is not None or bool(self._exact) or bool(self._patterns)
+
+    def _limit(self, path: str) -> tuple[str, tuple[float, float] | None]:
+        if path in self._exact:
+            return path, self._exact[path]
+        for regex, template, limit in self._patterns:
+            if regex.match(path):
+                return template, limit
+        return DEFAULT_ROUTE, self.default
+
+    def take(self, key: tuple[str, str], rate: float, burst: float, now: float) -> float:
+        """Tokens in the bucket before this request, one is taken when there was at least one."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = burst
+            if len(self._buckets) >= self.max_clients:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        else:
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            self._buckets.move_to_end(key)
+        self._buckets[key] = (tokens - 1 if tokens >= 1 else tokens, now)
+        return tokens
+
+    def _take(self, key: tuple[str, str], rate: float, burst: float) -> float:
+        if self.shared is not None:
+            try:
+                return self.shared.take(key, rate, burst, time.monotonic())
+            except shared.SharedLockTimeout:
+                logger.error("Shared rate limit lock is stuck, a worker probably died holding it; using per-worker limits")
+                self.shared = None
+        return self.take(key, rate, burst, time.monotonic())
+
+    def check(self, client: str, path: str) -> float:
+        """0 if the request may go ahead, otherwise the seconds until it could."""
+        route, limit = self._limit(path)
+        if limit is None:
+            return 0.0
+        rate, burst = limit
+        tokens = self._take((client, route), rate, burst)
+        if tokens >= 1:
+            self.admitted += 1
+            return 0.0
+        self.rejected[route] = self.rejected.get(route, 0) + 1
+        return (1 - tokens) / rate
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "shared": self.shared is not None,
+            "admitted": self.admitted,
+            "rejected": sum(self.rejected.values()),
+            "rejected_by_route": dict(self.rejected),
+            "buckets": len(self._buckets),
+            "max_buckets": self.max_clients,
+            "evictions": self.evictions,
+        }
+
+
+class ConcurrencyLimiter:
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max(1, max_in_flight))
+        self.in_flight = 0
+        self.queued = 0
+        self.peak_in_flight = 0
+        self.peak_queued = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    async def acquire(self) -> bool:
+        if self._slots.locked():
+            if self.queued >= self.max_queue:
+                self.rejected_queue_full += 1
+                return False
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                return False
+            finally:
+                self.queued -= 1
+        else:
+            await self._slots.acquire()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        self.admitted += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.max_in_flight > 0,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+        }
+
+
+rate_limiter = RateLimiter(RATE_LIMIT_DEFAULT, RATE_LIMIT_ROUTES, RATE_LIMIT_MAX_CLIENTS)
+concurrency_limiter = ConcurrencyLimiter(ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+
+
+def client_key(scope) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+
+        if rate_limiter.enabled:
+            wait = rate_limiter.check(client_key(scope), path)
+            if wait:
+                shared.count("rate_limited")
+                response = JSONResponse(
+                    status_code=429,
+                    content={"detail": "Too many requests, please retry later."},
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+                await response(scope, receive, send)
+                return
+
+        if concurrency_limiter.max_in_flight <= 0 or path in ADMISSION_EXEMPT_ROUTES:
+            await self.app(scope, receive, send)
+            return
+        if not await concurrency_limiter.acquire():
+            shared.count("shed")
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Server is busy, please retry shortly."},
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            concurrency_limiter.release()
+
+
+def admission_stats() -> dict:
+    return {"rate_limits": rate_limiter.stats(), "concurrency": concurrency_limiter.stats()}
@@ -0,0 +1,78 @@
+"""
+Maintenance of the player_stats aggregate table.
+
+EndGame calls `apply_match_results` inside its own transaction, once with
+sign=-1 before rewriting a match result (to take back a previous result when
+a match is ended twice) and once with sign=+1 afterwards. `rebuild_player_stats`
+recomputes the whole table from plays and backs `python -m app.manage rebuild-stats`.
+"""
+from sqlalchemy import select, delete, insert, func, case, or_
+from app.models import Plays, PlayerStats, GameResult, Role
+
+# player_stats columns per role: (games with the role, wins with the role)
+ROLE_STAT_COLUMNS = {
+    role: (f"{role.value.lower()}_games", f"{role.value.lower()}_wins") for role in Role
+}
+
+
+def _contributions(plays=Plays) -> dict:
+    # What one plays row adds to each player_stats column
+    won = plays.win_or_lose == GameResult.WIN
+    values = {
+        "wins": case((won, 1), else_=0),
+        "losses": case((plays.win_or_lose == GameResult.LOSE, 1), else_=0),
+        "games_played": case((plays.win_or_lose.is_not(None), 1), else_=0),
+    }
+    for role, (games_column, wins_column) in ROLE_STAT_COLUMNS.items():
+        took_role = or_(plays.role1 == role, plays.role2 == role, plays.role3 == role)
+        values[games_column] = case((took_role & plays.win_or_lose.is_not(None), 1), else_=0)
+        values[wins_column] = case((took_role & won, 1), else_=0)
+    return values
+
+
+def _upsert_increments(dialect_name: str, rows, columns: list[str]):
+    # INSERT ... SELECT that adds to existing player_stats rows instead of failing on them
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        statement = dialect_insert(PlayerStats).from_select(["username", *columns], rows)
+        return statement.on_duplicate_key_update(
+            {column: getattr(PlayerStats, column) + statement.inserted[column] for column in columns}
+        )
+    if dialect_name in ("sqlite", "postgresql"):
+        if dialect_name == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        statement = dialect_insert(PlayerStats).from_select(["username", *columns], rows)
+        return statement.on_conflict_do_update(
+            index_elements=[PlayerStats.username],
+            set_={column: getattr(PlayerStats, column) + statement.excluded[column] for column in columns},
+        )
+    raise NotImplementedError(f"player_stats upsert is not supported for {dialect_name}")
+
+
+async def apply_match_results(db, match_ids: list[str], sign: int = 1):
+    """Add (sign=1) or take back (sign=-1) the current plays results of the given matches."""
+    if not match_ids:
+        return
+    contributions = _contributions()
+    # One grouped SELECT over the matches' plays, upserted into player_stats in the same statement
+    rows = (
+        select(Plays.username, *(sign * func.sum(expression) for expression in contributions.values()))
+        .where(Plays.match_id.in_(match_ids))
+        .group_by(Plays.username)
+    )
+    await db.execute(_upsert_increments(db.get_bind().dialect.name, rows, list(contributions)))
+
+
+def rebuild_player_stats(conn):
+    """Recompute player_stats from scratch (sync connection, caller owns the transaction)."""
+    contributions = _contributions()
+    conn.execute(delete(PlayerStats))
+    conn.execute(
+        insert(PlayerStats).from_select(
+            ["username", *contributions],
+            select(Plays.username, *(func.sum(expression) for expression in contributions.values()))
+            .group_by(Plays.username)
+        )
+    )
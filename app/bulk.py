@@ -0,0 +1,91 @@
+"""
+Helpers for bulk endpoints: request bodies can be a JSON array or NDJSON
+(one JSON object per line, Content-Type application/x-ndjson). Every record
+gets its own result entry so one bad row never fails the whole upload.
+NDJSON is validated and written batch by batch while it is still arriving.
+"""
+import json
+from fastapi import HTTPException, Request, status
+from pydantic import BaseModel, ValidationError
+from app.pagination import NDJSON_MEDIA_TYPE
+
+
+def record_result(index: int, status_code: int = 200, detail: str | None = None, **fields) -> dict:
+    return {"index": index, **fields, "status_code": status_code, "detail": detail}
+
+
+async def _ndjson_items(request: Request):
+    # One object per line as the upload arrives, so memory stays at one chunk
+    # plus a partial line. A line that is not JSON is its own failed record
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if pending.strip():
+        yield _parse_line(pending)
+
+
+def _parse_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return ValueError("Line is not valid JSON.")
+
+
+async def _json_array_items(request: Request):
+    try:
+        raw = json.loads(await request.body())
+    except ValueError:
+        raw = None
+    if not isinstance(raw, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be a JSON array or NDJSON.")
+    for item in raw:
+        yield item
+
+
+async def read_records(request: Request, schema: type[BaseModel], failures: list[dict]):
+    """
+    Yield validated (index, record) pairs from the body, appending a result
+    to `failures` for every row that does not validate. NDJSON is read as it
+    streams in, a JSON array is parsed whole.
+    """
+    if request.headers.get("content-type", "").startswith(NDJSON_MEDIA_TYPE):
+        items = _ndjson_items(request)
+    else:
+        items = _json_array_items(request)
+    index = 0
+    async for item in items:
+        try:
+            if isinstance(item, ValueError):
+                raise item
+            if not isinstance(item, dict):
+                raise TypeError("Each record must be a JSON object.")
+            record = schema(**item)
+        except (ValidationError, TypeError, ValueError) as exc:
+            failures.append(record_result(index, status.HTTP_422_UNPROCESSABLE_CONTENT, str(exc)))
+        else:
+            yield index, record
+        index += 1
+
+
+async def chunks(records, size: int):
+    batch = []
+    async for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def summarize_results(results: list[dict]) -> dict:
+    results.sort(key=lambda result: result["index"])
+    return {
+        "succeeded": sum(1 for result in results if result["status_code"] < 300),
+        "failed": sum(1 for result in results if result["status_code"] >= 300),
+        "results": results,
+    }
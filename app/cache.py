@@ -0,0 +1,174 @@
+"""
+Read caches for data that changes rarely (achievement/icon catalogs) or only
+through our own write endpoints (player profiles). Values must be plain
+data (dicts, lists, scalars), never ORM objects.
+
+The routers only talk to the `CacheBackend` interface, so the in-process
+`MemoryCache` can later be swapped for a shared cache by assigning another
+backend to `catalog_cache` / `player_cache`.
+"""
+import sys
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from app.config import (
+    CATALOG_CACHE_TTL, CATALOG_CACHE_MAX_ENTRIES, CATALOG_CACHE_MAX_BYTES,
+    PLAYER_CACHE_TTL, PLAYER_CACHE_MAX_ENTRIES, PLAYER_CACHE_MAX_BYTES,
+)
+
+# Returned by get() when the key is not cached (None is a valid cached value)
+MISSING = object()
+
+
+class CacheBackend(ABC):
+    """Interface every cache backend implements."""
+
+    @abstractmethod
+    def get(self, key: str):
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value, ttl: float | None = None):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str):
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+
+def estimate_size(value) -> int:
+    # Rough deep size of plain data, good enough to bound memory use
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+
+class MemoryCache(CacheBackend):
+    """LRU cache with per-entry TTL, bounded by entry count and approximate bytes."""
+
+    def __init__(self, name: str, ttl: float, max_entries: int, max_bytes: int):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[float, int, object]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        expires_at, _, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value, ttl: float | None = None):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return  # would evict everything else, not worth caching
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), size, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        if key in self._entries:
+            self._remove(key)
+            self.invalidations += 1
+
+    def delete_prefix(self, prefix: str):
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            self._remove(key)
+            self.invalidations += 1
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+catalog_cache: CacheBackend = MemoryCache("catalog", CATALOG_CACHE_TTL, CATALOG_CACHE_MAX_ENTRIES, CATALOG_CACHE_MAX_BYTES)
+player_cache: CacheBackend = MemoryCache("player", PLAYER_CACHE_TTL, PLAYER_CACHE_MAX_ENTRIES, PLAYER_CACHE_MAX_BYTES)
+
+
+# Cache keys
+def player_key(username: str) -> str:
+    return f"player:{username}"
+
+def player_achievements_prefix(username: str) -> str:
+    return f"player_achievements:{username}:"
+
+def player_achievements_key(username: str, after: int | None, limit: int) -> str:
+    return f"{player_achievements_prefix(username)}{after}:{limit}"
+
+def icon_key(icon_id: int) -> str:
+    return f"icon:{icon_id}"
+
+def achievement_key(achieve_id: int) -> str:
+    return f"achievement:{achieve_id}"
+
+def achievements_page_key(after: int | None, limit: int) -> str:
+    return f"achievements:{after}:{limit}"
+
+
+# Invalidation hooks, called by the write endpoints after they commit
+def invalidate_player(username: str):
+    player_cache.delete(player_key(username))
+    player_cache.delete_prefix(player_achievements_prefix(username))
+
+def invalidate_player_achievements(username: str):
+    player_cache.delete_prefix(player_achievements_prefix(username))
+
+def invalidate_catalog():
+    catalog_cache.clear()
+
+
+def cache_stats() -> dict:
+    return {"catalog": catalog_cache.stats(), "player": player_cache.stats()}
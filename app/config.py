@@ -0,0 +1,149 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def pool_share(budget: int, workers: int, pool_size: int, max_overflow: int) -> tuple[int, int]:
+    # One worker's (pool size, overflow) out of a connection budget for all
+    # workers, keeping the configured ratio between the two
+    share = max(1, budget // max(1, workers))
+    size = max(1, round(share * pool_size / max(1, pool_size + max_overflow)))
+    return size, share - size
+
+
+# Password hashing
+BCRYPT_ROUNDS = env_int("BCRYPT_ROUNDS", 12)
+PASSWORD_POOL_KIND = os.getenv("PASSWORD_POOL_KIND", "thread")  # "thread" or "process"
+PASSWORD_POOL_WORKERS = env_int("PASSWORD_POOL_WORKERS", os.cpu_count() or 1)
+PASSWORD_POOL_MAX_QUEUE = env_int("PASSWORD_POOL_MAX_QUEUE", 256)  # 0 means unbounded
+
+# Session tokens (see app/tokens.py)
+TOKEN_SECRET = os.getenv("TOKEN_SECRET", "")  # HMAC key, must be the same for every worker
+TOKEN_TTL = env_int("TOKEN_TTL", 3600)  # seconds a token issued by LoginPlayer stays valid
+TOKEN_REVOCATION_MAX_ENTRIES = env_int("TOKEN_REVOCATION_MAX_ENTRIES", 100_000)
+AUTH_REQUIRED = env_bool("AUTH_REQUIRED", False)  # reject match and achievement writes without a token
+
+# Process model (see app/server.py)
+WEB_CONCURRENCY = env_int("WEB_CONCURRENCY", 1)  # worker processes, set by app/server.py (uvicorn --workers reads it too)
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = env_int("SERVER_PORT", 8000)
+SERVER_BACKLOG = env_int("SERVER_BACKLOG", 2048)
+SERVER_GRACEFUL_TIMEOUT = env_float("SERVER_GRACEFUL_TIMEOUT", 30.0)  # seconds a worker drains in-flight requests on SIGTERM
+SERVER_SHARED_MEMORY = env_bool("SERVER_SHARED_MEMORY", False)  # cross-worker counters and rate limits (see app/shared.py)
+SHARED_RATE_LIMIT_SLOTS = env_int("SHARED_RATE_LIMIT_SLOTS", 65_536)  # rate limit buckets in shared memory
+
+# Database connection pool
+DB_CONNECTION_BUDGET = env_int("DB_CONNECTION_BUDGET", 0)  # primary connections for all workers together, 0 for no budget
+DB_POOL_SIZE = env_int("DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = env_int("DB_MAX_OVERFLOW", 10)
+if DB_CONNECTION_BUDGET:
+    # Each worker gets its share, in the ratio of DB_POOL_SIZE to DB_MAX_OVERFLOW
+    DB_POOL_SIZE, DB_MAX_OVERFLOW = pool_share(DB_CONNECTION_BUDGET, WEB_CONCURRENCY, DB_POOL_SIZE, DB_MAX_OVERFLOW)
+DB_POOL_TIMEOUT = env_float("DB_POOL_TIMEOUT", 30.0)  # seconds to wait for a free connection
+DB_POOL_RECYCLE = env_int("DB_POOL_RECYCLE", 1800)  # seconds, keep below MySQL wait_timeout
+DB_POOL_PRE_PING = env_bool("DB_POOL_PRE_PING", True)
+
+# Startup (see app/startup.py)
+STARTUP_WARM_CONNECTIONS = env_int("STARTUP_WARM_CONNECTIONS", DB_POOL_SIZE)  # pool connections opened before serving, 0 to skip
+STARTUP_WARM_CACHES = env_bool("STARTUP_WARM_CACHES", True)  # preload the icon and achievement catalogs
+
+# Admission control (see app/admission.py). Rates are "<requests per second>/<burst>" per client
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "")  # shared by routes not in RATE_LIMIT_ROUTES, empty for no limit
+# "<path>=<rate>/<burst>" comma separated, e.g. "/players/LoginPlayer=1/5,/games/AddPlayerToMatch=10/20"
+RATE_LIMIT_ROUTES = [route.strip() for route in os.getenv("RATE_LIMIT_ROUTES", "").split(",") if route.strip()]
+RATE_LIMIT_MAX_CLIENTS = env_int("RATE_LIMIT_MAX_CLIENTS", 100_000)  # buckets kept, least recently used are dropped
+RATE_LIMIT_TRUST_FORWARDED = env_bool("RATE_LIMIT_TRUST_FORWARDED", False)  # identify clients by X-Forwarded-For (behind a proxy)
+ADMISSION_MAX_IN_FLIGHT = env_int("ADMISSION_MAX_IN_FLIGHT", DB_POOL_SIZE + DB_MAX_OVERFLOW)  # 0 for no limit
+ADMISSION_MAX_QUEUE = env_int("ADMISSION_MAX_QUEUE", 50)  # requests waiting for a slot, more are rejected at once
+ADMISSION_QUEUE_TIMEOUT = env_float("ADMISSION_QUEUE_TIMEOUT", 0.25)  # seconds a request waits for a slot, keep well under client timeouts
+# Routes that hold no database connection and skip the in-flight limit
+ADMISSION_EXEMPT_ROUTES = {
+    route.strip() for route in os.getenv("ADMISSION_EXEMPT_ROUTES", "/,/metrics,/matchmaking/Enqueue").split(",") if route.strip()
+}
+
+# Read replicas (see app/replicas.py), same URL form as DATABASE_URL, comma separated
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_SELECTION = os.getenv("REPLICA_SELECTION", "round_robin")  # "round_robin" or "least_loaded"
+REPLICA_RETRY_SECONDS = env_float("REPLICA_RETRY_SECONDS", 30.0)  # how long a failed replica is skipped
+READ_YOUR_WRITES_SECONDS = env_float("READ_YOUR_WRITES_SECONDS", 5.0)  # reads about a just-written player use the primary, 0 disables
+
+# In-process read caches
+CATALOG_CACHE_TTL = env_float("CATALOG_CACHE_TTL", 300.0)  # achievements and icons
+CATALOG_CACHE_MAX_ENTRIES = env_int("CATALOG_CACHE_MAX_ENTRIES", 10_000)
+CATALOG_CACHE_MAX_BYTES = env_int("CATALOG_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+PLAYER_CACHE_TTL = env_float("PLAYER_CACHE_TTL", 30.0)  # player profiles and their achievements
+PLAYER_CACHE_MAX_ENTRIES = env_int("PLAYER_CACHE_MAX_ENTRIES", 100_000)
+PLAYER_CACHE_MAX_BYTES = env_int("PLAYER_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+
+# List endpoints
+DEFAULT_PAGE_SIZE = env_int("DEFAULT_PAGE_SIZE", 100)
+MAX_PAGE_SIZE = env_int("MAX_PAGE_SIZE", 1000)
+STREAM_BATCH_SIZE = env_int("STREAM_BATCH_SIZE", 1000)  # rows fetched per server-side cursor batch
+
+# Bulk endpoints
+BULK_BATCH_SIZE = env_int("BULK_BATCH_SIZE", 500)  # records per transaction
+
+# Concurrent writes (see app/retries.py and app/idempotency.py)
+WRITE_RETRY_ATTEMPTS = env_int("WRITE_RETRY_ATTEMPTS", 5)  # tries of a match write hitting version conflicts or deadlocks
+WRITE_RETRY_BACKOFF = env_float("WRITE_RETRY_BACKOFF", 0.01)  # seconds, upper bound of the first jittered wait, doubled per retry
+WRITE_RETRY_MAX_BACKOFF = env_float("WRITE_RETRY_MAX_BACKOFF", 0.5)
+IDEMPOTENCY_MAX_ENTRIES = env_int("IDEMPOTENCY_MAX_ENTRIES", 10_000)  # stored responses, least recently used are dropped
+IDEMPOTENCY_TTL = env_float("IDEMPOTENCY_TTL", 86400.0)  # seconds a key can be replayed
+IDEMPOTENCY_MAX_BODY_BYTES = env_int("IDEMPOTENCY_MAX_BODY_BYTES", 64 * 1024)  # larger responses are not stored
+
+# Request profiling
+SLOW_REQUEST_MS = env_float("SLOW_REQUEST_MS", 500.0)  # log requests slower than this with their SQL
+SLOW_REQUEST_MAX_STATEMENTS = env_int("SLOW_REQUEST_MAX_STATEMENTS", 50)
+PROFILE_ROUTES = {route.strip() for route in os.getenv("PROFILE_ROUTES", "").split(",") if route.strip()}
+PROFILE_SAMPLE_RATE = env_float("PROFILE_SAMPLE_RATE", 0.01)  # share of requests to PROFILE_ROUTES that get cProfiled
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Leaderboards
+# Seconds before the in-memory boards are reloaded, also how long a worker's
+# boards can miss games ended on other workers (see app/leaderboard.py)
+LEADERBOARD_MAX_AGE = env_float("LEADERBOARD_MAX_AGE", 300.0)
+LEADERBOARD_MIN_GAMES = env_int("LEADERBOARD_MIN_GAMES", 10)  # games needed to appear on win_rate boards
+
+# Live match registry (single process only, see app/live_matches.py)
+LIVE_MATCHES = env_bool("LIVE_MATCHES", False)
+LIVE_MATCH_FLUSH_INTERVAL = env_float("LIVE_MATCH_FLUSH_INTERVAL", 0.5)  # seconds between role write-behind flushes
+LIVE_MATCH_IDLE_SECONDS = env_float("LIVE_MATCH_IDLE_SECONDS", 3600.0)  # drop untouched matches from memory after this
+LIVE_MATCH_FLUSH_ATTEMPTS = env_int("LIVE_MATCH_FLUSH_ATTEMPTS", 3)  # rejected writes of a match's roles before they are dropped
+LIVE_MATCH_NOT_LIVE_TTL = env_float("LIVE_MATCH_NOT_LIVE_TTL", 1.0)  # seconds a match found finished or unknown is not looked up again
+
+# Event outbox (see app/outbox.py)
+OUTBOX_CONSUMER = env_bool("OUTBOX_CONSUMER", True)  # run the consumer inside the API process
+OUTBOX_BATCH_SIZE = env_int("OUTBOX_BATCH_SIZE", 500)  # events delivered per transaction
+OUTBOX_POLL_INTERVAL = env_float("OUTBOX_POLL_INTERVAL", 1.0)  # seconds between polls while idle
+OUTBOX_MAX_ATTEMPTS = env_int("OUTBOX_MAX_ATTEMPTS", 10)  # failed events are kept but no longer retried after this
+OUTBOX_RETRY_SECONDS = env_float("OUTBOX_RETRY_SECONDS", 1.0)  # first retry delay, doubled per attempt
+
+# Rule-based achievements (see app/achievement_rules.py)
+ACHIEVEMENT_RULES = env_bool("ACHIEVEMENT_RULES", True)  # grant rule achievements when matches end
+ACHIEVEMENT_BACKFILL_CHUNK = env_int("ACHIEVEMENT_BACKFILL_CHUNK", 5000)  # players per backfill transaction
+ACHIEVEMENT_BACKFILL_WORKERS = env_int("ACHIEVEMENT_BACKFILL_WORKERS", 4)  # backfill chunks evaluated concurrently
+
+# Matchmaking
+MATCHMAKING_INTERVAL = env_float("MATCHMAKING_INTERVAL", 0.1)  # seconds between scheduler passes
+MATCHMAKING_BATCH_MATCHES = env_int("MATCHMAKING_BATCH_MATCHES", 100)  # matches created per transaction
+MATCHMAKING_MAX_QUEUE = env_int("MATCHMAKING_MAX_QUEUE", 100_000)
+MATCHMAKING_MAX_WAIT = env_float("MATCHMAKING_MAX_WAIT", 30.0)  # longest Enqueue long-poll, seconds
+MATCHMAKING_RESULT_TTL = env_float("MATCHMAKING_RESULT_TTL", 300.0)  # how long Status remembers an assignment
@@ -1,20 +1,152 @@
 import os
+import weakref
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from dotenv import load_dotenv
+from app.config import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+from app.metrics import PoolMetrics
+from app.profiling import instrument_engine
 
 load_dotenv()  
 
+# Read at import, but only required once an engine is first used (see get_engine)
 DATABASE_URL = os.getenv("DATABASE_URL") 
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL not set in .env file or environment variables")
+# Async drivers used when ASYNC_DATABASE_URL is not given explicitly
+ASYNC_DRIVERS = {
+    "mysql": "aiomysql",
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
 
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def to_async_url(url: str) -> str:
+    # Swap the sync driver (e.g. mysql+pymysql) for its async counterpart
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for '{backend}', set ASYNC_DATABASE_URL")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def database_url() -> str:
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL not set in .env file or environment variables")
+    return DATABASE_URL
+
+
+def async_database_url() -> str:
+    return os.getenv("ASYNC_DATABASE_URL") or to_async_url(database_url())
+
+
+def pool_options(url: str, **overrides) -> dict:
+    # In-memory SQLite uses a single shared connection, queue pool settings do not apply
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    options.update(overrides)
+    return options
+
+
+# Every engine made here, so a forked worker can let go of its parent's pools
+_engines = weakref.WeakSet()
+
+
+def _forget_inherited_connections():
+    # In a child after fork(): pooled connections are the parent's sockets. Drop
+    # them without closing, closing would shut them for the parent too, and let
+    # each pool open its own on first use
+    for sync_engine in list(_engines):
+        sync_engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_inherited_connections)
+
+
+def create_pooled_async_engine(url: str, metrics: PoolMetrics | None = None, **overrides):
+    async_engine = create_async_engine(url, **pool_options(url, **overrides))
+    _engines.add(async_engine.sync_engine)
+    if metrics is not None:
+        metrics.attach(async_engine)
+    return async_engine
 
-Base = declarative_base()
 
+# Engines are created on first use rather than at import, so importing the app
+# (workers, tests, management commands) needs neither DATABASE_URL nor a
+# database. Creating an engine does not connect either, the lifespan warms the
+# pool before the first request (app/startup.py).
+_engine = None
+_async_engine = None
+pool_metrics = PoolMetrics()
 
+
+def get_engine():
+    """Sync engine, used for schema management and scripts."""
+    global _engine
+    if _engine is None:
+        url = database_url()
+        _engine = create_engine(url, **pool_options(url))
+        _engines.add(_engine)
+    return _engine
+
+
+def get_async_engine():
+    """Async engine, used by the API so queries never block the event loop."""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_pooled_async_engine(async_database_url(), pool_metrics)
+        instrument_engine(_async_engine)
+    return _async_engine
+
+
+class LazySessionmaker(sessionmaker):
+    # Binds to its engine when the first session is made
+    def __init__(self, get_bind, **kw):
+        super().__init__(**kw)
+        self._get_bind = get_bind
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=self._get_bind())
+        return super().__call__(**local_kw)
+
+
+SessionLocal = LazySessionmaker(get_engine, autocommit=False, autoflush=False)
+AsyncSessionLocal = LazySessionmaker(
+    get_async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+def __getattr__(name):
+    # `from app.database import engine` keeps working, and creates the engine at that point
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    if name == "ASYNC_DATABASE_URL":
+        return async_database_url()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def dispose_engines():
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    if _engine is not None:
+        _engine.dispose()
+
+
+Base = declarative_base()
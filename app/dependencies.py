@@ -1,4 +1,12 @@
-from app.database import SessionLocal
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.exc import DBAPIError
+from app.config import AUTH_REQUIRED
+from app.database import SessionLocal, AsyncSessionLocal, pool_metrics
+from app.replicas import replicas
+from app.tokens import tokens, InvalidToken
+
+bearer = HTTPBearer(auto_error=False)
 
 def get_db():
     db = SessionLocal()
@@ -6,3 +14,62 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        # Check the connection out up front so pool waits show up in the metrics
+        async with pool_metrics.measure_wait():
+            await db.connection()
+        yield db
+
+async def get_read_db(request: Request):
+    # Session for read-only routes: a replica when one is up, otherwise the primary
+    username = request.path_params.get("username") or request.query_params.get("username")
+    for replica in replicas.candidates(username):
+        db = replica.sessionmaker()
+        try:
+            async with replica.pool_metrics.measure_wait():
+                await db.connection()
+        except (DBAPIError, OSError):
+            await db.close()
+            replicas.mark_down(replica)
+            continue
+        replica.reads += 1
+        replica.in_flight += 1
+        try:
+            yield db
+        finally:
+            replica.in_flight -= 1
+            await db.close()
+        return
+
+    replicas.primary_reads += 1
+    async with AsyncSessionLocal() as db:
+        async with pool_metrics.measure_wait():
+            await db.connection()
+        yield db
+
+def unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+async def token_claims(credentials: HTTPAuthorizationCredentials | None = Depends(bearer)) -> dict | None:
+    # Claims of the bearer token from LoginPlayer, None when no token was sent
+    if credentials is None:
+        return None
+    try:
+        return tokens.verify(credentials.credentials)
+    except InvalidToken as exc:
+        raise unauthorized(str(exc))
+
+async def current_player(claims: dict | None = Depends(token_claims)) -> str | None:
+    # Username the request is authenticated as, None only while AUTH_REQUIRED is off
+    if claims is None:
+        if AUTH_REQUIRED:
+            raise unauthorized("Not authenticated")
+        return None
+    return claims["sub"]
+
+def authorize_player(player: str | None, username: str):
+    # A token only acts on behalf of its own player
+    if player is not None and player != username:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Token does not belong to this player")
@@ -0,0 +1,124 @@
+"""
+Bulk export of plays rows for analytics jobs.
+
+Rows come through a server-side cursor (app/pagination.py) and every batch
+of STREAM_BATCH_SIZE rows is encoded and sent as one chunk, so memory stays
+flat however large the range. Ranges are over match_id, in match_id order,
+which the indexes leading with match_id serve without a sort. Plays has no
+timestamps, so there are no time ranges.
+
+Formats:
+- arrow: Apache Arrow IPC stream, one record batch per chunk. The enum
+  columns are dictionary encoded against a fixed dictionary of the enum's
+  members, so each value costs one byte. Needs pyarrow.
+- csv: a header line, then whole lines per chunk. Enums are written by
+  name, NULL as an empty field.
+Without a format, arrow is used when pyarrow is installed and csv otherwise.
+"""
+import csv
+import io
+from enum import Enum
+from sqlalchemy import String, select, type_coerce
+from fastapi.responses import StreamingResponse
+from app.models import Plays, Team, Role, GameResult
+from app.pagination import stream_partitions
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+CSV_MEDIA_TYPE = "text/csv"
+
+
+class ExportFormat(str, Enum):
+    ARROW = "arrow"
+    CSV = "csv"
+
+
+# Exported columns and the enum each one holds. Enums are selected as their
+# stored names, which skips the per-value conversion to Python enum members
+EXPORT_COLUMNS = (
+    ("match_id", Plays.match_id, None),
+    ("username", Plays.username, None),
+    ("team", Plays.team, Team),
+    ("role1", Plays.role1, Role),
+    ("role2", Plays.role2, Role),
+    ("role3", Plays.role3, Role),
+    ("win_or_lose", Plays.win_or_lose, GameResult),
+)
+
+
+def plays_range(after: str | None = None, until: str | None = None):
+    """Plays rows with after < match_id <= until (both optional), in match_id order."""
+    query = select(*(
+        type_coerce(column, String).label(name) if enum else column
+        for name, column, enum in EXPORT_COLUMNS
+    )).order_by(Plays.match_id)
+    if after is not None:
+        query = query.where(Plays.match_id > after)
+    if until is not None:
+        query = query.where(Plays.match_id <= until)
+    return query
+
+
+async def csv_chunks(statement, bind=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow([name for name, _, _ in EXPORT_COLUMNS])
+    yield buffer.getvalue().encode("utf-8")
+    async for _, rows in stream_partitions(statement, bind):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _arrow_schema():
+    fields = []
+    for name, _, enum in EXPORT_COLUMNS:
+        if enum is None:
+            fields.append(pyarrow.field(name, pyarrow.string(), nullable=name not in ("match_id", "username")))
+        else:
+            fields.append(pyarrow.field(name, pyarrow.dictionary(pyarrow.int8(), pyarrow.string())))
+    return pyarrow.schema(fields)
+
+
+async def arrow_chunks(statement, bind=None):
+    schema = _arrow_schema()
+    # Fixed dictionaries, identical in every batch, so the stream never replaces one
+    dictionaries = {
+        name: (pyarrow.array([member.name for member in enum]), {member.name: i for i, member in enumerate(enum)})
+        for name, _, enum in EXPORT_COLUMNS if enum is not None
+    }
+    buffer = io.BytesIO()
+    writer = pyarrow.ipc.new_stream(buffer, schema)
+
+    def take() -> bytes:
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    async for _, rows in stream_partitions(statement, bind):
+        arrays = []
+        for (name, _, enum), values in zip(EXPORT_COLUMNS, zip(*rows)):
+            if enum is None:
+                arrays.append(pyarrow.array(values, pyarrow.string()))
+            else:
+                dictionary, codes = dictionaries[name]
+                indices = pyarrow.array([codes.get(value) for value in values], pyarrow.int8())
+                arrays.append(pyarrow.DictionaryArray.from_arrays(indices, dictionary))
+        # The first batch also carries the schema and dictionaries
+        writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=schema))
+        yield take()
+    writer.close()
+    yield take()  # the schema too, if there were no rows, and the end-of-stream marker
+
+
+def export_response(statement, export_format: ExportFormat, bind=None) -> StreamingResponse:
+    if export_format is ExportFormat.ARROW:
+        return StreamingResponse(arrow_chunks(statement, bind), media_type=ARROW_MEDIA_TYPE)
+    return StreamingResponse(csv_chunks(statement, bind), media_type=CSV_MEDIA_TYPE)
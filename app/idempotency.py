@@ -0,0 +1,205 @@
+"""
+Idempotency-Key support for writes, so a client can safely retry a request
+whose response it never got (timeout, dropped connection).
+
+A POST, PUT, PATCH or DELETE with an Idempotency-Key header runs once. Its
+response is kept and any later request with the same key from the same
+client gets that response back, marked with `Idempotent-Replayed: true`,
+without reaching the routers or the database. Keys are scoped per client:
+the bearer token when one is sent, otherwise the client address.
+
+- The same key with a different method, path or body is answered 422.
+- The same key while the first request is still running is answered 409
+  with Retry-After, the retry then gets the stored response.
+- 5xx, 409 and 429 responses are not stored, retrying those runs the
+  request again.
+
+Responses live in an LRU of IDEMPOTENCY_MAX_ENTRIES for IDEMPOTENCY_TTL
+seconds. The cache is per process: with several workers a retry only
+replays when it reaches the same worker, the version checks in
+app/retries.py still keep the data consistent when it does not.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from starlette.responses import JSONResponse, Response
+from app.admission import client_key
+from app.config import IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_BODY_BYTES
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+MAX_KEY_LENGTH = 255
+UNSTORED_STATUSES = {409, 429}
+
+
+class StoredResponse:
+    __slots__ = ("fingerprint", "status", "headers", "body", "expires_at")
+
+    def __init__(self, fingerprint: bytes, status: int, headers: list, body: bytes, expires_at: float):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+
+
+class IdempotencyCache:
+    def __init__(self, max_entries: int, ttl: float, max_body_bytes: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_body_bytes = max_body_bytes
+        self._entries: OrderedDict[tuple, StoredResponse] = OrderedDict()
+        self._in_flight: dict[tuple, bytes] = {}  # key -> fingerprint
+        self.stored = 0
+        self.replayed = 0
+        self.in_flight_conflicts = 0
+        self.mismatches = 0
+        self.not_stored = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> StoredResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def pending(self, key: tuple) -> bytes | None:
+        # Fingerprint of the request running under this key, if any
+        return self._in_flight.get(key)
+
+    def begin(self, key: tuple, fingerprint: bytes):
+        self._in_flight[key] = fingerprint
+
+    def end(self, key: tuple):
+        del self._in_flight[key]
+
+    def put(self, key: tuple, entry: StoredResponse):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self.stored += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "in_flight": len(self._in_flight),
+            "stored": self.stored,
+            "replayed": self.replayed,
+            "in_flight_conflicts": self.in_flight_conflicts,
+            "mismatches": self.mismatches,
+            "not_stored": self.not_stored,
+            "evictions": self.evictions,
+        }
+
+
+idempotency_cache = IdempotencyCache(IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_BODY_BYTES)
+
+
+def _header(scope, name: bytes) -> bytes | None:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS:
+            await self.app(scope, receive, send)
+            return
+        idempotency_key = _header(scope, b"idempotency-key")
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            response = JSONResponse(status_code=400, content={"detail": "Invalid Idempotency-Key header."})
+            await response(scope, receive, send)
+            return
+
+        body = await _read_body(receive)
+        fingerprint = hashlib.sha256(
+            b"\0".join((scope["method"].encode(), scope["path"].encode(), scope["query_string"], body))
+        ).digest()
+        key = (_header(scope, b"authorization") or client_key(scope), idempotency_key)
+        cache = idempotency_cache
+
+        stored = cache.get(key)
+        pending = cache.pending(key)
+        seen = stored.fingerprint if stored else pending
+        if seen is not None and seen != fingerprint:
+            cache.mismatches += 1
+            response = JSONResponse(
+                status_code=422,
+                content={"detail": "Idempotency-Key was already used for a different request."},
+            )
+        elif stored:
+            cache.replayed += 1
+            response = Response(content=stored.body, status_code=stored.status)
+            response.raw_headers = [*stored.headers, (b"idempotent-replayed", b"true")]
+        elif pending:
+            cache.in_flight_conflicts += 1
+            response = JSONResponse(
+                status_code=409,
+                content={"detail": "A request with this Idempotency-Key is still in progress."},
+                headers={"Retry-After": "1"},
+            )
+        else:
+            response = None
+        if response is not None:
+            await response(scope, receive, send)
+            return
+
+        # Hand the body we consumed to the app, then pass through disconnects
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status, headers, chunks, size, complete = None, [], [], 0, False
+
+        async def capture_send(message):
+            nonlocal status, headers, size, complete
+            if message["type"] == "http.response.start":
+                status, headers = message["status"], list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size <= cache.max_body_bytes:
+                    chunks.append(chunk)
+                complete = not message.get("more_body", False)
+            await send(message)
+
+        cache.begin(key, fingerprint)
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        finally:
+            cache.end(key)
+        if not complete or status >= 500 or status in UNSTORED_STATUSES or size > cache.max_body_bytes:
+            cache.not_stored += 1
+            return
+        cache.put(key, StoredResponse(fingerprint, status, headers, b"".join(chunks), time.monotonic() + cache.ttl))
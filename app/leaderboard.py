@@ -0,0 +1,287 @@
+"""
+In-memory leaderboards built from player_stats.
+
+Every board (metric x global/role) is a `RankedList`: a sorted list split into
+buckets of a few hundred keys, with a Fenwick tree over the bucket sizes.
+Insert/remove cost O(log n + bucket size), a player's rank and the entry at a
+given rank O(log n), so top-N, "my rank" and neighbours never scan the table.
+
+The player stats are loaded once per process, boards are built lazily on first
+use and kept current by `apply_matches`. It runs on the worker that ended the
+match, right after the commit, and again (a no-op there) in the game_ended
+outbox handler (app/outbox.py) on whichever process claims the event.
+
+Every other process misses the change: with WEB_CONCURRENCY > 1 a worker's
+boards can lag games ended on other workers (and `manage rebuild-stats`) by
+up to LEADERBOARD_MAX_AGE, when the snapshot is reloaded in full. Lower it
+for fresher boards across workers at the cost of more frequent reloads.
+"""
+import asyncio
+import time
+from bisect import bisect_left, insort
+from enum import Enum
+from sqlalchemy import select
+from app.aggregates import ROLE_STAT_COLUMNS
+from app.config import LEADERBOARD_MAX_AGE, LEADERBOARD_MIN_GAMES
+from app.models import Plays, PlayerStats, Role
+from app.outbox import outbox, GAME_ENDED
+
+BUCKET_SIZE = 512
+
+
+class RankedList:
+    """Sorted list of unique keys with positional access (order-statistics)."""
+
+    def __init__(self, keys=(), bucket_size: int = BUCKET_SIZE):
+        ordered = sorted(keys)
+        self._bucket_size = bucket_size
+        self._buckets = [ordered[i:i + bucket_size] for i in range(0, len(ordered), bucket_size)]
+        self._len = len(ordered)
+        self._rebuild_index()
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _rebuild_index(self):
+        # Bucket maxima for bisecting keys, Fenwick tree of bucket sizes for positions
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        tree = [0] * (len(self._buckets) + 1)
+        for i, bucket in enumerate(self._buckets, 1):
+            tree[i] += len(bucket)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _resize(self, bucket_index: int, delta: int):
+        i = bucket_index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _before(self, bucket_index: int) -> int:
+        # Number of keys in buckets[:bucket_index]
+        total, i = 0, bucket_index
+        while i:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, position: int) -> tuple[int, int]:
+        # (bucket index, offset) of the key at `position`
+        bucket_index, step = 0, 1 << (len(self._tree).bit_length() - 1)
+        while step:
+            nxt = bucket_index + step
+            if nxt < len(self._tree) and self._tree[nxt] <= position:
+                bucket_index = nxt
+                position -= self._tree[nxt]
+            step >>= 1
+        return bucket_index, position
+
+    def add(self, key):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._len = 1
+            self._rebuild_index()
+            return
+        i = min(bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[i]
+        insort(bucket, key)
+        self._maxes[i] = bucket[-1]
+        self._len += 1
+        if len(bucket) > 2 * self._bucket_size:
+            self._buckets[i:i + 1] = [bucket[:self._bucket_size], bucket[self._bucket_size:]]
+            self._rebuild_index()
+        else:
+            self._resize(i, 1)
+
+    def remove(self, key):
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            raise KeyError(key)
+        bucket = self._buckets[i]
+        j = bisect_left(bucket, key)
+        if bucket[j] != key:
+            raise KeyError(key)
+        del bucket[j]
+        self._len -= 1
+        if not bucket:
+            del self._buckets[i]
+            self._rebuild_index()
+        else:
+            self._maxes[i] = bucket[-1]
+            self._resize(i, -1)
+
+    def index(self, key) -> int:
+        i = bisect_left(self._maxes, key)
+        if i < len(self._buckets):
+            bucket = self._buckets[i]
+            j = bisect_left(bucket, key)
+            if j < len(bucket) and bucket[j] == key:
+                return self._before(i) + j
+        raise KeyError(key)
+
+    def slice(self, start: int, stop: int) -> list:
+        start, stop = max(start, 0), min(stop, self._len)
+        if start >= stop:
+            return []
+        bucket_index, offset = self._locate(start)
+        keys = []
+        while len(keys) < stop - start:
+            keys.extend(self._buckets[bucket_index][offset:offset + stop - start - len(keys)])
+            bucket_index, offset = bucket_index + 1, 0
+        return keys
+
+
+class LeaderboardMetric(str, Enum):
+    WINS = "wins"
+    WIN_RATE = "win_rate"
+    GAMES_PLAYED = "games_played"
+
+
+# player_stats columns kept in memory, in this order
+STAT_COLUMNS = ["wins", "games_played"] + [
+    column for role in Role for column in ROLE_STAT_COLUMNS[role]
+]
+# Positions of (wins, games) in the stats tuple for the global board and each role
+_POSITIONS = {None: (0, 1)} | {
+    role: (STAT_COLUMNS.index(wins_column), STAT_COLUMNS.index(games_column))
+    for role, (games_column, wins_column) in ROLE_STAT_COLUMNS.items()
+}
+
+
+def _wins_and_games(stats: tuple, role: Role | None) -> tuple[int, int]:
+    wins_at, games_at = _POSITIONS[role]
+    return stats[wins_at], stats[games_at]
+
+
+def board_key(metric: LeaderboardMetric, role: Role | None, username: str, stats: tuple | None):
+    """Sort key of a player on a board (ascending = better rank), None if not ranked."""
+    if stats is None:
+        return None
+    wins, games = _wins_and_games(stats, role)
+    if not games:
+        return None
+    # Ties are broken by the other counters, then by username so keys are unique
+    if metric == LeaderboardMetric.WINS:
+        return (-wins, games, username)
+    if metric == LeaderboardMetric.GAMES_PLAYED:
+        return (-games, -wins, username)
+    if games < LEADERBOARD_MIN_GAMES:
+        return None
+    return (-wins / games, -games, username)
+
+
+class Leaderboard:
+    def __init__(self, max_age: float = LEADERBOARD_MAX_AGE):
+        self.max_age = max_age
+        self._stats: dict[str, tuple] = {}
+        self._boards: dict[tuple[LeaderboardMetric, Role | None], RankedList] = {}
+        self._loaded_at: float | None = None
+        self._lock = asyncio.Lock()
+        self.loads = 0
+        self.updates = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.max_age
+
+    async def _ensure_loaded(self, db):
+        if self.loaded:
+            return
+        async with self._lock:
+            if self.loaded:
+                return
+            rows = await db.execute(
+                select(PlayerStats.username, *(getattr(PlayerStats, column) for column in STAT_COLUMNS))
+            )
+            self.load((row[0], tuple(value or 0 for value in row[1:])) for row in rows)
+
+    def load(self, rows):
+        """Replace the snapshot with (username, stats tuple) pairs, dropping every built board."""
+        self._stats = dict(rows)
+        self._boards = {}
+        self._loaded_at = time.monotonic()
+        self.loads += 1
+
+    def _board(self, metric: LeaderboardMetric, role: Role | None) -> RankedList:
+        board = self._boards.get((metric, role))
+        if board is None:
+            keys = (board_key(metric, role, username, stats) for username, stats in self._stats.items())
+            board = self._boards[(metric, role)] = RankedList(key for key in keys if key is not None)
+        return board
+
+    def update(self, rows):
+        """Move the given (username, stats tuple) pairs to their new place on every built board."""
+        for username, stats in rows:
+            old = self._stats.get(username)
+            if old == stats:
+                continue
+            for (metric, role), board in self._boards.items():
+                old_key = board_key(metric, role, username, old)
+                new_key = board_key(metric, role, username, stats)
+                if old_key != new_key:
+                    if old_key is not None:
+                        board.remove(old_key)
+                    if new_key is not None:
+                        board.add(new_key)
+            self._stats[username] = stats
+            self.updates += 1
+
+    async def apply_matches(self, db, match_ids: list[str]):
+        # Re-read the stats of everyone in the matches, skipped while nothing is loaded
+        if not self.loaded or not match_ids:
+            return
+        rows = await db.execute(
+            select(PlayerStats.username, *(getattr(PlayerStats, column) for column in STAT_COLUMNS))
+            .where(PlayerStats.username.in_(select(Plays.username).where(Plays.match_id.in_(match_ids))))
+        )
+        self.update((row[0], tuple(value or 0 for value in row[1:])) for row in rows)
+
+    def _entry(self, rank: int, key, role: Role | None) -> dict:
+        username = key[-1]
+        wins, games = _wins_and_games(self._stats[username], role)
+        return {
+            "rank": rank,
+            "username": username,
+            "wins": wins,
+            "games_played": games,
+            "win_rate": round(wins / games, 4),
+        }
+
+    async def top(self, db, metric: LeaderboardMetric, role: Role | None, offset: int, limit: int) -> tuple[int, list[dict]]:
+        """Total ranked players and the entries at ranks offset+1 .. offset+limit."""
+        await self._ensure_loaded(db)
+        board = self._board(metric, role)
+        keys = board.slice(offset, offset + limit)
+        return len(board), [self._entry(offset + i + 1, key, role) for i, key in enumerate(keys)]
+
+    async def around(self, db, metric: LeaderboardMetric, role: Role | None, username: str, radius: int):
+        """(rank, total, entries within `radius` ranks of the player), or None if the player is not ranked."""
+        await self._ensure_loaded(db)
+        board = self._board(metric, role)
+        key = board_key(metric, role, username, self._stats.get(username))
+        if key is None:
+            return None
+        position = board.index(key)
+        start = max(position - radius, 0)
+        keys = board.slice(start, position + radius + 1)
+        return position + 1, len(board), [self._entry(start + i + 1, key, role) for i, key in enumerate(keys)]
+
+    def stats(self) -> dict:
+        return {
+            "players": len(self._stats),
+            "boards": {f"{metric.value}:{role.value if role else 'ALL'}": len(board) for (metric, role), board in self._boards.items()},
+            "loaded": self.loaded,
+            "loads": self.loads,
+            "updates": self.updates,
+        }
+
+
+leaderboard = Leaderboard()
+
+
+@outbox.handler(GAME_ENDED)
+async def move_players(db, events: list[dict]):
+    # Re-reads the players' stats, so a redelivered event changes nothing
+    await leaderboard.apply_matches(db, [event["match_id"] for event in events])
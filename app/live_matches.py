@@ -0,0 +1,375 @@
+"""
+In-memory registry of live (STARTED / IN_PROGRESS) matches.
+
+With LIVE_MATCHES enabled, AddPlayerToMatch and ChangePlayerRole validate
+team size, membership and role uniqueness against the registry under a
+per-match asyncio lock instead of reading game/plays:
+
+- CreateMatch and joins are written through, so the database always knows
+  who is in a match (and the player foreign key still rejects unknown names).
+- Role changes are write-behind: they update memory, and a background task
+  writes them out every LIVE_MATCH_FLUSH_INTERVAL seconds, one transaction
+  per match. EndGame commits a match's pending roles and closes it before
+  ending it, the closed match stays in the registry until the end commits
+  or rolls back, so requests meanwhile go to the database path instead of
+  loading the still STARTED match again.
+- When the database rejects a match's roles LIVE_MATCH_FLUSH_ATTEMPTS times
+  in a row (the rows were changed behind the registry's back), its pending
+  changes are logged and dropped, and the match is reloaded on next use.
+  Other errors (database unreachable) are retried until they succeed.
+
+A match not in the registry is loaded from the database on first use, and
+`start()` loads every live match up front, so a restart recovers everything
+except role changes made within the last flush interval. Loads of different
+matches run concurrently. A match found finished or unknown is remembered
+for LIVE_MATCH_NOT_LIVE_TTL seconds (matches created here are added at
+once), so requests for it go straight to the database path.
+
+The registry is per process: only enable it when a single process serves all
+requests for a match (one worker, or sticky routing by match_id).
+"""
+import asyncio
+import logging
+import time
+from fastapi import HTTPException
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import DataError, IntegrityError
+from app.config import (
+    LIVE_MATCHES, LIVE_MATCH_FLUSH_INTERVAL, LIVE_MATCH_IDLE_SECONDS, LIVE_MATCH_FLUSH_ATTEMPTS, LIVE_MATCH_NOT_LIVE_TTL,
+)
+from app.database import AsyncSessionLocal
+from app.models import Game, GameStatus, GameType, Player, Plays, Role, Team
+from app.utils import is_duplicate_key_error
+
+logger = logging.getLogger("app.live_matches")
+
+LIVE_STATUSES = (GameStatus.STARTED, GameStatus.IN_PROGRESS)
+MAX_PLAYERS_PER_MATCH = 6
+MAX_NOT_LIVE_ENTRIES = 10_000
+ROLE_COLUMNS = ("role1", "role2", "role3")
+
+
+# Roles of one plays row by primary key, bumping its version, run with one parameter set per row
+_plays = Plays.__table__
+WRITE_ROLES = (
+    update(_plays)
+    .where(_plays.c.match_id == bindparam("b_match_id"), _plays.c.username == bindparam("b_username"))
+    .values(version=_plays.c.version + 1, **{column: bindparam(f"b_{column}") for column in ROLE_COLUMNS})
+)
+
+
+def bump_game_versions(match_ids):
+    return (
+        update(Game)
+        .where(Game.match_id.in_(list(match_ids)))
+        .values(version=Game.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+class LivePlayer:
+    __slots__ = ("team", "roles")
+
+    def __init__(self, team: Team | None, roles=(None, None, None)):
+        self.team = team
+        self.roles = list(roles)
+
+
+class LiveMatch:
+    def __init__(self, match_id: str, game_type: GameType, game_pass: str | None):
+        self.match_id = match_id
+        self.game_type = game_type
+        self.game_pass = game_pass
+        self.players: dict[str, LivePlayer] = {}
+        self.dirty: set[str] = set()  # players whose roles are not written yet
+        self.rejected_flushes = 0  # writes of the dirty roles the database refused in a row
+        self.lock = asyncio.Lock()
+        self.closed = False
+        self.touched_at = time.monotonic()
+
+
+class LiveMatchRegistry:
+    def __init__(self, enabled: bool = LIVE_MATCHES):
+        self.enabled = enabled
+        self._matches: dict[str, LiveMatch] = {}
+        self._load_locks: dict[str, list] = {}  # match_id -> [lock, requests using it]
+        self._not_live: dict[str, float] = {}  # match_id -> when to look it up again
+        self._flush_lock = asyncio.Lock()  # EndGame must not overtake an in-flight flush
+        self._flusher: asyncio.Task | None = None
+        self.loads = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.flush_errors = 0
+        self.retired = 0
+        self.evictions = 0
+
+    # Loading and recovery
+
+    async def _load(self, db, match_ids) -> list[LiveMatch]:
+        games = (await db.execute(
+            select(Game.match_id, Game.game_type, Game.game_pass)
+            .where(Game.match_id.in_(match_ids), Game.status.in_(LIVE_STATUSES))
+        )).all()
+        matches = {game.match_id: LiveMatch(*game) for game in games}
+        if matches:
+            plays = await db.execute(
+                select(Plays.match_id, Plays.username, Plays.team, Plays.role1, Plays.role2, Plays.role3)
+                .where(Plays.match_id.in_(list(matches)))
+            )
+            for row in plays:
+                matches[row.match_id].players[row.username] = LivePlayer(row.team, (row.role1, row.role2, row.role3))
+        self.loads += len(matches)
+        return list(matches.values())
+
+    async def get(self, db, match_id: str) -> LiveMatch | None:
+        """The live match, loading it from the database if needed. None when disabled or not live."""
+        if not self.enabled:
+            return None
+        match = self._matches.get(match_id)
+        if match is None:
+            if self._not_live.get(match_id, 0.0) > time.monotonic():
+                return None
+            # One load per match at a time, other matches load concurrently
+            entry = self._load_locks.get(match_id)
+            if entry is None:
+                entry = self._load_locks[match_id] = [asyncio.Lock(), 0]
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    match = self._matches.get(match_id)
+                    if match is None:
+                        if self._not_live.get(match_id, 0.0) > time.monotonic():
+                            return None
+                        loaded = await self._load(db, [match_id])
+                        if not loaded:
+                            self._remember_not_live(match_id)
+                            return None
+                        # Closed while loading: keep the closed entry
+                        match = self._matches.setdefault(match_id, loaded[0])
+            finally:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._load_locks[match_id]
+        match.touched_at = time.monotonic()
+        return match
+
+    def _remember_not_live(self, match_id: str):
+        now = time.monotonic()
+        if len(self._not_live) >= MAX_NOT_LIVE_ENTRIES:
+            self._not_live = {key: until for key, until in self._not_live.items() if until > now}
+            if len(self._not_live) >= MAX_NOT_LIVE_ENTRIES:
+                self._not_live.clear()
+        self._not_live[match_id] = now + LIVE_MATCH_NOT_LIVE_TTL
+
+    def add(self, match_id: str, game_type: GameType, game_pass: str | None, players: dict[str, Team] | None = None):
+        # A match just created (and possibly filled) by us, nothing to read back
+        if self.enabled:
+            self._not_live.pop(match_id, None)
+            match = self._matches[match_id] = LiveMatch(match_id, game_type, game_pass)
+            for username, team in (players or {}).items():
+                match.players[username] = LivePlayer(team)
+
+    # Match operations, same checks and messages as the database path
+
+    async def join(self, db, match: LiveMatch, username: str, team: Team, game_pass: str | None):
+        async with match.lock:
+            if match.closed:
+                return False
+            if match.game_type == GameType.PRIVATE:
+                if not game_pass or match.game_pass != game_pass:
+                    raise HTTPException(status_code=403, detail="Invalid or missing game pass.")
+            # Unknown players are rejected by the plays foreign key below, so a
+            # full match reports the cap before a missing player
+            if username in match.players:
+                raise HTTPException(status_code=400, detail="Player already added to this match")
+            if len(match.players) >= MAX_PLAYERS_PER_MATCH:
+                raise HTTPException(status_code=400, detail="A maximum of 6 players are allowed in one game.")
+            try:
+                await db.execute(insert(Plays).values(username=username, match_id=match.match_id, team=team))
+                await db.execute(bump_game_versions([match.match_id]))
+                await db.commit()
+            except IntegrityError as exc:
+                await db.rollback()
+                if is_duplicate_key_error(exc):
+                    raise HTTPException(status_code=400, detail="Player already added to this match")
+                raise HTTPException(status_code=404, detail="Player not found")
+            match.players[username] = LivePlayer(team)
+            return True
+
+    async def change_role(self, db, match: LiveMatch, username: str, round: int, role: Role) -> dict | None:
+        """The player's roles after the change, or None if the match closed meanwhile."""
+        async with match.lock:
+            if match.closed:
+                return None
+            player = match.players.get(username)
+            if player is None:
+                exists = (await db.execute(select(Player.username).where(Player.username == username))).first()
+                if not exists:
+                    raise HTTPException(status_code=404, detail="Player not found")
+                raise HTTPException(status_code=404, detail="Player not part of this match")
+            index = round - 1
+            if any(other.team == player.team and other.roles[index] == role for other in match.players.values()):
+                raise HTTPException(status_code=400, detail=f"Role '{role}' is already assigned in team {player.team}.")
+            player.roles[index] = role
+            match.dirty.add(username)
+            return dict(zip(ROLE_COLUMNS, player.roles))
+
+    # Write-behind
+
+    def _take_dirty(self, matches) -> list[dict]:
+        rows = []
+        for match in matches:
+            for username in match.dirty:
+                player = match.players[username]
+                rows.append({"match_id": match.match_id, "username": username, **dict(zip(ROLE_COLUMNS, player.roles))})
+            match.dirty.clear()
+        return rows
+
+    async def _write(self, db, rows: list[dict]):
+        # Clear the roles first so swaps between teammates cannot trip the
+        # per-team unique indexes halfway through, then write the final roles.
+        # Both rows and games move to a new version, so a compare-and-swap
+        # that read them before (app/retries.py) conflicts instead of
+        # overwriting the roles written here
+        if not rows:
+            return
+        await db.execute(WRITE_ROLES, [
+            {"b_match_id": row["match_id"], "b_username": row["username"], **{f"b_{column}": None for column in ROLE_COLUMNS}}
+            for row in rows
+        ])
+        await db.execute(WRITE_ROLES, [
+            {"b_match_id": row["match_id"], "b_username": row["username"], **{f"b_{column}": row[column] for column in ROLE_COLUMNS}}
+            for row in rows
+        ])
+        await db.execute(bump_game_versions({row["match_id"] for row in rows}))
+        self.rows_flushed += len(rows)
+
+    async def flush(self):
+        """Write every pending role change, one transaction per match, re-queueing them on failure."""
+        async with self._flush_lock:
+            for match in [match for match in self._matches.values() if match.dirty]:
+                await self._flush_match(match)
+
+    async def _flush_match(self, match: LiveMatch):
+        rows = self._take_dirty([match])
+        try:
+            async with AsyncSessionLocal() as db:
+                await self._write(db, rows)
+                await db.commit()
+        except Exception as exc:
+            self.flush_errors += 1
+            match.dirty.update(row["username"] for row in rows)
+            if not isinstance(exc, (IntegrityError, DataError)):
+                logger.exception("Writing %d live role changes of match %s failed, will retry", len(rows), match.match_id)
+                return
+            match.rejected_flushes += 1
+            if match.rejected_flushes < LIVE_MATCH_FLUSH_ATTEMPTS:
+                logger.warning("Database rejected live role changes of match %s, will retry: %s", match.match_id, exc.orig)
+                return
+            await self._retire(match, rows)
+            return
+        match.rejected_flushes = 0
+        self.flushes += 1
+
+    async def _retire(self, match: LiveMatch, rows: list[dict]):
+        # Memory and database disagree, the database wins: drop the pending
+        # roles and let the next request reload the match
+        logger.error(
+            "Dropping %d live role changes of match %s after %d rejected writes: %s",
+            len(rows), match.match_id, match.rejected_flushes, rows,
+        )
+        async with match.lock:
+            match.closed = True
+            match.dirty.clear()
+        if self._matches.get(match.match_id) is match:
+            del self._matches[match.match_id]
+        self.retired += 1
+
+    async def close(self, match_ids: list[str]):
+        """Commit pending roles of matches about to end, they stay closed until `release()`."""
+        if not self.enabled:
+            return
+        async with self._flush_lock:
+            rows = []
+            live = []
+            for match_id in match_ids:
+                match = self._matches.get(match_id)
+                if match is None:
+                    # Not loaded, a closed entry still stops a load racing the end
+                    match = self._matches[match_id] = LiveMatch(match_id, None, None)
+                else:
+                    live.append(match)
+                async with match.lock:
+                    match.closed = True
+                    rows.extend(self._take_dirty([match]))
+            if not rows:
+                return
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self._write(db, rows)
+                    await db.commit()
+            except Exception:
+                # Reopen the loaded matches with their roles pending again so
+                # the flusher still writes them, `release()` drops the rest
+                self.flush_errors += 1
+                for match in live:
+                    match.dirty.update(row["username"] for row in rows if row["match_id"] == match.match_id)
+                    match.closed = False
+                raise
+
+    def release(self, match_ids: list[str]):
+        # The end committed or rolled back, the next request reads the match from the database
+        for match_id in match_ids:
+            match = self._matches.get(match_id)
+            if match is not None and match.closed:
+                del self._matches[match_id]
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - LIVE_MATCH_IDLE_SECONDS
+        for match_id, match in list(self._matches.items()):
+            if match.touched_at < cutoff and not match.dirty and not match.closed and not match.lock.locked():
+                del self._matches[match_id]
+                self.evictions += 1
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(LIVE_MATCH_FLUSH_INTERVAL)
+            await self.flush()
+            self._evict_idle()
+
+    async def start(self):
+        # Recover every live match from the database and start writing behind
+        if not self.enabled:
+            return
+        async with AsyncSessionLocal() as db:
+            match_ids = select(Game.match_id).where(Game.status.in_(LIVE_STATUSES))
+            for match in await self._load(db, match_ids):
+                self._matches[match.match_id] = match
+        self._flusher = asyncio.create_task(self._run_flusher())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "matches": len(self._matches),
+            "not_live": len(self._not_live),
+            "pending_role_changes": sum(len(match.dirty) for match in self._matches.values()),
+            "loads": self.loads,
+            "flushes": self.flushes,
+            "rows_flushed": self.rows_flushed,
+            "flush_errors": self.flush_errors,
+            "retired": self.retired,
+            "evictions": self.evictions,
+        }
+
+
+live_matches = LiveMatchRegistry()
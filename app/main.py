@@ -1,20 +1,91 @@
-from fastapi import FastAPI
-from app.routers import players, achievements, games, stats
-from app.models import Base
-from app.database import SessionLocal, engine  
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from app.routers import players, achievements, games, stats, metrics, matchmaking
+from app.database import dispose_engines
+from app.utils import PasswordPoolFull
+from app.profiling import ProfiledJSONResponse, profile_requests
+from app.live_matches import live_matches
+from app.matchmaking import matchmaking_queue
+from app.replicas import replicas
+from app.outbox import outbox
+# Outbox handlers register themselves on import: load every module that has some
+# here, so delivery does not depend on which routers happen to import them
+from app.leaderboard import leaderboard  # noqa: F401
+from app.achievement_rules import achievement_rules  # noqa: F401
+from app.startup import warm_up
+from app.admission import AdmissionMiddleware
+from app.idempotency import IdempotencyMiddleware
+from app.retries import WriteConflict
+from app.config import OUTBOX_CONSUMER
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the pool and catalogs and recover live matches before serving,
+    # write pending role changes on shutdown
+    await warm_up()
+    await live_matches.start()
+    matchmaking_queue.start()
+    if OUTBOX_CONSUMER:
+        outbox.start()
+    yield
+    await outbox.stop()
+    await matchmaking_queue.stop()
+    await live_matches.stop()
+    await replicas.dispose()
+    await dispose_engines()
 
 
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(default_response_class=ProfiledJSONResponse, lifespan=lifespan)
+
+# Record per-endpoint latency, SQL, bcrypt and serialization time
+app.middleware("http")(profile_requests)
+
+# Replay stored responses of retried writes carrying an Idempotency-Key
+app.add_middleware(IdempotencyMiddleware)
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Rate limits and the in-flight limit, outermost so shed requests cost next to nothing
+app.add_middleware(AdmissionMiddleware)
+
+# Tables are created by `python -m app.manage migrate` (or `bootstrap`), not at import
 
 # Include routers
-app.include_router(players.router, prefix="/players", tags=["Players"])
-app.include_router(stats.router, prefix="/stats", tags=["Stats"])
-app.include_router(achievements.router, prefix="/achievements", tags=["Achievements"])
-app.include_router(games.router, prefix="/games", tags=["Games"])
+app.include_router(players.router, tags=["Players"])
+app.include_router(stats.router, tags=["Stats"])
+app.include_router(achievements.router, tags=["Achievements"])
+app.include_router(games.router, tags=["Games"])
+app.include_router(matchmaking.router, tags=["Matchmaking"])
+app.include_router(metrics.router, tags=["Metrics"])
+
+# Shed login/registration bursts instead of queueing them forever
+@app.exception_handler(PasswordPoolFull)
+async def password_pool_full_handler(request: Request, exc: PasswordPoolFull):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, please retry shortly."},
+        headers={"Retry-After": "1"},
+    )
+
+# Pool exhausted for longer than DB_POOL_TIMEOUT
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database is busy, please retry shortly."},
+        headers={"Retry-After": "1"},
+    )
+
+# A match write kept conflicting with concurrent writes, see app/retries.py
+@app.exception_handler(WriteConflict)
+async def write_conflict_handler(request: Request, exc: WriteConflict):
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT,
+        content={"detail": "The match was changed by another request, please retry."},
+        headers={"Retry-After": "1"},
+    )
 
 @app.get("/")
 async def check():
@@ -0,0 +1,212 @@
+"""
+Management commands.
+
+    python -m app.manage migrate            # create missing tables, columns and indexes
+    python -m app.manage migrate --dry-run  # print the DDL instead of running it
+    python -m app.manage migrate --clear-duplicates  # unset values that block a new unique index
+    python -m app.manage bootstrap          # migrate, then add the catalog entries the app relies on
+    python -m app.manage rebuild-stats      # recompute player_stats from plays
+    python -m app.manage outbox-worker      # deliver outbox events outside the API (set OUTBOX_CONSUMER=false there)
+    python -m app.manage backfill-achievements [--chunk N] [--workers N]  # grant rule achievements to every player
+"""
+import argparse
+import asyncio
+from sqlalchemy import and_, func, inspect, not_, select, update
+from sqlalchemy.schema import CreateColumn, CreateIndex
+from app.database import get_engine
+from app.models import Base
+from app.aggregates import rebuild_player_stats
+from app.config import ACHIEVEMENT_BACKFILL_CHUNK, ACHIEVEMENT_BACKFILL_WORKERS
+
+
+MAX_REPORTED_DUPLICATES = 20
+
+
+class MigrationError(Exception):
+    pass
+
+
+def add_column_ddl(engine, table, column) -> str:
+    # New columns on existing tables need a server default (or to be nullable)
+    # so the rows already there get a value
+    table_name = engine.dialect.identifier_preparer.format_table(table)
+    return f"ALTER TABLE {table_name} ADD COLUMN {CreateColumn(column).compile(bind=engine)}"
+
+
+def duplicate_groups(conn, index) -> list:
+    # Values a new unique index would reject, rows with a NULL in it never collide
+    columns = list(index.columns)
+    return conn.execute(
+        select(*columns, func.count().label("rows"))
+        .where(*(column.is_not(None) for column in columns))
+        .group_by(*columns)
+        .having(func.count() > 1)
+    ).all()
+
+
+def clear_duplicate_rows(conn, index, groups) -> int:
+    # Keep the row with the lowest primary key of each group and unset the
+    # index's last column on the others (e.g. a role held twice in a team)
+    last = list(index.columns)[-1]
+    if not last.nullable:
+        raise MigrationError(f"{index.name}: duplicates can only be cleared when the index's last column is nullable")
+    table, primary_key = index.table, list(index.table.primary_key.columns)
+    values = {last.name: None}
+    if "version" in table.c:
+        values["version"] = table.c.version + 1
+    cleared = 0
+    for group in groups:
+        same = [column == value for column, value in zip(index.columns, group)]
+        keep = conn.execute(select(*primary_key).where(*same).order_by(*primary_key).limit(1)).first()
+        cleared += conn.execute(
+            update(table)
+            .where(*same, not_(and_(*(column == value for column, value in zip(primary_key, keep)))))
+            .values(values)
+        ).rowcount
+    return cleared
+
+
+def check_unique_index(engine, index, dry_run: bool, clear: bool):
+    with engine.begin() as conn:
+        groups = duplicate_groups(conn, index)
+        if not groups:
+            return
+        columns = ", ".join(column.name for column in index.columns)
+        lines = [
+            f"  ({', '.join(str(getattr(value, 'value', value)) for value in group[:-1])}): {group.rows} rows"
+            for group in groups[:MAX_REPORTED_DUPLICATES]
+        ]
+        if len(groups) > MAX_REPORTED_DUPLICATES:
+            lines.append(f"  ... {len(groups) - MAX_REPORTED_DUPLICATES} more")
+        report = "\n".join(lines)
+        if dry_run:
+            print(f"-- {index.name}: {len(groups)} duplicate ({columns}) groups to clear first")
+            print("\n".join(f"-- {line}" for line in lines))
+        elif clear:
+            cleared = clear_duplicate_rows(conn, index, groups)
+            print(f"Cleared {cleared} duplicate rows of {len(groups)} ({columns}) groups for {index.name}")
+        else:
+            raise MigrationError(
+                f"Cannot create unique index {index.name}, {len(groups)} ({columns}) groups have duplicates:\n"
+                f"{report}\nFix them, or rerun with --clear-duplicates to keep the first row of each group"
+            )
+
+
+def migrate(dry_run: bool = False, clear_duplicates: bool = False):
+    # create_all only handles missing tables, columns and indexes declared later
+    # on existing tables have to be added one by one
+    engine = get_engine()
+    if not dry_run:
+        Base.metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            ddl = add_column_ddl(engine, table, column)
+            if dry_run:
+                print(f"{ddl};")
+            else:
+                print(f"Adding column {column.name} to {table.name}")
+                with engine.begin() as conn:
+                    conn.exec_driver_sql(ddl)
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name in existing_indexes:
+                continue
+            if index.unique:
+                check_unique_index(engine, index, dry_run, clear_duplicates)
+            if dry_run:
+                print(f"{CreateIndex(index).compile(bind=engine)};")
+            else:
+                print(f"Creating index {index.name} on {table.name}")
+                index.create(bind=engine)
+
+
+def rebuild_stats():
+    with get_engine().begin() as conn:
+        rebuild_player_stats(conn)
+    print("player_stats rebuilt")
+
+
+async def add_rule_achievements():
+    # Only here, in one process: workers adding them at once would create duplicates
+    from app.achievement_rules import achievement_rules
+    from app.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        await achievement_rules.achieve_ids(db, add_missing=True)
+        await db.commit()
+
+
+def bootstrap():
+    # Everything a fresh database needs before the API serves from it
+    migrate()
+    asyncio.run(add_rule_achievements())
+    print("Database ready")
+
+
+def outbox_worker():
+    # The handlers register themselves on import
+    import app.main  # noqa: F401
+    from app.outbox import outbox
+    print("Delivering outbox events, Ctrl+C to stop")
+    try:
+        asyncio.run(outbox.run_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+def backfill_achievements(chunk: int, workers: int):
+    from app.achievement_rules import achievement_rules
+    result = asyncio.run(achievement_rules.backfill(chunk, workers))
+    print(f"Evaluated {result['players']} players in {result['chunks']} chunks, "
+          f"granted {result['granted']} achievements in {result['seconds']}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="create missing tables, columns and indexes")
+    migrate_parser.add_argument("--dry-run", action="store_true", help="print DDL instead of executing it")
+    migrate_parser.add_argument(
+        "--clear-duplicates", action="store_true",
+        help="unset the last column of duplicate rows that block a new unique index, keeping the first row",
+    )
+
+    commands.add_parser("bootstrap", help="migrate and add the catalog entries the app relies on")
+    commands.add_parser("rebuild-stats", help="recompute player_stats from plays")
+    commands.add_parser("outbox-worker", help="deliver outbox events in this process")
+
+    backfill_parser = commands.add_parser("backfill-achievements", help="grant rule achievements to every player")
+    backfill_parser.add_argument("--chunk", type=int, default=ACHIEVEMENT_BACKFILL_CHUNK, help="players per transaction")
+    backfill_parser.add_argument("--workers", type=int, default=ACHIEVEMENT_BACKFILL_WORKERS, help="chunks evaluated concurrently")
+
+    args = parser.parse_args()
+    try:
+        run_command(args)
+    except MigrationError as exc:
+        parser.exit(1, f"{exc}\n")
+
+
+def run_command(args):
+    if args.command == "migrate":
+        migrate(dry_run=args.dry_run, clear_duplicates=args.clear_duplicates)
+    elif args.command == "bootstrap":
+        bootstrap()
+    elif args.command == "rebuild-stats":
+        rebuild_stats()
+    elif args.command == "outbox-worker":
+        outbox_worker()
+    elif args.command == "backfill-achievements":
+        backfill_achievements(args.chunk, args.workers)
+
+
+if __name__ == "__main__":
+    main()
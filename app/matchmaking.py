@@ -0,0 +1,247 @@
+"""
+Matchmaking queue for public matches.
+
+Players enqueue through /matchmaking/Enqueue. A background scheduler wakes
+up whenever six or more players are waiting (at most once every
+MATCHMAKING_INTERVAL seconds, so bursts are batched), takes the oldest MATCHMAKING_BATCH_MATCHES * 6
+tickets, drops unknown players, orders the rest by wins so each match gets
+players of similar strength,
+and splits every group of six into teams with a snake draft (1-2-2-1). All
+games and plays rows of a batch are inserted in one transaction.
+
+Enqueue can long-poll (`wait`) for its assignment, and assignments stay
+readable through /matchmaking/Status for MATCHMAKING_RESULT_TTL seconds.
+While a player's batch is being created, Enqueue returns the same ticket
+and Dequeue is refused, the player gets the outcome of that batch.
+The queue lives in the process, with several workers each one matches the
+players that reached it.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from sqlalchemy import insert, select
+from app.cache import MemoryCache, MISSING
+from app.config import (
+    MATCHMAKING_INTERVAL, MATCHMAKING_BATCH_MATCHES, MATCHMAKING_MAX_QUEUE, MATCHMAKING_RESULT_TTL,
+)
+from app.database import AsyncSessionLocal
+from app.live_matches import live_matches, MAX_PLAYERS_PER_MATCH
+from app.metrics import Histogram
+from app.models import Game, GameStatus, GameType, Player, Plays, PlayerStats, Team
+
+logger = logging.getLogger("app.matchmaking")
+
+WAIT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Team of each seat once a group of six is ordered strongest first
+SNAKE_DRAFT = (Team.TEAM1, Team.TEAM2, Team.TEAM2, Team.TEAM1, Team.TEAM1, Team.TEAM2)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class MatchmakingFailed(Exception):
+    pass
+
+
+class PlayerNotFound(Exception):
+    pass
+
+
+class BeingPlaced(Exception):
+    """The player's ticket is in the batch being created and can no longer be withdrawn."""
+
+
+class Ticket:
+    __slots__ = ("username", "enqueued_at", "future")
+
+    def __init__(self, username: str):
+        self.username = username
+        self.enqueued_at = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class MatchmakingQueue:
+    def __init__(self, max_queue: int = MATCHMAKING_MAX_QUEUE):
+        self.max_queue = max_queue
+        self._tickets: dict[str, Ticket] = {}  # insertion order is queue order
+        self._placing: dict[str, Ticket] = {}  # taken off the queue by the batch being created
+        self._results = MemoryCache("matchmaking", MATCHMAKING_RESULT_TTL, max_queue, 64 * 1024 * 1024)
+        self._wakeup = asyncio.Event()
+        self._scheduler: asyncio.Task | None = None
+        self._recent = deque()  # (time, matches) of recent batches for the matches/s rate
+        self.wait_seconds = Histogram(WAIT_BUCKETS)
+        self.matches_created = 0
+        self.players_matched = 0
+        self.failed_batches = 0
+
+    def __len__(self) -> int:
+        return len(self._tickets)
+
+    def enqueue(self, username: str) -> Ticket:
+        """Queue a player, returning the existing ticket when already queued or being placed."""
+        ticket = self._tickets.get(username) or self._placing.get(username)
+        if ticket is not None:
+            return ticket
+        if len(self._tickets) >= self.max_queue:
+            raise QueueFull()
+        ticket = self._tickets[username] = Ticket(username)
+        self._results.delete(username)
+        if len(self._tickets) >= MAX_PLAYERS_PER_MATCH:
+            self._wakeup.set()
+        return ticket
+
+    def dequeue(self, username: str) -> bool:
+        if username in self._placing:
+            raise BeingPlaced()
+        ticket = self._tickets.pop(username, None)
+        if ticket is None:
+            return False
+        ticket.future.cancel()
+        return True
+
+    def status(self, username: str) -> dict | None:
+        ticket = self._tickets.get(username) or self._placing.get(username)
+        if ticket is not None:
+            return {"username": username, "status": "QUEUED", "waiting_seconds": round(time.monotonic() - ticket.enqueued_at, 3)}
+        result = self._results.get(username)
+        return None if result is MISSING else result
+
+    # Scheduler
+
+    async def form_matches(self) -> int:
+        """Turn queued players into matches, one transaction per batch. Returns matches created."""
+        created = 0
+        while len(self._tickets) >= MAX_PLAYERS_PER_MATCH:
+            size = min(len(self._tickets) // MAX_PLAYERS_PER_MATCH, MATCHMAKING_BATCH_MATCHES) * MAX_PLAYERS_PER_MATCH
+            usernames = list(self._tickets)[:size]
+            tickets = [self._tickets.pop(username) for username in usernames]
+            self._placing = {ticket.username: ticket for ticket in tickets}
+            try:
+                known, assignments = await self._create_matches(tickets)
+            except Exception:
+                self._placing = {}
+                # Players are dropped from the queue rather than retried forever, they can enqueue again
+                self.failed_batches += 1
+                logger.exception("Creating %d matches failed", size // MAX_PLAYERS_PER_MATCH)
+                for ticket in tickets:
+                    self._finish(ticket, exception=MatchmakingFailed("Matchmaking failed, please enqueue again."))
+                continue
+
+            now = time.monotonic()
+            leftovers = {}
+            for ticket in tickets:
+                if ticket.username not in known:
+                    self._results.set(ticket.username, {"username": ticket.username, "status": "REJECTED", "detail": "Player not found"})
+                    self._finish(ticket, exception=PlayerNotFound("Player not found"))
+                elif ticket.username not in assignments:
+                    leftovers[ticket.username] = ticket
+                else:
+                    self._results.set(ticket.username, assignments[ticket.username])
+                    self.wait_seconds.observe(now - ticket.enqueued_at)
+                    self._finish(ticket, result=assignments[ticket.username])
+            # Players left over after dropping unknown names go back to the front of the queue
+            self._tickets = leftovers | self._tickets
+            self._placing = {}
+            matches = len(assignments) // MAX_PLAYERS_PER_MATCH
+            if matches:
+                self._recent.append((now, matches))
+            self.matches_created += matches
+            self.players_matched += len(assignments)
+            created += matches
+            if not matches:
+                break
+        return created
+
+    def _finish(self, ticket: Ticket, result=None, exception: Exception | None = None):
+        if ticket.future.done():
+            return
+        if exception is None:
+            ticket.future.set_result(result)
+        else:
+            ticket.future.set_exception(exception)
+            ticket.future.exception()  # nobody may be waiting on it
+
+    async def _create_matches(self, tickets: list[Ticket]) -> tuple[set[str], dict[str, dict]]:
+        """Usernames that exist, and the assignment of every player placed in a new match."""
+        async with AsyncSessionLocal() as db:
+            # Players are validated here for the whole batch instead of one query per Enqueue
+            rows = (await db.execute(
+                select(Player.username, PlayerStats.wins)
+                .outerjoin(PlayerStats, PlayerStats.username == Player.username)
+                .where(Player.username.in_([ticket.username for ticket in tickets]))
+            )).all()
+            wins = {username: player_wins or 0 for username, player_wins in rows}
+            usernames = [ticket.username for ticket in tickets if ticket.username in wins]
+            usernames = usernames[:len(usernames) - len(usernames) % MAX_PLAYERS_PER_MATCH]
+            # Similar players end up in the same match, ties keep queue order
+            ordered = sorted(usernames, key=lambda username: -wins[username])
+
+            matches, assignments = {}, {}
+            for start in range(0, len(ordered), MAX_PLAYERS_PER_MATCH):
+                match_id = f"mm-{uuid.uuid4().hex}"
+                teams = matches[match_id] = dict(zip(ordered[start:start + MAX_PLAYERS_PER_MATCH], SNAKE_DRAFT))
+                for username, team in teams.items():
+                    assignments[username] = {
+                        "username": username,
+                        "status": "MATCHED",
+                        "match_id": match_id,
+                        "team": team,
+                        "players": teams,
+                    }
+            if matches:
+                await db.execute(insert(Game), [
+                    {"match_id": match_id, "status": GameStatus.STARTED, "game_type": GameType.PUBLIC}
+                    for match_id in matches
+                ])
+                await db.execute(insert(Plays), [
+                    {"username": username, "match_id": match_id, "team": team}
+                    for match_id, teams in matches.items()
+                    for username, team in teams.items()
+                ])
+                await db.commit()
+
+        for match_id, teams in matches.items():
+            live_matches.add(match_id, GameType.PUBLIC, None, teams)
+        return set(wins), assignments
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.form_matches()
+            # Never spin faster than the interval under a constant stream of players
+            await asyncio.sleep(MATCHMAKING_INTERVAL)
+
+    def start(self):
+        if self._scheduler is None:
+            self._scheduler = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            try:
+                await self._scheduler
+            except asyncio.CancelledError:
+                pass
+            self._scheduler = None
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        while self._recent and self._recent[0][0] < now - 60:
+            self._recent.popleft()
+        oldest = next(iter(self._tickets.values()), None)
+        return {
+            "queued": len(self._tickets),
+            "oldest_wait_seconds": round(now - oldest.enqueued_at, 3) if oldest else 0.0,
+            "matches_created": self.matches_created,
+            "players_matched": self.players_matched,
+            "failed_batches": self.failed_batches,
+            "matches_per_second_1m": round(sum(matches for _, matches in self._recent) / 60, 3),
+            "wait_seconds": self.wait_seconds.snapshot(),
+        }
+
+
+matchmaking_queue = MatchmakingQueue()
@@ -0,0 +1,162 @@
+import time
+from contextlib import asynccontextmanager
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+
+class PoolMetrics:
+    """
+    Connection pool telemetry collected from SQLAlchemy pool events.
+    Checkout waits are measured by the session dependency through `measure_wait`.
+    """
+
+    def __init__(self):
+        self._engine = None
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.peak_checked_out = 0
+        self.peak_overflow = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def attach(self, engine):
+        # Works for both Engine and AsyncEngine
+        sync_engine = getattr(engine, "sync_engine", engine)
+        self._engine = sync_engine
+        event.listen(sync_engine, "connect", self._on_connect)
+        event.listen(sync_engine, "close", self._on_close)
+        event.listen(sync_engine, "invalidate", self._on_invalidate)
+        event.listen(sync_engine, "checkout", self._on_checkout)
+        event.listen(sync_engine, "checkin", self._on_checkin)
+
+    @property
+    def pool(self):
+        # Looked up every time, dispose() (e.g. after a fork) gives the engine a new pool
+        return self._engine.pool if self._engine is not None else None
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def _on_close(self, dbapi_connection, connection_record):
+        self.closes += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidations += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+        self.peak_checked_out = max(self.peak_checked_out, self._checked_out())
+        self.peak_overflow = max(self.peak_overflow, self._overflow())
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        self.checkins += 1
+
+    def _checked_out(self) -> int:
+        return self.pool.checkedout() if hasattr(self.pool, "checkedout") else 0
+
+    def _overflow(self) -> int:
+        return max(0, self.pool.overflow()) if hasattr(self.pool, "overflow") else 0
+
+    def record_wait(self, seconds: float):
+        self.wait_count += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    @asynccontextmanager
+    async def measure_wait(self):
+        start = time.perf_counter()
+        try:
+            yield
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.record_wait(time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        pool = self.pool
+        return {
+            "pool_class": type(pool).__name__ if pool is not None else None,
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": self._checked_out(),
+            "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else None,
+            "overflow": self._overflow(),
+            "peak_checked_out": self.peak_checked_out,
+            "peak_overflow": self.peak_overflow,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(self.wait_total / self.wait_count * 1000, 3) if self.wait_count else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+            # Connection churn: new physical connections vs ones closed or invalidated
+            "connects": self.connects,
+            "closes": self.closes,
+            "invalidations": self.invalidations,
+        }
+
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative counts per upper bound, like Prometheus)."""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def snapshot(self) -> dict:
+        cumulative, running = {}, 0
+        for bound, count in zip((*self.buckets, float("inf")), self.counts):
+            running += count
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = running
+        return {"count": self.count, "sum": round(self.sum, 6), "buckets": cumulative}
+
+
+# Bucket bounds: seconds for timings, plain counts for statements
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestMetrics:
+    """Per-endpoint histograms of where request time goes."""
+
+    FIELDS = {
+        "latency_seconds": TIME_BUCKETS,
+        "sql_statements": COUNT_BUCKETS,
+        "db_seconds": TIME_BUCKETS,
+        "bcrypt_seconds": TIME_BUCKETS,
+        "serialization_seconds": TIME_BUCKETS,
+    }
+
+    def __init__(self):
+        self.endpoints: dict[str, dict[str, Histogram]] = {}
+
+    def observe(self, endpoint: str, **values: float):
+        histograms = self.endpoints.get(endpoint)
+        if histograms is None:
+            histograms = self.endpoints[endpoint] = {name: Histogram(buckets) for name, buckets in self.FIELDS.items()}
+        for name, value in values.items():
+            histograms[name].observe(value)
+
+    def snapshot(self) -> dict:
+        return {
+            endpoint: {name: histogram.snapshot() for name, histogram in histograms.items()}
+            for endpoint, histograms in sorted(self.endpoints.items())
+        }
+
+
+request_metrics = RequestMetrics()
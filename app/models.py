@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, Integer, Date, Enum, ForeignKey, CHAR
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, Integer, BigInteger, Date, DateTime, Enum, ForeignKey, CHAR, Index, JSON
 from sqlalchemy.orm import relationship
 from app.database import Base
 from enum import Enum as PyEnum
@@ -64,6 +65,9 @@ class Game(Base):
     status = Column(Enum(GameStatus), nullable=False)
     game_pass = Column(CHAR(32), nullable=True)  # Storing MD5 hash
     game_type = Column(Enum(GameType), nullable=False)
+    # Bumped by every write to the match (joins, role changes, ending it), so
+    # writes validated against an older read can detect it, see app/retries.py
+    version = Column(Integer, nullable=False, default=0, server_default='0')
 
 class Achieves(Base):
     __tablename__ = 'achieves'
@@ -83,9 +87,55 @@ class Plays(Base):
     role2 = Column(Enum(Role), nullable=True)
     role3 = Column(Enum(Role), nullable=True)
     win_or_lose = Column(Enum(GameResult), nullable=True)
+    version = Column(Integer, nullable=False, default=0, server_default='0')  # bumped by every write to the row
 
     # Relationships
     player = relationship('Player', backref='games')
     game = relationship('Game', backref='players')
 
+    # The primary key covers lookups by username. These indexes lead with match_id
+    # so per-match counts and scans are index range reads, and make each role
+    # unique per team and round (NULL roles do not collide).
+    __table_args__ = (
+        Index('uq_plays_match_team_role1', 'match_id', 'team', 'role1', unique=True),
+        Index('uq_plays_match_team_role2', 'match_id', 'team', 'role2', unique=True),
+        Index('uq_plays_match_team_role3', 'match_id', 'team', 'role3', unique=True),
+    )
 
+
+
+class PlayerStats(Base):
+    # Per-player aggregate of finished matches, kept up to date by EndGame
+    __tablename__ = 'player_stats'
+    username = Column(String(20), ForeignKey('player.username'), primary_key=True)
+    wins = Column(Integer, nullable=False, default=0, server_default='0')
+    losses = Column(Integer, nullable=False, default=0, server_default='0')
+    games_played = Column(Integer, nullable=False, default=0, server_default='0')
+    # Matches in which the player took the role in at least one round, and how many of those were won
+    manager_games = Column(Integer, nullable=False, default=0, server_default='0')
+    manager_wins = Column(Integer, nullable=False, default=0, server_default='0')
+    miner_games = Column(Integer, nullable=False, default=0, server_default='0')
+    miner_wins = Column(Integer, nullable=False, default=0, server_default='0')
+    warrior_games = Column(Integer, nullable=False, default=0, server_default='0')
+    warrior_wins = Column(Integer, nullable=False, default=0, server_default='0')
+
+    # Relationships
+    player = relationship('Player', backref='stats')
+
+
+def utcnow() -> datetime:
+    # Naive UTC, comparable across backends that drop the timezone
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class OutboxEvent(Base):
+    # Events written in the same transaction as the change they describe,
+    # delivered to handlers by app/outbox.py and deleted once handled
+    __tablename__ = 'outbox'
+    event_id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    event_type = Column(String(50), nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=utcnow)
+    available_at = Column(DateTime, nullable=False, default=utcnow)  # pushed back after a failed delivery
+    attempts = Column(Integer, nullable=False, default=0, server_default='0')
+    last_error = Column(String(255))
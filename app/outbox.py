@@ -0,0 +1,198 @@
+"""
+Transactional outbox for follow-on work.
+
+Write endpoints call `record_events` in the transaction that makes the
+change, so an event exists exactly when the change was committed. The
+consumer drains the outbox table in the background in batches of
+OUTBOX_BATCH_SIZE. Each batch's handlers and the deletion of its events
+share one transaction.
+
+Delivery is at least once: a crash or a second consumer can hand the same
+event to a handler again, so handlers must be idempotent. Handlers receive
+the payloads of one event type as a list, run inside the consumer's
+transaction, and must not commit. When a batch fails, its events are
+retried one at a time so a single bad event cannot hold up the rest. A
+failing event is retried with exponential backoff and is kept, but skipped,
+after OUTBOX_MAX_ATTEMPTS.
+
+The consumer runs inside the API process (OUTBOX_CONSUMER), or standalone
+with `python -m app.manage outbox-worker`. Handlers that update in-memory
+state, like the leaderboards, only have an effect in an API process.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import timedelta
+from sqlalchemy import delete, func, insert, select, update
+from app.config import OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_SECONDS
+from app.database import AsyncSessionLocal
+from app.metrics import Histogram, TIME_BUCKETS
+from app.models import OutboxEvent, utcnow
+
+logger = logging.getLogger("app.outbox")
+
+# Event types
+GAME_ENDED = "game_ended"  # {"match_id", "team", "win_or_lose"}
+ACHIEVEMENT_GRANTED = "achievement_granted"  # {"username", "achieve_id"}
+PLAYER_REGISTERED = "player_registered"  # {"username"}
+
+MAX_RETRY_SECONDS = 300.0
+
+
+async def record_events(db, event_type: str, payloads: list[dict]):
+    # Part of the caller's transaction, the caller commits
+    if payloads:
+        await db.execute(insert(OutboxEvent), [{"event_type": event_type, "payload": payload} for payload in payloads])
+
+
+class OutboxConsumer:
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._handlers: dict[str, list] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._recent = deque()  # (time, events) of recent batches for the events/s rate
+        self.batch_seconds = Histogram(TIME_BUCKETS)
+        self.delivered = 0
+        self.batches = 0
+        self.failures = 0
+        self.pending = 0
+        self.oldest_pending_seconds = 0.0
+
+    def handler(self, event_type: str):
+        """Register `async def handler(db, payloads: list[dict])` for an event type."""
+        def register(func):
+            self._handlers.setdefault(event_type, []).append(func)
+            return func
+        return register
+
+    def notify(self):
+        # New events were committed, do not wait for the next poll
+        self._wakeup.set()
+
+    async def _claim(self, db, limit: int, event_id: int | None = None):
+        # Locked until the transaction ends, concurrent consumers skip them
+        query = (
+            select(OutboxEvent.event_id, OutboxEvent.event_type, OutboxEvent.payload, OutboxEvent.attempts)
+            .where(OutboxEvent.available_at <= utcnow(), OutboxEvent.attempts < OUTBOX_MAX_ATTEMPTS)
+        )
+        if event_id is not None:
+            query = query.where(OutboxEvent.event_id == event_id)
+        return (await db.execute(
+            query.order_by(OutboxEvent.event_id).limit(limit).with_for_update(skip_locked=True)
+        )).all()
+
+    async def _handle(self, db, events):
+        by_type = {}
+        for event in events:
+            by_type.setdefault(event.event_type, []).append(event.payload)
+        for event_type, payloads in by_type.items():
+            for handle in self._handlers.get(event_type, ()):
+                await handle(db, payloads)
+        await db.execute(delete(OutboxEvent).where(OutboxEvent.event_id.in_([event.event_id for event in events])))
+
+    async def drain_once(self) -> int:
+        """Deliver one batch of due events. Returns how many were taken."""
+        start = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            events = await self._claim(db, self.batch_size)
+            if not events:
+                return 0
+            try:
+                await self._handle(db, events)
+                await db.commit()
+                self.delivered += len(events)
+            except Exception:
+                await db.rollback()
+                failed = True
+            else:
+                failed = False
+        if failed:
+            # Retry one at a time so a bad event cannot hold up the rest
+            for event in events:
+                await self._deliver_one(event.event_id)
+        self.batch_seconds.observe(time.perf_counter() - start)
+        self.batches += 1
+        self._recent.append((time.monotonic(), len(events)))
+        return len(events)
+
+    async def _deliver_one(self, event_id: int):
+        async with AsyncSessionLocal() as db:
+            events = await self._claim(db, 1, event_id)
+            if not events:
+                return
+            try:
+                await self._handle(db, events)
+                await db.commit()
+                self.delivered += 1
+            except Exception as exc:
+                await db.rollback()
+                await self._failed(db, events[0], exc)
+
+    async def _failed(self, db, event, exc: Exception):
+        self.failures += 1
+        attempts = event.attempts + 1
+        delay = min(OUTBOX_RETRY_SECONDS * 2 ** (attempts - 1), MAX_RETRY_SECONDS)
+        logger.error("Outbox event %s (%s) failed, attempt %d", event.event_id, event.event_type, attempts, exc_info=exc)
+        await db.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.event_id == event.event_id)
+            .values(attempts=attempts, available_at=utcnow() + timedelta(seconds=delay), last_error=repr(exc)[:255])
+        )
+        await db.commit()
+
+    async def refresh_lag(self):
+        async with AsyncSessionLocal() as db:
+            count, oldest = (await db.execute(
+                select(func.count(), func.min(OutboxEvent.created_at)).where(OutboxEvent.attempts < OUTBOX_MAX_ATTEMPTS)
+            )).one()
+        self.pending = count
+        self.oldest_pending_seconds = round((utcnow() - oldest).total_seconds(), 3) if oldest else 0.0
+
+    async def run_forever(self):
+        while True:
+            try:
+                taken = await self.drain_once()
+                await self.refresh_lag()
+            except Exception:
+                logger.exception("Outbox consumer pass failed")
+                taken = 0
+            if taken < self.batch_size:
+                # Caught up, sleep until notified or the next poll
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        while self._recent and self._recent[0][0] < now - 60:
+            self._recent.popleft()
+        return {
+            "running": self._task is not None,
+            "pending": self.pending,
+            "oldest_pending_seconds": self.oldest_pending_seconds,
+            "delivered": self.delivered,
+            "batches": self.batches,
+            "failures": self.failures,
+            "events_per_second_1m": round(sum(events for _, events in self._recent) / 60, 3),
+            "batch_seconds": self.batch_seconds.snapshot(),
+        }
+
+
+outbox = OutboxConsumer()
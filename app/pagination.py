@@ -0,0 +1,46 @@
+"""
+Helpers shared by list endpoints: keyset (cursor) pagination and NDJSON streaming.
+
+Pages are ordered by a unique key and continue after the last key of the
+previous page, which the response carries in the `X-Next-Cursor` header
+(absent on the last page). Streaming mode reads rows through a server-side
+cursor in its own session, since the request's session is closed before a
+streaming body is sent.
+"""
+from fastapi import Query, Response
+from fastapi.responses import StreamingResponse
+from app.config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, STREAM_BATCH_SIZE
+from app.database import AsyncSessionLocal, get_async_engine
+from app.responses import dumps, row_dicts
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def page_size(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)) -> int:
+    return limit
+
+
+def set_next_cursor(response: Response, rows: list[dict], limit: int, key: str):
+    # A full page means there may be more rows after the last key
+    if len(rows) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(rows[-1][key])
+
+
+async def stream_partitions(statement, bind=None):
+    """(keys, rows) for every STREAM_BATCH_SIZE rows of a Core select, read through a server-side cursor."""
+    async with AsyncSessionLocal(bind=bind or get_async_engine()) as db:
+        result = await db.stream(statement.execution_options(yield_per=STREAM_BATCH_SIZE))
+        keys = result.keys()
+        async for partition in result.partitions():
+            yield keys, partition
+
+
+def stream_ndjson(statement, bind=None) -> StreamingResponse:
+    """Stream the rows of a Core select as one JSON object per line, from `bind` (a replica) if given."""
+
+    async def rows():
+        async for keys, partition in stream_partitions(statement, bind):
+            yield b"".join(dumps(row) + b"\n" for row in row_dicts(keys, partition))
+
+    return StreamingResponse(rows(), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,163 @@
+"""
+Per-request profiling: a middleware opens a RequestProfile in a context
+variable, and the SQLAlchemy cursor events, the password pool and the JSON
+response class add to it. When the request finishes the totals go into the
+per-endpoint histograms in app.metrics, slow requests are logged with their
+SQL, and sampled requests to PROFILE_ROUTES are dumped as cProfile files.
+"""
+import cProfile
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from app.config import SLOW_REQUEST_MS, SLOW_REQUEST_MAX_STATEMENTS, PROFILE_ROUTES, PROFILE_SAMPLE_RATE, PROFILE_DIR
+from app.metrics import request_metrics
+from app import shared
+
+logger = logging.getLogger("app.slow_requests")
+
+
+class RequestProfile:
+    def __init__(self):
+        self.sql_count = 0
+        self.db_seconds = 0.0
+        self.bcrypt_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.statements: list[tuple[float, str]] = []
+
+    def add_statement(self, statement: str, seconds: float):
+        self.sql_count += 1
+        self.db_seconds += seconds
+        if len(self.statements) < SLOW_REQUEST_MAX_STATEMENTS:
+            self.statements.append((seconds, statement))
+
+
+current_profile: ContextVar[RequestProfile | None] = ContextVar("current_profile", default=None)
+
+
+def record_bcrypt(seconds: float):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.bcrypt_seconds += seconds
+
+
+# SQLAlchemy cursor events: time every statement executed on the engine
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _finish_statement(conn, statement: str):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    start = starts.pop()
+    profile = current_profile.get()
+    if profile is not None:
+        profile.add_statement(statement, time.perf_counter() - start)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _finish_statement(conn, statement)
+
+
+def _handle_error(exception_context):
+    # Failed statements (e.g. duplicate keys) never reach after_cursor_execute
+    if exception_context.connection is not None and exception_context.statement is not None:
+        _finish_statement(exception_context.connection, exception_context.statement)
+
+
+def instrument_engine(engine):
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def route_template(request: Request) -> str:
+    # The path template of the matched route, so metrics group by endpoint, not by value.
+    # Unmatched paths share one label, otherwise every probed URL would get its own histograms
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+class ProfiledJSONResponse(JSONResponse):
+    """JSONResponse that reports how long rendering the body took."""
+
+    def encode(self, content) -> bytes:
+        return super().render(content)
+
+    def render(self, content) -> bytes:
+        start = time.perf_counter()
+        body = self.encode(content)
+        profile = current_profile.get()
+        if profile is not None:
+            profile.serialization_seconds += time.perf_counter() - start
+        return body
+
+
+_profiler_busy = False
+
+
+def _should_profile(path: str) -> bool:
+    # cProfile is process wide, so only one sampled request is profiled at a time
+    return not _profiler_busy and path in PROFILE_ROUTES and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _dump_profile(profiler: cProfile.Profile, endpoint: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = endpoint.strip("/").replace("/", "_").replace(" ", "_") or "root"
+    path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+    profiler.dump_stats(path)
+    logger.info("Wrote profile for %s to %s", endpoint, path)
+
+
+async def profile_requests(request: Request, call_next):
+    global _profiler_busy
+    profile = RequestProfile()
+    token = current_profile.set(profile)
+
+    profiler = None
+    if _should_profile(request.url.path):
+        _profiler_busy = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        latency = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            _profiler_busy = False
+        current_profile.reset(token)
+
+    endpoint = f"{request.method} {route_template(request)}"
+    request_metrics.observe(
+        endpoint,
+        latency_seconds=latency,
+        sql_statements=profile.sql_count,
+        db_seconds=profile.db_seconds,
+        bcrypt_seconds=profile.bcrypt_seconds,
+        serialization_seconds=profile.serialization_seconds,
+    )
+    shared.count("requests")
+    if response.status_code >= 500:
+        shared.count("server_errors")
+
+    if latency * 1000 >= SLOW_REQUEST_MS:
+        logger.warning(
+            "Slow request %s took %.1f ms (%d statements, db %.1f ms, bcrypt %.1f ms):\n%s",
+            endpoint, latency * 1000, profile.sql_count, profile.db_seconds * 1000, profile.bcrypt_seconds * 1000,
+            "\n".join(f"  {seconds * 1000:8.2f} ms  {statement}" for seconds, statement in profile.statements),
+        )
+    if profiler is not None:
+        _dump_profile(profiler, endpoint)
+    return response
@@ -0,0 +1,121 @@
+"""
+Read replicas for the GET endpoints.
+
+DATABASE_REPLICA_URLS lists replica databases. Read-only routes take their
+session from `get_read_db` instead of `get_async_db`:
+
+- A replica is picked round robin, or the one with the fewest requests in
+  flight (REPLICA_SELECTION).
+- A replica that cannot hand out a connection is skipped for
+  REPLICA_RETRY_SECONDS, and the request falls over to the next replica and
+  finally to the primary.
+- Reads about a player written in the last READ_YOUR_WRITES_SECONDS go to the
+  primary. The player is taken from the route's `username` parameter. The
+  write endpoints record the players they change through `note_write`. This
+  also keeps rows a lagging replica has not caught up on out of the player
+  cache right after a write invalidated it. The window must cover the
+  replication lag, and it is per process like the caches.
+
+Without replicas configured, `get_read_db` hands out primary sessions.
+"""
+import logging
+import time
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app.cache import MemoryCache
+from app.config import DATABASE_REPLICA_URLS, REPLICA_SELECTION, REPLICA_RETRY_SECONDS, READ_YOUR_WRITES_SECONDS
+from app.database import create_pooled_async_engine, to_async_url
+from app.metrics import PoolMetrics
+from app.profiling import instrument_engine
+
+logger = logging.getLogger("app.replicas")
+
+
+class Replica:
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.pool_metrics = PoolMetrics()
+        self.engine = create_pooled_async_engine(to_async_url(url), self.pool_metrics)
+        instrument_engine(self.engine)
+        self.sessionmaker = sessionmaker(
+            bind=self.engine,
+            class_=AsyncSession,
+            autoflush=False,
+            expire_on_commit=False,
+        )
+        self.down_until = 0.0
+        self.in_flight = 0
+        self.reads = 0
+        self.failures = 0
+
+
+class ReplicaSet:
+    def __init__(self, urls: list[str], selection: str = REPLICA_SELECTION):
+        if selection not in ("round_robin", "least_loaded"):
+            raise ValueError("REPLICA_SELECTION must be 'round_robin' or 'least_loaded'")
+        self.selection = selection
+        self.replicas = [Replica(f"replica{i}", url) for i, url in enumerate(urls)]
+        self._next = 0
+        # Players written recently, their reads go to the primary
+        self._written = MemoryCache("recent_writes", READ_YOUR_WRITES_SECONDS, 100_000, 16 * 1024 * 1024)
+        self.primary_reads = 0
+        self.read_your_writes = 0
+        self.failovers = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def note_write(self, *usernames: str):
+        if self.replicas and READ_YOUR_WRITES_SECONDS > 0:
+            for username in usernames:
+                self._written.set(username, True)
+
+    def candidates(self, username: str | None) -> list[Replica]:
+        """Replicas to try in order, empty when the read must go to the primary."""
+        if not self.replicas:
+            return []
+        if username is not None and self._written.get(username) is True:
+            self.read_your_writes += 1
+            return []
+        now = time.monotonic()
+        healthy = [replica for replica in self.replicas if replica.down_until <= now]
+        if self.selection == "least_loaded":
+            return sorted(healthy, key=lambda replica: replica.in_flight)
+        if not healthy:
+            return []
+        start = self._next % len(healthy)
+        self._next += 1
+        return healthy[start:] + healthy[:start]
+
+    def mark_down(self, replica: Replica):
+        replica.failures += 1
+        replica.down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+        self.failovers += 1
+        logger.warning("Replica %s is unavailable, skipping it for %.0fs", replica.name, REPLICA_RETRY_SECONDS, exc_info=True)
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "selection": self.selection,
+            "primary_reads": self.primary_reads,
+            "read_your_writes": self.read_your_writes,
+            "failovers": self.failovers,
+            "replicas": {
+                replica.name: {
+                    "up": replica.down_until <= now,
+                    "in_flight": replica.in_flight,
+                    "reads": replica.reads,
+                    "failures": replica.failures,
+                    "db_pool": replica.pool_metrics.snapshot(),
+                }
+                for replica in self.replicas
+            },
+        }
+
+
+replicas = ReplicaSet(DATABASE_REPLICA_URLS)
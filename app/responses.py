@@ -0,0 +1,48 @@
+"""
+Fast JSON path for hot read endpoints.
+
+Handlers select only the columns of their response schema, in the schema's
+field order, and return `FastJSONResponse` with plain dicts/lists. Returning
+a Response skips FastAPI's response_model validation and jsonable_encoder
+pass. The response_model stays on the route for the OpenAPI schema, so the
+handler must build exactly that shape. orjson is used when it is installed,
+otherwise the stdlib encoder with the same compact output as JSONResponse.
+"""
+import json
+from datetime import date
+from enum import Enum
+from app.profiling import ProfiledJSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_default(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def row_dicts(keys, rows) -> list[dict]:
+    # Much cheaper than Row._asdict() or dict(row._mapping) per row
+    keys = tuple(keys)
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=json_default)
+    return json.dumps(
+        content, default=json_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(ProfiledJSONResponse):
+    """JSON response for already JSON-shaped content (enums and dates allowed)."""
+
+    def encode(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,83 @@
+"""
+Optimistic concurrency for match writes.
+
+Game and Plays rows carry a version. A write reads what it validates,
+without locks, then applies its change with a compare-and-swap on the
+version it read: `UPDATE ... SET version = version + 1 WHERE ... AND
+version = :read`. No row means someone else changed the match in between,
+the checks ran against stale data and `WriteConflict` is raised. Joins and
+role changes swap the game row, so the per-match invariants (at most six
+players, one player per role and team) are checked against the state they
+commit on, on every isolation level and backend.
+
+`write_retries.run()` reruns the whole transaction after a version conflict
+or a transient database error (deadlock, lock wait timeout, serialization
+failure), with jittered exponential backoff, up to WRITE_RETRY_ATTEMPTS
+times. When every attempt conflicted, the client gets 409 with Retry-After.
+"""
+import asyncio
+import logging
+import random
+from sqlalchemy import update
+from sqlalchemy.exc import DBAPIError
+from app.config import WRITE_RETRY_ATTEMPTS, WRITE_RETRY_BACKOFF, WRITE_RETRY_MAX_BACKOFF
+from app.utils import is_retryable_error
+
+logger = logging.getLogger("app.retries")
+
+
+class WriteConflict(Exception):
+    """Raised when a row changed between being read and being written."""
+
+
+async def compare_and_swap(db, model, where: tuple, version: int, **values):
+    # Bump the version of the row read at `version` (and set `values`), WriteConflict if it moved on
+    result = await db.execute(
+        update(model)
+        .where(*where, model.version == version)
+        .values(version=version + 1, **values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise WriteConflict(f"{model.__tablename__} row changed concurrently")
+
+
+class WriteRetries:
+    def __init__(self, attempts: int, backoff: float, max_backoff: float):
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.runs = 0
+        self.retries: dict[str, int] = {}
+        self.exhausted = 0
+
+    async def run(self, db, operation, *args):
+        """Run `operation(db, *args)`, rolling back and rerunning it after transient conflicts."""
+        self.runs += 1
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return await operation(db, *args)
+            except (WriteConflict, DBAPIError) as exc:
+                if isinstance(exc, DBAPIError) and not is_retryable_error(exc):
+                    raise
+                await db.rollback()
+                if attempt == self.attempts:
+                    self.exhausted += 1
+                    logger.warning("%s gave up after %d attempts: %s", operation.__name__, attempt, exc)
+                    raise WriteConflict(str(exc)) from exc
+                kind = "version" if isinstance(exc, WriteConflict) else "database"
+                self.retries[kind] = self.retries.get(kind, 0) + 1
+            # Full jitter, so writers that collided do not collide again in lockstep
+            await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1))))
+
+    def stats(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "runs": self.runs,
+            "retries": sum(self.retries.values()),
+            "retries_by_cause": dict(self.retries),
+            "exhausted": self.exhausted,
+        }
+
+
+write_retries = WriteRetries(WRITE_RETRY_ATTEMPTS, WRITE_RETRY_BACKOFF, WRITE_RETRY_MAX_BACKOFF)
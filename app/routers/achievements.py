@@ -1,16 +1,49 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, status, Depends, Request
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import Achievement, Achieves, Player
-from app.schemas.achievement import AchievementBase, AchievementOut
-from app.dependencies import get_db
+from app.schemas.achievement import AchievementBase, AchievementOut, AchieveRecordBase
+from app.dependencies import get_async_db, get_read_db, current_player, authorize_player
+from app.pagination import page_size, set_next_cursor, stream_ndjson
+from app.responses import FastJSONResponse, row_dicts
+from app.bulk import read_records, record_result, chunks, summarize_results
+from app.config import BULK_BATCH_SIZE
+from app.utils import insert_ignore
+from app.replicas import replicas
+from app.outbox import outbox, record_events, ACHIEVEMENT_GRANTED
+from app.cache import (
+    catalog_cache, player_cache, achievement_key, player_achievements_key,
+    achievements_page_key, invalidate_player_achievements, MISSING,
+)
 
-router = APIRouter()
+router = APIRouter(prefix="/achievements")
+
+# Columns of AchievementOut, in its field order, so rows can be returned as-is
+ACHIEVEMENT_COLUMNS = (Achievement.name, Achievement.description, Achievement.achieve_id)
+
+# Look up one achievement through the catalog cache
+async def get_achievement(db: AsyncSession, achieve_id: int) -> dict | None:
+    achievement = catalog_cache.get(achievement_key(achieve_id))
+    if achievement is MISSING:
+        row = (await db.execute(select(*ACHIEVEMENT_COLUMNS).where(Achievement.achieve_id == achieve_id))).first()
+        if not row:
+            return None
+        achievement = row._asdict()
+        catalog_cache.set(achievement_key(achieve_id), achievement)
+    return achievement
 
 # Add achievement to a player
 @router.post('/AddPlayerAchievement', status_code=status.HTTP_201_CREATED)
-async def add_player_achievement(achievement_id: int, username: str, db: Session = Depends(get_db)):
+async def add_player_achievement(
+    achievement_id: int,
+    username: str,
+    authenticated: str | None = Depends(current_player),
+    db: AsyncSession = Depends(get_async_db)
+):
+    authorize_player(authenticated, username)
+
     # Check if the player exists
-    player = db.query(Player).filter(Player.username == username).first()
+    player = await db.get(Player, username)
     if not player:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -18,18 +51,14 @@ async def add_player_achievement(achievement_id: int, username: str, db: Session
         )
     
     # Check if the achievement exists
-    achievement = db.query(Achievement).filter(Achievement.achieve_id == achievement_id).first()
-    if not achievement:
+    if not await get_achievement(db, achievement_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Achievement not found"
         )
     
     # Check if the player already has this achievement
-    existing_record = db.query(Achieves).filter(
-        Achieves.username == username,
-        Achieves.achieve_id == achievement_id
-    ).first()
+    existing_record = await db.get(Achieves, (username, achievement_id))
     
     if existing_record:
         raise HTTPException(
@@ -40,47 +69,159 @@ async def add_player_achievement(achievement_id: int, username: str, db: Session
     # Add new achievement record to the Achieves table
     new_record = Achieves(username=username, achieve_id=achievement_id)
     db.add(new_record)
-    db.commit()
-    db.refresh(new_record)
+    await record_events(db, ACHIEVEMENT_GRANTED, [{"username": username, "achieve_id": achievement_id}])
+    await db.commit()
+    outbox.notify()
+    invalidate_player_achievements(username)
+    replicas.note_write(username)
     
     return {"message": "Achievement added to player successfully"}
 
 
-# Get all achievements of a player
+async def grant_batch(db: AsyncSession, batch: list[tuple[int, AchieveRecordBase]], authenticated: str | None) -> list[dict]:
+    results = []
+
+    # Existence checks for the whole batch with IN lookups
+    usernames = {record.username for _, record in batch}
+    achieve_ids = {record.achieve_id for _, record in batch}
+    players = set(await db.scalars(select(Player.username).where(Player.username.in_(usernames))))
+    achievements = {
+        achieve_id for achieve_id in achieve_ids
+        if catalog_cache.get(achievement_key(achieve_id)) is not MISSING
+    }
+    if achieve_ids - achievements:
+        achievements |= set(await db.scalars(
+            select(Achievement.achieve_id).where(Achievement.achieve_id.in_(achieve_ids - achievements))
+        ))
+    owned = set((await db.execute(
+        select(Achieves.username, Achieves.achieve_id)
+        .where(tuple_(Achieves.username, Achieves.achieve_id).in_([(r.username, r.achieve_id) for _, r in batch]))
+    )).tuples())
+
+    rows = []
+    for index, record in batch:
+        key = (record.username, record.achieve_id)
+        try:
+            # Same check as AddPlayerAchievement, reported per row
+            authorize_player(authenticated, record.username)
+        except HTTPException as exc:
+            results.append(record_result(index, exc.status_code, exc.detail, **record.dict()))
+            continue
+        if record.username not in players:
+            results.append(record_result(index, status.HTTP_404_NOT_FOUND, "Player not found", **record.dict()))
+        elif record.achieve_id not in achievements:
+            results.append(record_result(index, status.HTTP_404_NOT_FOUND, "Achievement not found", **record.dict()))
+        elif key in owned:
+            results.append(record_result(index, status.HTTP_400_BAD_REQUEST, "Player already has this achievement", **record.dict()))
+        else:
+            rows.append({"username": record.username, "achieve_id": record.achieve_id})
+            results.append(record_result(index, status.HTTP_201_CREATED, **record.dict()))
+        owned.add(key)  # later duplicates in the same upload are rejected
+
+    if rows:
+        # A concurrent grant of the same pair is harmless, skip it instead of failing the batch
+        await db.execute(insert_ignore(Achieves, db.get_bind().dialect.name), rows)
+        await record_events(db, ACHIEVEMENT_GRANTED, rows)
+        await db.commit()
+        outbox.notify()
+        for username in {row["username"] for row in rows}:
+            invalidate_player_achievements(username)
+            replicas.note_write(username)
+    return results
+
+
+# Grant many achievements from a JSON array or NDJSON upload of {username, achieve_id}
+@router.post('/AddPlayerAchievements', status_code=status.HTTP_200_OK)
+async def add_player_achievements(
+    request: Request,
+    authenticated: str | None = Depends(current_player),
+    db: AsyncSession = Depends(get_async_db)
+):
+    results = []
+    async for batch in chunks(read_records(request, AchieveRecordBase, results), BULK_BATCH_SIZE):
+        results.extend(await grant_batch(db, batch, authenticated))
+    return summarize_results(results)
+
+
+# Get all achievements of a player, paginated by achieve_id or streamed as NDJSON
 @router.get('/GetPlayerAchievements', response_model=list[AchievementOut])
-async def get_player_achievements(username: str, db: Session = Depends(get_db)):
-    # Query achievements of the player from the Achieves table
-    player_achievements = db.query(Achievement).join(Achieves).filter(Achieves.username == username).all()
+async def get_player_achievements(
+    username: str,
+    after: int | None = None,
+    limit: int = Depends(page_size),
+    stream: bool = False,
+    db: AsyncSession = Depends(get_read_db)
+):
+    query = (
+        select(*ACHIEVEMENT_COLUMNS)
+        .join(Achieves, Achieves.achieve_id == Achievement.achieve_id)
+        .filter(Achieves.username == username)
+        .order_by(Achievement.achieve_id)
+    )
+    if after is not None:
+        query = query.filter(Achievement.achieve_id > after)
+    if stream:
+        return stream_ndjson(query, db.bind)
+
+    cache_key = player_achievements_key(username, after, limit)
+    player_achievements = player_cache.get(cache_key)
+    if player_achievements is MISSING:
+        # Query achievements of the player from the Achieves table
+        result = await db.execute(query.limit(limit))
+        player_achievements = row_dicts(result.keys(), result)
+        player_cache.set(cache_key, player_achievements)
 
-    if not player_achievements:
+    if not player_achievements and after is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No achievements found for this player"
         )
     
-    return player_achievements
+    response = FastJSONResponse(player_achievements)
+    set_next_cursor(response, player_achievements, limit, "achieve_id")
+    return response
 
 
-# Get achievements with optional ID (if ID provided, return that achievement, otherwise return all)
+# Get achievements with optional ID (if ID provided, return that achievement,
+# otherwise return a page of all achievements or stream them as NDJSON)
 @router.get('/GetAllAchievements', response_model=list[AchievementOut])
-async def get_all_achievements(id: int | None = None, db: Session = Depends(get_db)):
+async def get_all_achievements(
+    id: int | None = None,
+    after: int | None = None,
+    limit: int = Depends(page_size),
+    stream: bool = False,
+    db: AsyncSession = Depends(get_read_db)
+):
     if id:
         # If ID is provided, return the achievement with that ID
-        achievement = db.query(Achievement).filter(Achievement.achieve_id == id).first()
+        achievement = await get_achievement(db, id)
         if not achievement:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Achievement not found"
             )
-        return [achievement]  # Return the single achievement in a list
+        return FastJSONResponse([achievement])  # Return the single achievement in a list
     
-    # If ID is not provided, return all achievements
-    all_achievements = db.query(Achievement).all()
+    # If ID is not provided, return the achievements after the cursor
+    query = select(*ACHIEVEMENT_COLUMNS).order_by(Achievement.achieve_id)
+    if after is not None:
+        query = query.filter(Achievement.achieve_id > after)
+    if stream:
+        return stream_ndjson(query, db.bind)
+
+    cache_key = achievements_page_key(after, limit)
+    all_achievements = catalog_cache.get(cache_key)
+    if all_achievements is MISSING:
+        result = await db.execute(query.limit(limit))
+        all_achievements = row_dicts(result.keys(), result)
+        catalog_cache.set(cache_key, all_achievements)
     
-    if not all_achievements:
+    if not all_achievements and after is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No achievements found"
         )
     
-    return all_achievements
+    response = FastJSONResponse(all_achievements)
+    set_next_cursor(response, all_achievements, limit, "achieve_id")
+    return response
@@ -1,33 +1,48 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from app.models import Game, Player, Plays, Role, Team, GameResult, GameStatus
-from app.dependencies import get_db
-from app.schemas.game import AddPlayerToMatchRequest, ChangePlayerRoleRequest, EndGameRequest
+from sqlalchemy import select, insert, update, func, and_, case, literal
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from app.models import Game, Player, Plays, Role, Team, GameResult, GameStatus, GameType
+from app.dependencies import get_async_db, current_player, authorize_player
+from app.utils import is_duplicate_key_error
+from app.aggregates import apply_match_results
+from app.leaderboard import leaderboard
+from app.live_matches import live_matches, MAX_PLAYERS_PER_MATCH
+from app.replicas import replicas
+from app.outbox import outbox, record_events, GAME_ENDED
+from app.retries import write_retries, compare_and_swap
+from app.config import BULK_BATCH_SIZE
+from app.schemas.game import AddPlayerToMatchRequest, ChangePlayerRoleRequest, EndGameRequest, EndGamesRequest
 
-router = APIRouter()
+router = APIRouter(prefix="/games")
+
+# Plays column holding the role for each round
+ROLE_COLUMNS = {1: "role1", 2: "role2", 3: "role3"}
 
 # CreateMatch endpoint
-@router.post("/CreateMatch")
+@router.post("/CreateMatch", dependencies=[Depends(current_player)])
 async def create_match(
     match_id: str,
     game_pass: str | None = None, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Check if a game with the given match_id already exists
-    existing_game = db.query(Game).filter(Game.match_id == match_id).first()
-    if existing_game:
-        raise HTTPException(status_code=400, detail="A game with this match_id already exists.")
-    
-    # Create the game instance
+    # Create the game instance, the primary key rejects an existing match_id
     new_game = Game(
         match_id=match_id,
-        game_type="PRIVATE" if game_pass else "PUBLIC",
+        game_type=GameType.PRIVATE if game_pass else GameType.PUBLIC,
         game_pass=game_pass if game_pass else None,
-        status="STARTED",
+        status=GameStatus.STARTED,
     )
     db.add(new_game)
-    db.commit()
-    db.refresh(new_game)
+    try:
+        await db.commit()
+    except IntegrityError as exc:
+        await db.rollback()
+        if is_duplicate_key_error(exc):
+            raise HTTPException(status_code=400, detail="A game with this match_id already exists.")
+        raise
+    live_matches.add(new_game.match_id, new_game.game_type, new_game.game_pass)
 
     return {
         "game_id": new_game.match_id,
@@ -39,154 +54,306 @@ async def create_match(
 
 # AddPlayerToMatch endpoint
 @router.post("/AddPlayerToMatch")
-async def add_player_to_match(request: AddPlayerToMatchRequest, db: Session = Depends(get_db)):
-    game = db.query(Game).filter(Game.match_id == request.match_id).first()
+async def add_player_to_match(
+    request: AddPlayerToMatchRequest,
+    authenticated: str | None = Depends(current_player),
+    db: AsyncSession = Depends(get_async_db)
+):
+    authorize_player(authenticated, request.username)
+
+    # Live matches are validated in memory, see app/live_matches.py
+    match = await live_matches.get(db, request.match_id)
+    if match is not None and await live_matches.join(db, match, request.username, request.team, request.game_pass):
+        return added_to_match(request)
+
+    return await write_retries.run(db, join_match, request)
+
+
+async def join_match(db: AsyncSession, request: AddPlayerToMatchRequest) -> dict:
+    # Validate everything in one round trip, then swap the game row at the
+    # version read, so of two concurrent joins only one passes the player cap
+    # and the other reruns against the new count (app/retries.py)
+    player_exists = select(Player.username).where(Player.username == request.username).exists()
+    already_joined = select(Plays.username).where(
+        Plays.match_id == request.match_id,
+        Plays.username == request.username
+    ).exists()
+    player_count = select(func.count()).select_from(Plays).where(
+        Plays.match_id == request.match_id
+    ).scalar_subquery()
+
+    game = (await db.execute(
+        select(
+            Game.game_type,
+            Game.game_pass,
+            Game.version,
+            player_exists.label("player_exists"),
+            already_joined.label("already_joined"),
+            player_count.label("player_count"),
+        )
+        .where(Game.match_id == request.match_id)
+    )).first()
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
 
-    if game.game_type == "PRIVATE":
-        if not request.game_pass or game.match_pass != request.game_pass:
+    if game.game_type == GameType.PRIVATE:
+        if not request.game_pass or game.game_pass != request.game_pass:
             raise HTTPException(status_code=403, detail="Invalid or missing game pass.")
 
-    player = db.query(Player).filter(Player.username == request.username).first()
-    if not player:
+    if not game.player_exists:
         raise HTTPException(status_code=404, detail="Player not found")
 
-    existing_record = db.query(Plays).filter(
-        Plays.username == request.username,
-        Plays.match_id == request.match_id
-    ).first()
-    if existing_record:
+    if game.already_joined:
         raise HTTPException(status_code=400, detail="Player already added to this match")
 
-    if db.query(Plays).filter(Plays.match_id == request.match_id).count() >= 6:
+    if game.player_count >= MAX_PLAYERS_PER_MATCH:
         raise HTTPException(status_code=400, detail="A maximum of 6 players are allowed in one game.")
 
-    new_play = Plays(
-        username=request.username,
-        match_id=request.match_id,
-        team=request.team,
-        role1=None,
-        role2=None,
-        role3=None,
-        win_or_lose=None
-    )
-    db.add(new_play)
-    db.commit()
-    db.refresh(new_play)
+    await compare_and_swap(db, Game, (Game.match_id == request.match_id,), game.version)
+    try:
+        await db.execute(insert(Plays).values(
+            username=request.username,
+            match_id=request.match_id,
+            team=request.team,
+        ))
+        await db.commit()
+    except IntegrityError as exc:
+        await db.rollback()
+        if is_duplicate_key_error(exc):
+            raise HTTPException(status_code=400, detail="Player already added to this match")
+        raise HTTPException(status_code=404, detail="Player not found")
+
+    return added_to_match(request)
 
+
+def added_to_match(request: AddPlayerToMatchRequest) -> dict:
     return {
         "message": "Player added to match successfully",
-        "username": new_play.username,
-        "match_id": new_play.match_id,
-        "team": new_play.team,
+        "username": request.username,
+        "match_id": request.match_id,
+        "team": request.team,
         "roles": {
-            "role1": new_play.role1,
-            "role2": new_play.role2,
-            "role3": new_play.role3
+            "role1": None,
+            "role2": None,
+            "role3": None
         },
-        "win_or_lose": new_play.win_or_lose
+        "win_or_lose": None
     }
 
 # ChangePlayerRole endpoint
 @router.put("/ChangePlayerRole")
-async def change_player_role(request: ChangePlayerRoleRequest, db: Session = Depends(get_db)):
-    game = db.query(Game).filter(Game.match_id == request.match_id).first()
-    if not game:
+async def change_player_role(
+    request: ChangePlayerRoleRequest,
+    authenticated: str | None = Depends(current_player),
+    db: AsyncSession = Depends(get_async_db)
+):
+    authorize_player(authenticated, request.username)
+
+    role_column = ROLE_COLUMNS.get(request.round)
+    if role_column is None:
+        raise HTTPException(status_code=400, detail="Invalid round number. Must be 1, 2, or 3.")
+
+    # Live matches are validated and updated in memory, the roles are written behind
+    match = await live_matches.get(db, request.match_id)
+    if match is not None:
+        roles = await live_matches.change_role(db, match, request.username, request.round, request.role)
+        if roles is not None:
+            return role_changed(request, roles)
+
+    return await write_retries.run(db, change_role, request, role_column)
+
+
+async def change_role(db: AsyncSession, request: ChangePlayerRoleRequest, role_column: str) -> dict:
+    # Validate game, player, membership and role collision in one round trip,
+    # then swap the game row at the version read, so two players cannot grab
+    # the same role at once, and the player's row at its version
+    Teammate = aliased(Plays)
+    player_exists = select(Player.username).where(Player.username == request.username).exists()
+    role_taken = select(Teammate.username).where(
+        Teammate.match_id == request.match_id,
+        Teammate.team == Plays.team,
+        getattr(Teammate, role_column) == request.role
+    ).exists()
+
+    row = (await db.execute(
+        select(
+            Game.match_id,
+            Game.version.label("game_version"),
+            player_exists.label("player_exists"),
+            Plays.username,
+            Plays.team,
+            Plays.role1,
+            Plays.role2,
+            Plays.role3,
+            Plays.version.label("plays_version"),
+            role_taken.label("role_taken"),
+        )
+        .select_from(Game)
+        .outerjoin(Plays, and_(Plays.match_id == Game.match_id, Plays.username == request.username))
+        .where(Game.match_id == request.match_id)
+    )).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Game not found")
 
-    player = db.query(Player).filter(Player.username == request.username).first()
-    if not player:
+    if not row.player_exists:
         raise HTTPException(status_code=404, detail="Player not found")
 
-    play_record = db.query(Plays).filter(
-        Plays.username == request.username,
-        Plays.match_id == request.match_id
-    ).first()
-    if not play_record:
+    if row.username is None:
         raise HTTPException(status_code=404, detail="Player not part of this match")
 
-    existing_role = None
-    if request.round == 1:
-        existing_role = db.query(Plays).filter(
-            Plays.match_id == request.match_id,
-            Plays.team == play_record.team,
-            Plays.role1 == request.role
-        ).first()
-    elif request.round == 2:
-        existing_role = db.query(Plays).filter(
-            Plays.match_id == request.match_id,
-            Plays.team == play_record.team,
-            Plays.role2 == request.role
-        ).first()
-    elif request.round == 3:
-        existing_role = db.query(Plays).filter(
-            Plays.match_id == request.match_id,
-            Plays.team == play_record.team,
-            Plays.role3 == request.role
-        ).first()
-    else:
-        raise HTTPException(status_code=400, detail="Invalid round number. Must be 1, 2, or 3.")
+    if row.role_taken:
+        raise HTTPException(status_code=400, detail=f"Role '{request.role}' is already assigned in team {row.team}.")
 
-    if existing_role:
-        raise HTTPException(status_code=400, detail=f"Role '{request.role}' is already assigned in team {play_record.team}.")
+    await compare_and_swap(db, Game, (Game.match_id == request.match_id,), row.game_version)
+    try:
+        await compare_and_swap(
+            db, Plays, (Plays.username == request.username, Plays.match_id == request.match_id),
+            row.plays_version, **{role_column: request.role},
+        )
+        await db.commit()
+    except IntegrityError as exc:
+        await db.rollback()
+        if is_duplicate_key_error(exc):
+            raise HTTPException(status_code=400, detail=f"Role '{request.role}' is already assigned in team {row.team}.")
+        raise
 
-    if request.round == 1:
-        play_record.role1 = request.role
-    elif request.round == 2:
-        play_record.role2 = request.role
-    elif request.round == 3:
-        play_record.role3 = request.role
+    roles = {"role1": row.role1, "role2": row.role2, "role3": row.role3}
+    roles[role_column] = request.role
+    return role_changed(request, roles)
 
-    db.commit()
-    db.refresh(play_record)
 
+def role_changed(request: ChangePlayerRoleRequest, roles: dict) -> dict:
     return {
         "message": "Player role updated successfully",
-        "username": play_record.username,
-        "match_id": play_record.match_id,
-        "roles": {
-            "role1": play_record.role1,
-            "role2": play_record.role2,
-            "role3": play_record.role3
-        }
+        "username": request.username,
+        "match_id": request.match_id,
+        "roles": roles
     }
 
-# EndGame endpoint
-@router.put("/EndGame")
-async def end_game(request: EndGameRequest, db: Session = Depends(get_db)):
+async def end_games(db: AsyncSession, requests: list[EndGameRequest]) -> list[dict]:
+    """
+    End a batch of matches in one transaction with set-based statements and
+    return one result per request: {"match_id", "status_code", "detail"}.
+    Safe to rerun after a rollback, closing the live matches is idempotent.
+    """
+    match_ids = [request.match_id for request in requests]
+
+    # Persist pending live role changes first so the stats see the final roles.
+    # The matches stay closed in the registry until this transaction is over,
+    # so no request can load them back while they are still STARTED
     try:
-        # Convert the input string to the GameResult enum
-        result = GameResult(request.win_or_lose.value.upper())
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid value for win_or_lose. Must be 'WIN' or 'LOSE'.")
+        await live_matches.close(match_ids)
+        return await end_matches(db, requests, match_ids)
+    finally:
+        live_matches.release(match_ids)
 
-    # Validate game existence
-    game = db.query(Game).filter(Game.match_id == request.match_id).first()
-    if not game:
-        raise HTTPException(status_code=404, detail="Game not found")
 
-    # Validate players in the game
-    plays = db.query(Plays).filter(Plays.match_id == request.match_id).all()
-    if not plays:
-        raise HTTPException(status_code=404, detail="No players found for this game.")
+async def end_matches(db: AsyncSession, requests: list[EndGameRequest], match_ids: list[str]) -> list[dict]:
+    results = [{"match_id": request.match_id, "status_code": 200, "detail": None} for request in requests]
 
-    # Update win_or_lose for all players in the game
-    for play in plays:
-        if play.team == request.team:
-            play.win_or_lose = GameResult.WIN if result == GameResult.WIN else GameResult.LOSE
+    # Validate every match with one query, locking the game rows for the transaction
+    player_count = select(func.count()).select_from(Plays).where(Plays.match_id == Game.match_id).scalar_subquery()
+    found = {
+        row.match_id: row
+        for row in await db.execute(
+            select(Game.match_id, Game.status, player_count.label("player_count"))
+            .where(Game.match_id.in_(match_ids))
+            .with_for_update(of=Game)
+        )
+    }
+
+    valid, seen = {}, set()
+    for request, result in zip(requests, results):
+        game = found.get(request.match_id)
+        if request.match_id in seen:
+            result.update(status_code=400, detail="Duplicate match_id in batch.")
+        elif not game:
+            result.update(status_code=404, detail="Game not found")
+        elif not game.player_count:
+            result.update(status_code=404, detail="No players found for this game.")
         else:
-            play.win_or_lose = GameResult.LOSE if result == GameResult.WIN else GameResult.WIN
+            valid[request.match_id] = request
+        seen.add(request.match_id)
+    if not valid:
+        # Release the row locks, EndGames runs its next batch on this session
+        await db.rollback()
+        return results
+
+    # Take back the previous result of matches that were already ended
+    finished = [match_id for match_id in valid if found[match_id].status == GameStatus.FINISHED]
+    await apply_match_results(db, finished, sign=-1)
+
+    # The named team gets win_or_lose, everyone else in the match the opposite.
+    # Matches are grouped by (team, result) so the CASE has at most 8 branches.
+    groups = {}
+    for match_id, request in valid.items():
+        groups.setdefault((request.team, request.win_or_lose), []).append(match_id)
+    result_type = Plays.win_or_lose.type
+    outcomes = []
+    for (team, result), group in groups.items():
+        other = GameResult.LOSE if result == GameResult.WIN else GameResult.WIN
+        outcomes.append((and_(Plays.match_id.in_(group), Plays.team == team), literal(result, result_type)))
+        outcomes.append((Plays.match_id.in_(group), literal(other, result_type)))
+    await db.execute(
+        update(Plays)
+        .where(Plays.match_id.in_(valid))
+        .values(win_or_lose=case(*outcomes), version=Plays.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        update(Game)
+        .where(Game.match_id.in_(valid))
+        .values(status=GameStatus.FINISHED, version=Game.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+    # Fold the results into player_stats in the same transaction, follow-on
+    # work (achievements, ...) happens off the request through the outbox
+    await apply_match_results(db, list(valid))
+    await record_events(db, GAME_ENDED, [
+        {"match_id": match_id, "team": request.team.value, "win_or_lose": request.win_or_lose.value}
+        for match_id, request in valid.items()
+    ])
+    await db.commit()
+    outbox.notify()
 
-    # Mark game as finished
-    game.status = GameStatus.FINISHED
-    db.commit()
+    # Their stats are read from the primary until the replicas caught up
+    if replicas.enabled:
+        replicas.note_write(*await db.scalars(select(Plays.username).where(Plays.match_id.in_(valid))))
+
+    # Move the players on this worker's leaderboards right away, the
+    # game_ended handler only updates the worker that consumes the event
+    await leaderboard.apply_matches(db, list(valid))
+    return results
+
+
+# EndGame endpoint
+@router.put("/EndGame", dependencies=[Depends(current_player)])
+async def end_game(request: EndGameRequest, db: AsyncSession = Depends(get_async_db)):
+    try:
+        # Convert the input string to the GameResult enum
+        GameResult(request.win_or_lose.value.upper())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid value for win_or_lose. Must be 'WIN' or 'LOSE'.")
+
+    [result] = await write_retries.run(db, end_games, [request])
+    if result["status_code"] != 200:
+        raise HTTPException(status_code=result["status_code"], detail=result["detail"])
 
     return {
         "message": f"Game {request.match_id} ended. Team {request.team} set to {request.win_or_lose}.",
     }
 
 
+# EndGames endpoint: end many matches at once, one transaction per batch
+@router.put("/EndGames", dependencies=[Depends(current_player)])
+async def end_games_bulk(request: EndGamesRequest, db: AsyncSession = Depends(get_async_db)):
+    results = []
+    for start in range(0, len(request.games), BULK_BATCH_SIZE):
+        results.extend(await write_retries.run(db, end_games, request.games[start:start + BULK_BATCH_SIZE]))
 
-
-
+    return {
+        "ended": sum(1 for result in results if result["status_code"] == 200),
+        "failed": sum(1 for result in results if result["status_code"] != 200),
+        "results": results,
+    }
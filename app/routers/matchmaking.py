@@ -0,0 +1,57 @@
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.config import MATCHMAKING_MAX_WAIT
+from app.dependencies import current_player, authorize_player
+from app.matchmaking import matchmaking_queue, QueueFull, MatchmakingFailed, PlayerNotFound, BeingPlaced
+from app.schemas.game import MatchmakingRequest
+
+router = APIRouter(prefix="/matchmaking")
+
+# Enqueue endpoint. No database session: the scheduler validates players per batch,
+# and long-polling players must not hold pool connections.
+@router.post("/Enqueue")
+async def enqueue(
+    request: MatchmakingRequest,
+    wait: float = Query(0, ge=0, le=MATCHMAKING_MAX_WAIT),
+    authenticated: str | None = Depends(current_player),
+):
+    authorize_player(authenticated, request.username)
+    try:
+        ticket = matchmaking_queue.enqueue(request.username)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Matchmaking queue is full, please retry shortly.", headers={"Retry-After": "1"})
+
+    # Optionally wait for the scheduler to place the player
+    if wait:
+        try:
+            return await asyncio.wait_for(asyncio.shield(ticket.future), wait)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Dequeued while waiting
+            raise HTTPException(status_code=409, detail="Player left the matchmaking queue")
+        except PlayerNotFound as exc:
+            raise HTTPException(status_code=404, detail=str(exc))
+        except MatchmakingFailed as exc:
+            raise HTTPException(status_code=503, detail=str(exc))
+    return matchmaking_queue.status(request.username)
+
+
+@router.get("/Status/{username}")
+async def get_status(username: str):
+    status = matchmaking_queue.status(username)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Player is not in the matchmaking queue")
+    return status
+
+
+@router.delete("/Dequeue/{username}")
+async def dequeue(username: str, authenticated: str | None = Depends(current_player)):
+    authorize_player(authenticated, username)
+    try:
+        removed = matchmaking_queue.dequeue(username)
+    except BeingPlaced:
+        raise HTTPException(status_code=409, detail="Player is being placed in a match, check the matchmaking status")
+    if not removed:
+        raise HTTPException(status_code=404, detail="Player is not in the matchmaking queue")
+    return {"message": "Player removed from the matchmaking queue", "username": username}
@@ -0,0 +1,40 @@
+from fastapi import APIRouter
+from app.database import pool_metrics
+from app.metrics import request_metrics
+from app.utils import password_pool
+from app.cache import cache_stats
+from app.admission import admission_stats
+from app.idempotency import idempotency_cache
+from app.retries import write_retries
+from app.leaderboard import leaderboard
+from app.live_matches import live_matches
+from app.matchmaking import matchmaking_queue
+from app.replicas import replicas
+from app.tokens import tokens
+from app.outbox import outbox
+from app.achievement_rules import achievement_rules
+from app.startup import startup_stats
+from app.shared import shared_stats
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def get_metrics():
+    return {
+        "startup": startup_stats,
+        "server": shared_stats(),
+        "admission": admission_stats(),
+        "idempotency": idempotency_cache.stats(),
+        "write_retries": write_retries.stats(),
+        "db_pool": pool_metrics.snapshot(),
+        "replicas": replicas.stats(),
+        "password_pool": password_pool.stats(),
+        "tokens": tokens.stats(),
+        "caches": cache_stats(),
+        "leaderboard": leaderboard.stats(),
+        "live_matches": live_matches.stats(),
+        "matchmaking": matchmaking_queue.stats(),
+        "outbox": outbox.stats(),
+        "achievement_rules": achievement_rules.stats(),
+        "requests": request_metrics.snapshot(),
+    }
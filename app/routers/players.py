@@ -1,17 +1,68 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
-from datetime import datetime
-from app.schemas.player import PlayerBase, Login, PlayerOut
-from app.models import Player, Icon
-from app.dependencies import get_db
-from app.utils import hash_password, verify_password
+from fastapi import APIRouter, HTTPException, Depends, Request, status
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, date
+from app.schemas.player import PlayerBase, Login, PlayerOut, LoginOut
+from app.schemas.game import MatchHistoryOut
+from app.models import Player, Icon, Plays, Game
+from app.dependencies import get_async_db, get_read_db, token_claims, unauthorized
+from app.utils import hash_password_async, hash_passwords_async, verify_password_async, password_needs_rehash, is_duplicate_key_error
+from app.cache import catalog_cache, player_cache, player_key, icon_key, invalidate_player, MISSING
+from app.bulk import read_records, record_result, chunks, summarize_results
+from app.config import BULK_BATCH_SIZE
+from app.responses import FastJSONResponse, row_dicts
+from app.pagination import page_size, set_next_cursor, stream_ndjson
+from app.replicas import replicas
+from app.tokens import tokens
+from app.outbox import outbox, record_events, PLAYER_REGISTERED
 
-router = APIRouter()
+router = APIRouter(prefix="/players")
+
+# Columns of PlayerOut, in its field order, so rows can be returned as-is
+PLAYER_OUT_COLUMNS = (
+    Player.username, Player.name, Player.surename, Player.gender, Player.b_date,
+    Player.age, Player.address, Player.email, Player.icon_id,
+)
+
+# Columns of MatchHistoryOut, in its field order
+HISTORY_COLUMNS = (
+    Plays.match_id, Game.status, Game.game_type,
+    Plays.team, Plays.role1, Plays.role2, Plays.role3, Plays.win_or_lose,
+)
+
+# Icon existence check, icons are a static catalog so positive answers are cached
+async def icon_exists(db: AsyncSession, icon_id: int | None) -> bool:
+    if icon_id is None:
+        return False
+    if catalog_cache.get(icon_key(icon_id)) is not MISSING:
+        return True
+    if await db.get(Icon, icon_id) is None:
+        return False
+    catalog_cache.set(icon_key(icon_id), True)
+    return True
+
+# Set-based version of icon_exists, returns the ids that exist
+async def existing_icons(db: AsyncSession, icon_ids: set[int]) -> set[int]:
+    found = {icon_id for icon_id in icon_ids if catalog_cache.get(icon_key(icon_id)) is not MISSING}
+    missing = icon_ids - found
+    if missing:
+        for icon_id in await db.scalars(select(Icon.icon_id).where(Icon.icon_id.in_(missing))):
+            catalog_cache.set(icon_key(icon_id), True)
+            found.add(icon_id)
+    return found
+
+# Age in whole years on today's date
+def calculate_age(b_date: date | None) -> int | None:
+    if b_date is None:
+        return None
+    today = datetime.today()
+    return today.year - b_date.year - ((today.month, today.day) < (b_date.month, b_date.day))
 
 @router.post('/RegisterPlayer', status_code=status.HTTP_201_CREATED)
-async def register_player(player: PlayerBase, db: Session = Depends(get_db)):
+async def register_player(player: PlayerBase, db: AsyncSession = Depends(get_async_db)):
     # Check if the username already exists
-    existing_player = db.query(Player).filter(Player.username == player.username).first()
+    existing_player = await db.get(Player, player.username)
     if existing_player:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -19,17 +70,15 @@ async def register_player(player: PlayerBase, db: Session = Depends(get_db)):
         )
     
     # Check if the icon_id exists in the icons table
-    icon_exists = db.query(Icon).filter(Icon.icon_id == player.icon_id).first()
-    if not icon_exists:
+    if not await icon_exists(db, player.icon_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Icon not found."
         )
     
     # Calculate the correct age from b_date
-    today = datetime.today()
     b_date = player.b_date
-    calculated_age = today.year - b_date.year - ((today.month, today.day) < (b_date.month, b_date.day))
+    calculated_age = calculate_age(b_date)
 
     # Compare the provided age with the calculated age
     if player.age != calculated_age:
@@ -38,8 +87,8 @@ async def register_player(player: PlayerBase, db: Session = Depends(get_db)):
             detail="Provided age does not match the birth date."
         )
     
-    # Hash the password before storing it
-    hashed_password = hash_password(player.password)
+    # Hash the password before storing it (runs on the password worker pool)
+    hashed_password = await hash_password_async(player.password)
 
     # Create the new player record with the correct age
     new_player = Player(
@@ -55,15 +104,119 @@ async def register_player(player: PlayerBase, db: Session = Depends(get_db)):
         icon_id=player.icon_id
     )
     db.add(new_player)
-    db.commit()
-    db.refresh(new_player)
+    await record_events(db, PLAYER_REGISTERED, [{"username": new_player.username}])
+    await db.commit()
+    outbox.notify()
+    await db.refresh(new_player)
+    invalidate_player(new_player.username)
+    replicas.note_write(new_player.username)
 
     return new_player
 
-@router.post('/LoginPlayer', status_code=status.HTTP_200_OK, response_model=PlayerOut)
-async def login(player: Login, db: Session = Depends(get_db)):
+USERNAME_TAKEN = (status.HTTP_400_BAD_REQUEST, "Username already exists. Please choose a different username.")
+
+async def register_batch(db: AsyncSession, batch: list[tuple[int, PlayerBase]]) -> list[dict]:
+    results = []
+
+    # Existence checks for the whole batch: one IN query for usernames, one for icons
+    usernames = [player.username for _, player in batch]
+    taken = set(await db.scalars(select(Player.username).where(Player.username.in_(usernames))))
+    icons = await existing_icons(db, {player.icon_id for _, player in batch if player.icon_id is not None})
+
+    valid = []
+    for index, player in batch:
+        calculated_age = calculate_age(player.b_date)
+        if player.username in taken:
+            results.append(record_result(index, *USERNAME_TAKEN, username=player.username))
+        elif player.icon_id not in icons:
+            results.append(record_result(index, status.HTTP_404_NOT_FOUND, "Icon not found.", username=player.username))
+        elif player.age != calculated_age:
+            results.append(record_result(index, status.HTTP_400_BAD_REQUEST, "Provided age does not match the birth date.", username=player.username))
+        else:
+            valid.append((index, player, calculated_age))
+        taken.add(player.username)  # later duplicates in the same upload are rejected
+
+    hashed_passwords = await hash_passwords_async([player.password for _, player, _ in valid])
+    rows = [
+        {
+            "username": player.username,
+            "password": hashed_password,
+            "b_date": player.b_date,
+            "age": calculated_age,
+            "name": player.name,
+            "surename": player.surename,
+            "gender": player.gender,
+            "address": player.address,
+            "email": player.email,
+            "icon_id": player.icon_id,
+        }
+        for (_, player, calculated_age), hashed_password in zip(valid, hashed_passwords)
+    ]
+
+    failed = {}  # username -> (status code, detail) of rows the database refused
+    if rows:
+        try:
+            await insert_players(db, rows)
+        except IntegrityError as exc:
+            await db.rollback()
+            batch_retried = False
+            if is_duplicate_key_error(exc):
+                # A concurrent registration took some usernames, drop those and retry the rest once
+                taken = set(await db.scalars(select(Player.username).where(Player.username.in_([row["username"] for row in rows]))))
+                failed.update((username, USERNAME_TAKEN) for username in taken)
+                rows = [row for row in rows if row["username"] not in taken]
+                try:
+                    if rows:
+                        await insert_players(db, rows)
+                    batch_retried = True
+                except IntegrityError:
+                    await db.rollback()
+            if not batch_retried:
+                # Another race or a foreign key (an icon deleted since it was cached): find the rows one by one
+                failed.update(await insert_players_one_by_one(db, rows))
+        outbox.notify()
+
+    for index, player, _ in valid:
+        if player.username in failed:
+            results.append(record_result(index, *failed[player.username], username=player.username))
+            continue
+        invalidate_player(player.username)
+        replicas.note_write(player.username)
+        results.append(record_result(index, status.HTTP_201_CREATED, username=player.username))
+    return results
+
+async def insert_players(db: AsyncSession, rows: list[dict]):
+    await db.execute(insert(Player), rows)
+    await record_events(db, PLAYER_REGISTERED, [{"username": row["username"]} for row in rows])
+    await db.commit()
+
+async def insert_players_one_by_one(db: AsyncSession, rows: list[dict]) -> dict[str, tuple[int, str]]:
+    # Every row in its own transaction, so a row the database refuses only fails itself
+    failed = {}
+    for row in rows:
+        try:
+            await insert_players(db, [row])
+        except IntegrityError as exc:
+            await db.rollback()
+            if is_duplicate_key_error(exc):
+                failed[row["username"]] = USERNAME_TAKEN
+            else:
+                catalog_cache.delete(icon_key(row["icon_id"]))
+                failed[row["username"]] = (status.HTTP_404_NOT_FOUND, "Icon not found.")
+    return failed
+
+# Register many players from a JSON array or NDJSON upload
+@router.post('/RegisterPlayers', status_code=status.HTTP_200_OK)
+async def register_players(request: Request, db: AsyncSession = Depends(get_async_db)):
+    results = []
+    async for batch in chunks(read_records(request, PlayerBase, results), BULK_BATCH_SIZE):
+        results.extend(await register_batch(db, batch))
+    return summarize_results(results)
+
+@router.post('/LoginPlayer', status_code=status.HTTP_200_OK, response_model=LoginOut)
+async def login(player: Login, db: AsyncSession = Depends(get_async_db)):
     # Find player by username
-    db_player = db.query(Player).filter(Player.username == player.username).first()
+    db_player = await db.get(Player, player.username)
     if not db_player:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -71,24 +224,83 @@ async def login(player: Login, db: Session = Depends(get_db)):
         )
 
     # Verify password
-    if not verify_password(player.password, db_player.password):
+    if not await verify_password_async(player.password, db_player.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
         )
 
-    # Return player details without password
-    return db_player  # This will be converted to PlayerOut automatically because of the response_model
+    # Transparently upgrade hashes made with an older bcrypt cost
+    if password_needs_rehash(db_player.password):
+        db_player.password = await hash_password_async(player.password)
+        await db.commit()
+
+    # Return player details without password, plus the token that proves the login from now on
+    profile = {column.key: getattr(db_player, column.key) for column in PLAYER_OUT_COLUMNS}
+    return FastJSONResponse({
+        **profile,
+        "access_token": tokens.issue(db_player.username),
+        "token_type": "bearer",
+        "expires_in": tokens.ttl,
+    })
+
+@router.post('/LogoutPlayer', status_code=status.HTTP_200_OK)
+async def logout(claims: dict | None = Depends(token_claims)):
+    # Revoke the presented token
+    if claims is None:
+        raise unauthorized("Not authenticated")
+    tokens.revoke(claims)
+    return {"message": "Logged out successfully"}
 
 @router.get('/GetPlayer', response_model=PlayerOut)
-async def get_player(username: str, db: Session = Depends(get_db)):
-    # Find player by username
-    db_player = db.query(Player).filter(Player.username == username).first()
-    if not db_player:
+async def get_player(username: str, db: AsyncSession = Depends(get_read_db)):
+    cached = player_cache.get(player_key(username))
+    if cached is not MISSING:
+        return FastJSONResponse(cached)
+
+    # Find player by username, reading only the public profile columns
+    row = (await db.execute(select(*PLAYER_OUT_COLUMNS).where(Player.username == username))).first()
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Player not found"
+        )
+
+    profile = row._asdict()
+    player_cache.set(player_key(username), profile)
+    return FastJSONResponse(profile)
+
+
+# A player's matches in match_id order, paginated by match_id or streamed as NDJSON.
+# The plays primary key (username, match_id) serves both the filter and the order
+@router.get('/{username}/history', response_model=list[MatchHistoryOut])
+async def get_match_history(
+    username: str,
+    after: str | None = None,
+    limit: int = Depends(page_size),
+    stream: bool = False,
+    db: AsyncSession = Depends(get_read_db)
+):
+    query = (
+        select(*HISTORY_COLUMNS)
+        .join(Game, Game.match_id == Plays.match_id)
+        .where(Plays.username == username)
+        .order_by(Plays.match_id)
+    )
+    if after is not None:
+        query = query.where(Plays.match_id > after)
+    if stream:
+        return stream_ndjson(query, db.bind)
+
+    result = await db.execute(query.limit(limit))
+    history = row_dicts(result.keys(), result)
+    # Only an empty first page needs to tell an unknown player from one without matches
+    if not history and after is None and await db.get(Player, username) is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Player not found"
         )
 
-    # Return player details without password
-    return db_player  # This will be converted to PlayerOut automatically because of the response_model
+    response = FastJSONResponse(history)
+    set_next_cursor(response, history, limit, "match_id")
+    return response
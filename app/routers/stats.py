@@ -1,48 +1,117 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.models import Player, Achieves, Plays, GameResult, Achievement  # Correct import
-from app.dependencies import get_db
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.models import Player, Achieves, Achievement, PlayerStats, Role
+from app.aggregates import ROLE_STAT_COLUMNS
+from app.dependencies import get_read_db
+from app.leaderboard import LeaderboardMetric, leaderboard
+from app.pagination import page_size
+from app.export import ExportFormat, export_response, plays_range, pyarrow
+from app.responses import FastJSONResponse
 
-router = APIRouter()
+router = APIRouter(prefix="/stats")
 
 @router.get("/GetPlayerStats/{username}")
-async def get_player_stats(username: str, db: Session = Depends(get_db)):
-    # Validate player existence
-    player = db.query(Player).filter(Player.username == username).first()
-    if not player:
+async def get_player_stats(username: str, db: AsyncSession = Depends(get_read_db)):
+    # Validate player existence and read the precomputed stats with one primary key lookup,
+    # as a plain row (players without finished matches have no stats row, all NULL here)
+    stat_columns = ["wins", "losses", "games_played"] + [
+        column for columns in ROLE_STAT_COLUMNS.values() for column in columns
+    ]
+    row = (
+        await db.execute(
+            select(Player.username, *(getattr(PlayerStats, column) for column in stat_columns))
+            .outerjoin(PlayerStats, PlayerStats.username == Player.username)
+            .filter(Player.username == username)
+        )
+    ).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Player not found")
+    player_stats = row._mapping
 
     # Retrieve achievements
     achievements = (
-        db.query(
-            Achievement.name,
-            Achievement.description
-        )
-        .join(Achieves, Achieves.achieve_id == Achievement.achieve_id)
-        .filter(Achieves.username == username)
-        .all()
-    )
-
-    # Calculate number of wins and losses
-    stats = (
-        db.query(
-            func.count(Plays.win_or_lose).label("count"),
-            Plays.win_or_lose
+        await db.execute(
+            select(
+                Achievement.name,
+                Achievement.description
+            )
+            .join(Achieves, Achieves.achieve_id == Achievement.achieve_id)
+            .filter(Achieves.username == username)
         )
-        .filter(Plays.username == username)
-        .group_by(Plays.win_or_lose)
-        .all()
-    )
+    ).all()
 
-    win_count = sum(count for count, result in stats if result == GameResult.WIN)
-    lose_count = sum(count for count, result in stats if result == GameResult.LOSE)
-
-    return {
+    return FastJSONResponse({
         "username": username,
         "achievements": [{"name": name, "description": description} for name, description in achievements],
         "stats": {
-            "wins": win_count,
-            "losses": lose_count
+            "wins": player_stats["wins"] or 0,
+            "losses": player_stats["losses"] or 0,
+            "games_played": player_stats["games_played"] or 0,
+            "roles": {
+                role.value: {
+                    "games": player_stats[games_column] or 0,
+                    "wins": player_stats[wins_column] or 0,
+                }
+                for role, (games_column, wins_column) in ROLE_STAT_COLUMNS.items()
+            }
         }
+    })
+
+
+# Leaderboard endpoints: global board by default, per-role board with ?role=
+@router.get("/leaderboard")
+async def get_leaderboard(
+    metric: LeaderboardMetric = LeaderboardMetric.WINS,
+    role: Role | None = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Depends(page_size),
+    db: AsyncSession = Depends(get_read_db),
+):
+    total, entries = await leaderboard.top(db, metric, role, offset, limit)
+    return {
+        "metric": metric,
+        "role": role,
+        "total": total,
+        "entries": entries,
     }
+
+
+@router.get("/leaderboard/{username}")
+async def get_leaderboard_rank(
+    username: str,
+    metric: LeaderboardMetric = LeaderboardMetric.WINS,
+    role: Role | None = None,
+    around: int = Query(5, ge=0, le=100),
+    db: AsyncSession = Depends(get_read_db),
+):
+    ranked = await leaderboard.around(db, metric, role, username, around)
+    if ranked is None:
+        raise HTTPException(status_code=404, detail="Player is not ranked on this leaderboard")
+    rank, total, entries = ranked
+    return {
+        "metric": metric,
+        "role": role,
+        "username": username,
+        "rank": rank,
+        "total": total,
+        "entries": entries,
+    }
+
+
+# Every plays row with after < match_id <= until, streamed as Arrow IPC or CSV (see app/export.py)
+@router.get("/ExportPlays")
+async def export_plays(
+    after: str | None = None,
+    until: str | None = None,
+    format: ExportFormat | None = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    if format is None:
+        format = ExportFormat.ARROW if pyarrow is not None else ExportFormat.CSV
+    elif format is ExportFormat.ARROW and pyarrow is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Arrow export needs pyarrow, use format=csv"
+        )
+    return export_response(plays_range(after, until), format, db.bind)
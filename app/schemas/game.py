@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from app.models import Role, Team, GameResult
+from app.models import Role, Team, GameResult, GameStatus, GameType
 
 # Request schemas
 class AddPlayerToMatchRequest(BaseModel):
@@ -18,4 +18,21 @@ class ChangePlayerRoleRequest(BaseModel):
 class EndGameRequest(BaseModel):
     match_id: str
     team: Team
-    win_or_lose: GameResult
\ No newline at end of file
+    win_or_lose: GameResult
+
+class EndGamesRequest(BaseModel):
+    games: list[EndGameRequest]
+
+class MatchmakingRequest(BaseModel):
+    username: str
+
+# Response schemas
+class MatchHistoryOut(BaseModel):
+    match_id: str
+    status: GameStatus
+    game_type: GameType
+    team: Team | None = None
+    role1: Role | None = None
+    role2: Role | None = None
+    role3: Role | None = None
+    win_or_lose: GameResult | None = None
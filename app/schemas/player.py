@@ -31,4 +31,9 @@ class PlayerOut(BaseModel):
 
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class LoginOut(PlayerOut):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""
+Production entry point: a pre-forking server running the app in several
+worker processes on one listening socket.
+
+    python -m app.server --workers 4 --port 8000
+    DB_CONNECTION_BUDGET=40 python -m app.server   # 40 primary connections across all workers
+
+The parent binds the socket, imports the app once (unless --no-preload) and
+forks the workers. Each worker runs uvicorn on the inherited socket, and the
+kernel hands every new connection to whichever worker accepts it first.
+
+- Workers default to the number of cores, WEB_CONCURRENCY or --workers
+  override it.
+- With DB_CONNECTION_BUDGET each worker's pool gets an equal share of the
+  budget, split in the ratio of DB_POOL_SIZE to DB_MAX_OVERFLOW, and the
+  admission limit and warm-up follow the share (app/config.py).
+- The parent opens no connections, and a forked process drops any pool it
+  inherited before using it (app/database.py).
+- Each worker warms its pool and catalogs in the lifespan before accepting.
+- On SIGTERM or SIGINT the parent sends SIGTERM to every worker. A worker
+  stops accepting, finishes its requests in flight for up to
+  SERVER_GRACEFUL_TIMEOUT, runs the lifespan shutdown (pending role changes,
+  outbox, pools) and exits. Workers still running after that are killed.
+- A worker that dies is replaced.
+- With SERVER_SHARED_MEMORY (or --shared-memory) workers share counters and
+  rate limits, see app/shared.py.
+
+Everything else stays per worker: caches, leaderboards, the matchmaking
+queue and Idempotency-Key responses. LIVE_MATCHES needs every request for a
+match in one process and is refused with more than one worker. Without a
+TOKEN_SECRET the parent picks one for all workers, so tokens work on every
+worker until the server restarts.
+"""
+import argparse
+import gc
+import logging
+import os
+import secrets
+import signal
+import socket
+import time
+
+logger = logging.getLogger("app.server")
+
+RESTART_DELAY = 1.0  # seconds before replacing a worker that died right after starting
+POLL_INTERVAL = 0.2
+KILL_MARGIN = 5.0  # seconds on top of SERVER_GRACEFUL_TIMEOUT for the lifespan shutdown
+
+
+def bind(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(index: int, sock: socket.socket, log_level: str):
+    # In the forked child. uvicorn installs its own SIGTERM/SIGINT handlers for
+    # the graceful shutdown, until then the parent's handlers must not apply
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    import uvicorn
+    from app import shared
+    from app.admission import rate_limiter
+    from app.config import SERVER_GRACEFUL_TIMEOUT
+    from app.main import app
+
+    if shared.area is not None:
+        shared.area.counters.attach(index)
+        rate_limiter.shared = shared.area.buckets
+    config = uvicorn.Config(
+        app, lifespan="on", log_level=log_level, access_log=False, timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    def __init__(self, workers: int, sock: socket.socket, log_level: str, graceful_timeout: float):
+        self.workers = workers
+        self.sock = sock
+        self.log_level = log_level
+        self.graceful_timeout = graceful_timeout
+        self.children: dict[int, tuple[int, float]] = {}  # pid -> (worker index, started)
+        self.stopping = False
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(index, self.sock, self.log_level)
+            except BaseException:
+                logger.exception("Worker %d failed", index)
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = (index, time.monotonic())
+
+    def stop(self, signum, frame):
+        if not self.stopping:
+            logger.info("Received %s, draining %d workers", signal.Signals(signum).name, len(self.children))
+        self.stopping = True
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index, started = self.children.pop(pid, (None, 0.0))
+            if index is None or self.stopping:
+                continue
+            logger.warning("Worker %d (pid %d) exited with %d, starting a new one", index, pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)  # do not spin on a worker that cannot start
+            self.spawn(index)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.workers):
+            self.spawn(index)
+        while not self.stopping:
+            self.reap()
+            time.sleep(POLL_INTERVAL)
+
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout + KILL_MARGIN
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(POLL_INTERVAL / 2)
+        for pid in list(self.children):
+            logger.warning("Worker pid %d did not stop in time, killing it", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.sock.close()
+        logger.info("Stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY") or 0) or os.cpu_count() or 1)
+    parser.add_argument("--host", help="default SERVER_HOST")
+    parser.add_argument("--port", type=int, help="default SERVER_PORT")
+    parser.add_argument("--no-preload", dest="preload", action="store_false", help="import the app in every worker instead of once before forking")
+    parser.add_argument("--shared-memory", action="store_true", help="share counters and rate limits between workers (SERVER_SHARED_MEMORY)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    # Before app.config is imported: the pool sizes, and what is derived from them, depend on it
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s")
+    if not os.getenv("TOKEN_SECRET"):
+        logger.warning("TOKEN_SECRET is not set, using a random key shared by the workers until restart")
+        os.environ["TOKEN_SECRET"] = secrets.token_urlsafe(32)
+    from app import config, shared
+
+    if config.LIVE_MATCHES and args.workers > 1:
+        parser.error("LIVE_MATCHES keeps each match in one process, run one worker or turn it off")
+    if config.DB_CONNECTION_BUDGET and config.DB_CONNECTION_BUDGET < args.workers:
+        parser.error(f"DB_CONNECTION_BUDGET={config.DB_CONNECTION_BUDGET} is less than one connection per worker")
+
+    host, port = args.host or config.SERVER_HOST, args.port or config.SERVER_PORT
+    sock = bind(host, port, config.SERVER_BACKLOG)
+    if args.shared_memory or config.SERVER_SHARED_MEMORY:
+        shared.create(args.workers, config.SHARED_RATE_LIMIT_SLOTS)
+    if args.preload:
+        import app.main  # noqa: F401
+        # Imported objects stay out of the collector, so its passes do not copy their pages into every worker
+        gc.freeze()
+
+    logger.info(
+        "Listening on %s:%d with %d workers, pool %d + %d overflow each",
+        host, port, args.workers, config.DB_POOL_SIZE, config.DB_MAX_OVERFLOW,
+    )
+    Supervisor(args.workers, sock, args.log_level, config.SERVER_GRACEFUL_TIMEOUT).run()
+
+
+if __name__ == "__main__":
+    main()
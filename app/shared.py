@@ -0,0 +1,131 @@
+"""
+Memory shared by the worker processes of app/server.py.
+
+Workers share nothing by default: caches, rate limit buckets and metrics are
+per process, so a client whose connections land on different workers gets
+each worker's full rate limit, and /metrics only describes the worker that
+answered. With SERVER_SHARED_MEMORY the launcher maps one anonymous shared
+memory area before forking, which every worker inherits:
+
+- Counters: one row per worker with its pid, start time and request
+  counters. A row is only written by its own worker, so no lock is needed,
+  and /metrics on any worker reports every worker and the totals.
+- Rate limit buckets: SHARED_RATE_LIMIT_SLOTS token buckets addressed by a
+  hash of (client, route), under one lock, so a limit holds for the whole
+  server. Two keys hashing to the same slot evict each other, the newcomer
+  starts with a full bucket, as with an evicted local bucket.
+
+The lock is held for a few microseconds, but a worker killed while holding
+it (SIGKILL from the launcher after the drain timeout, the OOM killer) never
+releases it. Waiting for it is therefore bounded by LOCK_TIMEOUT: a worker
+that times out stops using the shared buckets for good, logs it, and falls
+back to its own, so rate limits turn per worker again instead of blocking
+every request. Restart the server to share them again.
+
+Only a process forked by the launcher after `create()` sees the area, plain
+uvicorn workers keep everything per process.
+"""
+import hashlib
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+
+# Per-worker counters, in row order after pid and start time
+COUNTERS = ("requests", "server_errors", "rate_limited", "shed")
+ROW_FIELDS = ("pid", "started_at") + COUNTERS
+BUCKET = struct.Struct("qdd")  # key hash, tokens, updated (time.monotonic is system wide on Linux)
+LOCK_TIMEOUT = 0.05  # seconds, far beyond any real hold time of the bucket lock
+
+
+class SharedLockTimeout(Exception):
+    """The bucket lock was not released in time, most likely its holder died."""
+
+
+class SharedCounters:
+    def __init__(self, buffer: memoryview, workers: int):
+        self._values = buffer.cast("q")
+        self.workers = workers
+        self.worker = None
+
+    def _index(self, worker: int, field: str) -> int:
+        return worker * len(ROW_FIELDS) + ROW_FIELDS.index(field)
+
+    def attach(self, worker: int):
+        # Called in the worker after fork, claims its row
+        self.worker = worker
+        for field in ROW_FIELDS:
+            self._values[self._index(worker, field)] = 0
+        self._values[self._index(worker, "pid")] = os.getpid()
+        self._values[self._index(worker, "started_at")] = int(time.time())
+
+    def add(self, counter: str, amount: int = 1):
+        if self.worker is not None:
+            self._values[self._index(self.worker, counter)] += amount
+
+    def stats(self) -> dict:
+        rows = [
+            {field: self._values[self._index(worker, field)] for field in ROW_FIELDS}
+            for worker in range(self.workers)
+        ]
+        return {
+            "worker": self.worker,
+            "workers": rows,
+            "totals": {counter: sum(row[counter] for row in rows) for counter in COUNTERS},
+        }
+
+
+class SharedBuckets:
+    def __init__(self, buffer: memoryview, slots: int, lock):
+        self._buffer = buffer
+        self.slots = slots
+        self._lock = lock
+
+    def take(self, key: tuple[str, str], rate: float, burst: float, now: float) -> float:
+        """Tokens in the bucket before this request, one is taken when there was at least one."""
+        digest = int.from_bytes(hashlib.blake2b("\0".join(key).encode(), digest_size=8).digest(), "little", signed=True)
+        offset = (digest % self.slots) * BUCKET.size
+        # Blocks the event loop, so only briefly, see the module docstring
+        if not self._lock.acquire(timeout=LOCK_TIMEOUT):
+            raise SharedLockTimeout()
+        try:
+            stored, tokens, updated = BUCKET.unpack_from(self._buffer, offset)
+            if stored != digest:
+                tokens = burst
+            else:
+                tokens = min(burst, tokens + (now - updated) * rate)
+            BUCKET.pack_into(self._buffer, offset, digest, tokens - 1 if tokens >= 1 else tokens, now)
+        finally:
+            self._lock.release()
+        return tokens
+
+
+class SharedArea:
+    def __init__(self, workers: int, bucket_slots: int):
+        counters_size = workers * len(ROW_FIELDS) * 8
+        self._map = mmap.mmap(-1, counters_size + bucket_slots * BUCKET.size)  # anonymous, MAP_SHARED
+        buffer = memoryview(self._map)
+        self.counters = SharedCounters(buffer[:counters_size], workers)
+        self.buckets = SharedBuckets(buffer[counters_size:], bucket_slots, multiprocessing.get_context("fork").Lock())
+
+
+# Set by the launcher in the parent, before any worker is forked
+area: SharedArea | None = None
+
+
+def create(workers: int, bucket_slots: int) -> SharedArea:
+    global area
+    area = SharedArea(workers, bucket_slots)
+    return area
+
+
+def count(counter: str, amount: int = 1):
+    if area is not None:
+        area.counters.add(counter, amount)
+
+
+def shared_stats() -> dict:
+    if area is None:
+        return {"enabled": False, "pid": os.getpid()}
+    return {"enabled": True, **area.counters.stats()}
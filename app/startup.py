@@ -0,0 +1,78 @@
+"""
+Warm-up run by the lifespan before the first request.
+
+Importing the app no longer touches the database: tables are created by
+`python -m app.manage migrate` (or `bootstrap`), and engines are created on
+first use. What a cold worker would otherwise pay on its first requests is
+done here instead:
+
+- open STARTUP_WARM_CONNECTIONS pool connections (connect, TLS, auth),
+- load the icon and achievement catalogs into the catalog cache.
+
+Warm-up failures are logged and do not stop the worker from serving. The
+connections and cache entries are made on demand later, as before.
+"""
+import asyncio
+import logging
+import time
+from sqlalchemy import select, text
+from app.cache import catalog_cache, icon_key, achievement_key, achievements_page_key
+from app.config import STARTUP_WARM_CONNECTIONS, STARTUP_WARM_CACHES, CATALOG_CACHE_MAX_ENTRIES, DEFAULT_PAGE_SIZE
+from app.database import AsyncSessionLocal, get_async_engine
+from app.models import Achievement, Icon
+from app.responses import row_dicts
+
+logger = logging.getLogger("app.startup")
+
+# When this process started serving, and what the warm-up took
+startup_stats = {}
+
+
+async def warm_pool(connections: int = STARTUP_WARM_CONNECTIONS) -> int:
+    """Open up to `connections` pool connections at once and return them to the pool."""
+    engine = get_async_engine()
+    size = engine.sync_engine.pool.size() if hasattr(engine.sync_engine.pool, "size") else 1
+    connections = min(connections, size)
+
+    async def ping():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(ping() for _ in range(connections)))
+    return connections
+
+
+async def warm_catalog() -> int:
+    """Cache every icon and achievement (up to the cache's entry limit) and the first achievements page."""
+    limit = CATALOG_CACHE_MAX_ENTRIES // 2
+    async with AsyncSessionLocal() as db:
+        icon_ids = list(await db.scalars(select(Icon.icon_id).order_by(Icon.icon_id).limit(limit)))
+        # Same columns as ACHIEVEMENT_COLUMNS in the achievements router
+        result = await db.execute(
+            select(Achievement.name, Achievement.description, Achievement.achieve_id)
+            .order_by(Achievement.achieve_id)
+            .limit(limit)
+        )
+        achievements = row_dicts(result.keys(), result)
+    for icon_id in icon_ids:
+        catalog_cache.set(icon_key(icon_id), True)
+    for achievement in achievements:
+        catalog_cache.set(achievement_key(achievement["achieve_id"]), achievement)
+    if limit >= DEFAULT_PAGE_SIZE:
+        # GetAllAchievements without a cursor, the same rows the endpoint would cache
+        catalog_cache.set(achievements_page_key(None, DEFAULT_PAGE_SIZE), achievements[:DEFAULT_PAGE_SIZE])
+    return len(icon_ids) + len(achievements)
+
+
+async def warm_up():
+    start = time.perf_counter()
+    try:
+        if STARTUP_WARM_CONNECTIONS > 0:
+            startup_stats["warm_connections"] = await warm_pool()
+        if STARTUP_WARM_CACHES:
+            startup_stats["warm_catalog_entries"] = await warm_catalog()
+    except Exception:
+        logger.exception("Startup warm-up failed, serving cold")
+        startup_stats["warm_up_failed"] = True
+    startup_stats["warm_up_seconds"] = round(time.perf_counter() - start, 4)
+    startup_stats["serving_since"] = time.time()
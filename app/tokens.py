@@ -0,0 +1,105 @@
+"""
+Signed session tokens.
+
+LoginPlayer pays for one bcrypt verification and hands out a bearer token.
+Later requests prove who they are by presenting the token, which costs an
+HMAC-SHA256 and a JSON decode instead of another bcrypt round.
+
+A token is `<payload>.<signature>`, both base64url without padding. The
+payload is {"sub": username, "exp": unix time, "jti": token id}, and the
+signature is the HMAC of the encoded payload under TOKEN_SECRET. Tokens are
+not stored. Logging out puts the token id on a revocation list until the
+token would have expired anyway. The list is in memory and per process, and
+bounded by TOKEN_REVOCATION_MAX_ENTRIES. Once it is full, the oldest
+revocations are forgotten first (counted as evictions in /metrics).
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+from app.cache import MemoryCache
+from app.config import TOKEN_SECRET, TOKEN_TTL, TOKEN_REVOCATION_MAX_ENTRIES
+
+logger = logging.getLogger("app.tokens")
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+class TokenIssuer:
+    def __init__(self, secret: str, ttl: int = TOKEN_TTL, max_revoked: int = TOKEN_REVOCATION_MAX_ENTRIES):
+        if not secret:
+            # Fine for a single process, but tokens die with it and other workers reject them
+            logger.warning("TOKEN_SECRET is not set, using a random key for this process")
+            secret = secrets.token_urlsafe(32)
+        self._key = secret.encode("utf-8")
+        self.ttl = ttl
+        self._revoked = MemoryCache("revoked_tokens", ttl, max_revoked, max_revoked * 256)
+        self.issued = 0
+        self.verified = 0
+        self.rejected = 0
+        self.revoked = 0
+
+    def _sign(self, payload: bytes) -> bytes:
+        return _encode(hmac.new(self._key, payload, hashlib.sha256).digest())
+
+    def issue(self, username: str) -> str:
+        claims = {"sub": username, "exp": int(time.time()) + self.ttl, "jti": secrets.token_hex(8)}
+        payload = _encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        self.issued += 1
+        return (payload + b"." + self._sign(payload)).decode("ascii")
+
+    def verify(self, token: str) -> dict:
+        """The claims of a valid, unexpired and unrevoked token, otherwise raises InvalidToken."""
+        try:
+            payload, signature = token.encode("ascii").split(b".")
+            if not hmac.compare_digest(signature, self._sign(payload)):
+                raise InvalidToken("Invalid token")
+            claims = json.loads(_decode(payload))
+        except (ValueError, UnicodeError, binascii.Error):
+            # Malformed tokens, including ones that fail to split or decode
+            self.rejected += 1
+            raise InvalidToken("Invalid token")
+        except InvalidToken:
+            self.rejected += 1
+            raise
+        if claims["exp"] < time.time():
+            self.rejected += 1
+            raise InvalidToken("Token expired")
+        if self._revoked.get(claims["jti"]) is True:
+            self.rejected += 1
+            raise InvalidToken("Token revoked")
+        self.verified += 1
+        return claims
+
+    def revoke(self, claims: dict):
+        # Only needs remembering until the token expires on its own
+        remaining = claims["exp"] - time.time()
+        if remaining > 0:
+            self._revoked.set(claims["jti"], True, ttl=remaining)
+            self.revoked += 1
+
+    def stats(self) -> dict:
+        return {
+            "issued": self.issued,
+            "verified": self.verified,
+            "rejected": self.rejected,
+            "revoked": self.revoked,
+            "revocation_list": self._revoked.stats(),
+        }
+
+
+tokens = TokenIssuer(TOKEN_SECRET)
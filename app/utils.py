@@ -1,9 +1,147 @@
+import asyncio
+import time
 import bcrypt
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from app.config import BCRYPT_ROUNDS, PASSWORD_POOL_KIND, PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_QUEUE
+from app.profiling import record_bcrypt
 
 # Hash a password
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
 
 # Verify a plain password against a hashed password
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+# Check whether a stored hash was made with a different cost than the configured one
+def password_needs_rehash(hashed_password: str, rounds: int = BCRYPT_ROUNDS) -> bool:
+    try:
+        return int(hashed_password.strip().split('$')[2]) != rounds
+    except (IndexError, ValueError):
+        return True
+
+
+class PasswordPoolFull(Exception):
+    """Raised when too many password jobs are already waiting for a worker."""
+
+
+class PasswordPool:
+    """
+    Runs bcrypt work on a thread or process pool so it never blocks the event loop.
+    At most `workers` jobs run at once, and at most `max_queue` wait behind them.
+    """
+
+    def __init__(self, kind: str, workers: int, max_queue: int):
+        if kind not in ("thread", "process"):
+            raise ValueError("PASSWORD_POOL_KIND must be 'thread' or 'process'")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self._executor: Executor | None = None
+        self._slots = asyncio.Semaphore(self.workers)
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_queue_seen = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self.max_queue and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise PasswordPoolFull("Password worker pool is saturated")
+
+        self.queued += 1
+        self.max_queue_seen = max(self.max_queue_seen, self.queued)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            record_bcrypt(time.perf_counter() - start)
+            self.running -= 1
+            self.completed += 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "max_queue_seen": self.max_queue_seen,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_pool = PasswordPool(PASSWORD_POOL_KIND, PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_QUEUE)
+
+# Async wrappers used by the routers
+async def hash_password_async(password: str) -> str:
+    return await password_pool.run(hash_password, password, BCRYPT_ROUNDS)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_pool.run(verify_password, plain_password, hashed_password)
+
+# Hash many passwords in parallel without queueing more jobs than the pool has workers
+async def hash_passwords_async(passwords: list[str]) -> list[str]:
+    in_flight = asyncio.Semaphore(password_pool.workers)
+
+    async def hash_one(password: str) -> str:
+        async with in_flight:
+            return await hash_password_async(password)
+
+    return await asyncio.gather(*(hash_one(password) for password in passwords))
+
+# Check whether an IntegrityError came from a unique/primary key violation
+def is_duplicate_key_error(exc: IntegrityError) -> bool:
+    orig = getattr(exc, "orig", None)
+    code = orig.args[0] if getattr(orig, "args", None) else None
+    message = str(orig)
+    return code == 1062 or "Duplicate entry" in message or "UNIQUE constraint failed" in message
+
+# Check whether a DBAPIError is a transient conflict the whole transaction can be
+# retried after: a deadlock, a lock wait timeout or a serialization failure
+def is_retryable_error(exc: DBAPIError) -> bool:
+    orig = getattr(exc, "orig", None)
+    code = orig.args[0] if getattr(orig, "args", None) else None
+    sqlstate = getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+    message = str(orig)
+    return (
+        code in (1205, 1213)  # MySQL lock wait timeout, deadlock
+        or sqlstate in ("40001", "40P01")  # serialization failure, deadlock
+        or "database is locked" in message  # SQLite busy timeout
+    )
+
+# INSERT that silently skips rows hitting a unique/primary key, per dialect
+def insert_ignore(table, dialect_name: str):
+    if dialect_name == "mysql":
+        return insert(table).prefix_with("IGNORE")
+    if dialect_name == "sqlite":
+        return insert(table).prefix_with("OR IGNORE")
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(table).on_conflict_do_nothing()
+    raise NotImplementedError(f"insert_ignore is not supported for {dialect_name}")
@@ -0,0 +1,95 @@
+"""
+Players evaluated per second by the rule-based achievement engine.
+
+    python -m benchmarks.achievement_rules --players 100000 --plays 1000000
+
+Seeds finished matches, rebuilds player_stats and then measures:
+- backfill of the whole player base with 1 and --workers concurrent chunks
+  (achieves is emptied before each run so both grant everything), and a
+  second backfill that finds nothing left to grant,
+- the game_ended handler path: evaluating the players of --batch ended
+  matches at a time, once with grants to make and once with nothing left
+  to grant.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("achievement_rules")
+
+from sqlalchemy import delete, func, select
+
+from app.achievement_rules import achievement_rules
+from app.aggregates import rebuild_player_stats
+from app.database import AsyncSessionLocal, engine
+from app.manage import add_rule_achievements, migrate
+from app.models import Achieves, Game, OutboxEvent, PlayerStats, Plays
+from benchmarks.common import summarize
+from benchmarks.seed import seed_players, seed_plays
+
+
+def reset_grants():
+    with engine.begin() as conn:
+        conn.execute(delete(Achieves))
+        conn.execute(delete(OutboxEvent))
+
+
+async def incremental(match_ids: list[str], batch: int) -> dict:
+    samples, players = [], 0
+    start = time.perf_counter()
+    for i in range(0, len(match_ids), batch):
+        chunk = match_ids[i:i + batch]
+        batch_start = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            in_matches = select(Plays.username).where(Plays.match_id.in_(chunk))
+            players += await db.scalar(select(func.count(func.distinct(Plays.username))).where(Plays.match_id.in_(chunk)))
+            await achievement_rules.evaluate(db, PlayerStats.username.in_(in_matches))
+            await db.commit()
+        samples.append(time.perf_counter() - batch_start)
+    elapsed = time.perf_counter() - start
+    report = summarize(samples, elapsed)
+    report["players_evaluated"] = players
+    report["players_per_second"] = round(players / elapsed)
+    return report
+
+
+async def run(players: int, plays: int, workers: int, chunk: int, batch: int, matches: int) -> dict:
+    migrate()
+    await add_rule_achievements()
+    seed_players(players)
+    seed_plays(plays, players=players)
+    with engine.begin() as conn:
+        rebuild_player_stats(conn)
+        match_ids = list(conn.scalars(select(Game.match_id).order_by(Game.match_id).limit(matches)))
+
+    report = {"players": players, "plays": plays}
+    for worker_count in sorted({1, workers}):
+        reset_grants()
+        report[f"backfill_{worker_count}_workers"] = await achievement_rules.backfill(chunk, worker_count)
+    report["backfill_rerun_nothing_new"] = await achievement_rules.backfill(chunk, workers)
+    with engine.connect() as conn:
+        report["achieves_rows"] = conn.scalar(select(func.count()).select_from(Achieves))
+
+    reset_grants()
+    report["end_game_handler_granting"] = await incremental(match_ids, batch)
+    report["end_game_handler_nothing_new"] = await incremental(match_ids, batch)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=100_000)
+    parser.add_argument("--plays", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=100, help="ended matches per handler call")
+    parser.add_argument("--matches", type=int, default=5000, help="ended matches replayed through the handler path")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.players, args.plays, args.workers, args.chunk, args.batch, args.matches)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Goodput past saturation with and without admission control.
+
+    python -m benchmarks.admission --rates 50,100,200,400 --duration 5
+
+Open-loop load on the in-process ASGI app: requests arrive at a fixed rate
+whether or not earlier ones finished, like real users, from 1000 client
+addresses (X-Forwarded-For). Half are GetPlayerStats, half AddPlayerToMatch
+into seeded open matches. On top of that one client hammers LoginPlayer with
+wrong passwords at --stuffing-rate, a credential-stuffing wave that burns
+bcrypt time.
+
+Goodput is the legitimate requests answered with a non-5xx, non-429 status
+within --slo-ms, per second. Late requests are still awaited, not
+cancelled: a server keeps working on a request whose client gave up, and
+that wasted work is what collapses goodput. Each rate runs twice: with admission control off,
+and with the default in-flight limit plus per-client rate limits on
+LoginPlayer and AddPlayerToMatch.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("admission")
+os.environ.setdefault("RATE_LIMIT_TRUST_FORWARDED", "1")
+os.environ.setdefault("RATE_LIMIT_ROUTES", "/players/LoginPlayer=1/5,/games/AddPlayerToMatch=5/10")
+
+import httpx
+from sqlalchemy import delete, insert
+
+from app import admission
+from app.config import ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT, RATE_LIMIT_ROUTES
+from app.database import engine
+from app.main import app
+from app.manage import migrate
+from app.models import Game, GameStatus, GameType, Plays
+from benchmarks.common import percentile
+from benchmarks.seed import seed_players
+
+PLAYERS = 2000
+CLIENTS = 1000
+MATCHES = 20_000
+
+
+def seed_matches():
+    # Empty public matches for AddPlayerToMatch to fill
+    with engine.begin() as conn:
+        conn.execute(insert(Game), [
+            {"match_id": f"adm{i}", "status": GameStatus.STARTED, "game_type": GameType.PUBLIC}
+            for i in range(MATCHES)
+        ])
+
+
+def reset_matches():
+    # Every run starts from the same empty matches
+    with engine.begin() as conn:
+        conn.execute(delete(Plays))
+
+
+def configure(enabled: bool):
+    if enabled:
+        admission.rate_limiter = admission.RateLimiter("", RATE_LIMIT_ROUTES, 100_000)
+        admission.concurrency_limiter = admission.ConcurrencyLimiter(
+            ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT,
+        )
+    else:
+        admission.rate_limiter = admission.RateLimiter("", [], 1)
+        admission.concurrency_limiter = admission.ConcurrencyLimiter(0, 0, 0)
+
+
+def legit_request(client, rng):
+    headers = {"X-Forwarded-For": f"10.0.{rng.randrange(CLIENTS) // 250}.{rng.randrange(250)}"}
+    username = f"p{rng.randrange(PLAYERS)}"
+    if rng.random() < 0.5:
+        return client.get(f"/stats/GetPlayerStats/{username}", headers=headers)
+    return client.post("/games/AddPlayerToMatch", headers=headers, json={
+        "username": username, "match_id": f"adm{rng.randrange(MATCHES)}", "team": rng.choice(["TEAM1", "TEAM2"]),
+    })
+
+
+def stuffing_request(client, rng):
+    return client.post("/players/LoginPlayer", headers={"X-Forwarded-For": "203.0.113.7"}, json={
+        "username": f"p{rng.randrange(PLAYERS)}", "password": "guess",
+    })
+
+
+async def timed(request):
+    start = time.perf_counter()
+    response = await request
+    return response.status_code, time.perf_counter() - start
+
+
+async def open_loop(rate: float, duration: float, make_request) -> list:
+    tasks, sent = [], 0
+    start = time.perf_counter()
+    while True:
+        now = time.perf_counter() - start
+        if now >= duration:
+            break
+        due = sent / rate
+        if due > now:
+            await asyncio.sleep(due - now)
+        tasks.append(asyncio.create_task(timed(make_request())))
+        sent += 1
+    return await asyncio.gather(*tasks)
+
+
+async def step(client, rate: float, stuffing_rate: float, duration: float, slo: float) -> dict:
+    rng = random.Random(23)
+    legit, stuffing = await asyncio.gather(
+        open_loop(rate, duration, lambda: legit_request(client, rng)),
+        open_loop(stuffing_rate, duration, lambda: stuffing_request(client, rng)),
+    )
+    good = [latency for status, latency in legit if status < 500 and status != 429 and latency <= slo]
+    statuses = {}
+    for status, _ in legit:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "offered_rps": rate,
+        "goodput_rps": round(len(good) / duration, 1),
+        "good_p50_ms": round(percentile(good, 50) * 1000, 1),
+        "good_p99_ms": round(percentile(good, 99) * 1000, 1),
+        "late": sum(1 for status, latency in legit if latency > slo),
+        "statuses": statuses,
+        "stuffing_attempts_served": sum(1 for status, _ in stuffing if status == 401),
+        "stuffing_rejected": sum(1 for status, _ in stuffing if status in (429, 503)),
+    }
+
+
+async def run(rates: list[float], stuffing_rate: float, duration: float, slo: float) -> dict:
+    migrate()
+    seed_players(PLAYERS)
+    seed_matches()
+    report = {"slo_ms": slo * 1000, "stuffing_rps": stuffing_rate, "without_admission": [], "with_admission": []}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for rate in rates:
+                for enabled, key in ((False, "without_admission"), (True, "with_admission")):
+                    reset_matches()
+                    configure(enabled)
+                    report[key].append(await step(client, rate, stuffing_rate, duration, slo))
+            report["admission_counters"] = admission.admission_stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", default="50,100,200,400", help="legitimate requests per second, comma separated")
+    parser.add_argument("--stuffing-rate", type=float, default=20.0)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--slo-ms", type=float, default=1000.0)
+    args = parser.parse_args()
+    rates = [float(rate) for rate in args.rates.split(",")]
+    print(json.dumps(asyncio.run(run(rates, args.stuffing_rate, args.duration, args.slo_ms / 1000)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Cost of proving identity: re-sending the password (a bcrypt verification
+through /players/LoginPlayer per request) against presenting the signed
+token LoginPlayer issued (an HMAC check in the `current_player` dependency).
+
+    python -m benchmarks.auth --clients 20 --duration 10
+
+The token requests go to /matchmaking/Dequeue, a gated endpoint that never
+touches the database, so they measure the authentication path itself. The
+player is not queued, so the expected answer is 404. Also reports the raw
+cost of one token verification against one bcrypt verification.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("auth")
+os.environ.setdefault("AUTH_REQUIRED", "1")
+
+import httpx
+
+from app.manage import migrate
+from app.main import app
+from app.tokens import tokens
+from app.utils import verify_password
+from benchmarks.common import summarize
+from benchmarks.seed import BENCH_PASSWORD, bench_password_hash, seed_players
+
+PLAYERS = 1000
+
+
+def per_call_us(call, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    return round((time.perf_counter() - start) / repeat * 1e6, 2)
+
+
+async def load(client, clients: int, duration: float, request) -> dict:
+    samples, statuses = [], {}
+    rng = random.Random(18)
+
+    async def client_loop(deadline):
+        while time.perf_counter() < deadline:
+            username = f"p{rng.randrange(PLAYERS)}"
+            start = time.perf_counter()
+            response = await request(username)
+            samples.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(start + duration) for _ in range(clients)))
+    report = summarize(samples, time.perf_counter() - start)
+    report["statuses"] = statuses
+    return report
+
+
+async def run(clients: int, duration: float) -> dict:
+    migrate()
+    seed_players(PLAYERS)
+    token = tokens.issue("p0")
+    report = {
+        "verify_token_us": per_call_us(lambda: tokens.verify(token), 10_000),
+        "verify_password_us": per_call_us(lambda: verify_password(BENCH_PASSWORD, bench_password_hash()), 5),
+    }
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            issued = {}
+            for i in range(PLAYERS):
+                issued[f"p{i}"] = {"Authorization": f"Bearer {tokens.issue(f'p{i}')}"}
+
+            report["password_per_request"] = await load(client, clients, duration, lambda username: client.post(
+                "/players/LoginPlayer", json={"username": username, "password": BENCH_PASSWORD},
+            ))
+            report["token_per_request"] = await load(client, clients, duration, lambda username: client.delete(
+                f"/matchmaking/Dequeue/{username}", headers=issued[username],
+            ))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.clients, args.duration)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
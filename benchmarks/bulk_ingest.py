@@ -0,0 +1,78 @@
+"""
+Throughput of the bulk endpoints in records per second: RegisterPlayers
+(bcrypt dominates, so the cost factor is configurable here) and
+AddPlayerAchievements, each fed NDJSON uploads of --batch records.
+
+    python -m benchmarks.bulk_ingest --players 5000 --batch 500 --bcrypt-rounds 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--achievements", type=int, default=20, help="achievements granted to every player")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    return parser.parse_args()
+
+
+async def upload(client, path: str, records: list[dict], batch: int) -> tuple[int, float]:
+    succeeded = 0
+    start = time.perf_counter()
+    for offset in range(0, len(records), batch):
+        body = "\n".join(json.dumps(record) for record in records[offset:offset + batch])
+        response = await client.post(path, content=body, headers={"content-type": "application/x-ndjson"})
+        succeeded += response.json()["succeeded"]
+    return succeeded, time.perf_counter() - start
+
+
+async def run(args) -> dict:
+    import httpx
+    from sqlalchemy import insert, select
+    from app.database import engine
+    from app.main import app
+    from app.manage import migrate
+    from app.models import Achievement
+    from benchmarks.common import player_payload
+    from benchmarks.seed import seed_players
+
+    migrate()
+    seed_players(1)  # makes sure icon 1 exists
+    with engine.begin() as conn:
+        conn.execute(insert(Achievement), [
+            {"name": f"Bulk {i}", "description": "Seeded for the bulk benchmark"} for i in range(args.achievements)
+        ])
+        achieve_ids = list(conn.scalars(select(Achievement.achieve_id).order_by(Achievement.achieve_id.desc()).limit(args.achievements)))
+
+    run_id = uuid.uuid4().hex[:6]
+    players = [player_payload(f"b{run_id}{i}", 1) for i in range(args.players)]
+    grants = [{"username": player["username"], "achieve_id": achieve_id} for player in players for achieve_id in achieve_ids]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        registered, register_seconds = await upload(client, "/players/RegisterPlayers", players, args.batch)
+        granted, grant_seconds = await upload(client, "/achievements/AddPlayerAchievements", grants, args.batch)
+
+    return {
+        "bcrypt_rounds": args.bcrypt_rounds,
+        "RegisterPlayers": {"records": registered, "records_per_second": round(registered / register_seconds)},
+        "AddPlayerAchievements": {"records": granted, "records_per_second": round(granted / grant_seconds)},
+    }
+
+
+def main():
+    args = parse_args()
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    from benchmarks.common import use_local_sqlite
+    use_local_sqlite("bulk_ingest")
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
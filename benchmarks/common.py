@@ -0,0 +1,60 @@
+import os
+import statistics
+import tempfile
+from datetime import date
+
+
+def use_local_sqlite(name: str) -> str:
+    # Point the app at a throwaway SQLite file unless DATABASE_URL is already set.
+    # Must run before anything from `app` is imported.
+    path = os.path.join(tempfile.gettempdir(), f"{name}.db")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{path}")
+    return path
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    # Nearest-rank percentile, samples do not need to be sorted
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: list[float], elapsed: float) -> dict:
+    # Latency samples are in seconds, reported in milliseconds
+    return {
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+    }
+
+
+def player_payload(username: str, icon_id: int, password: str = "benchpass") -> dict:
+    # RegisterPlayer insists the age matches the birth date
+    b_date = date(2000, 1, 1)
+    today = date.today()
+    age = today.year - b_date.year - ((today.month, today.day) < (b_date.month, b_date.day))
+    return {
+        "username": username,
+        "name": "Bench",
+        "gender": "Male",
+        "b_date": b_date.isoformat(),
+        "age": age,
+        "password": password,
+        "icon_id": icon_id,
+    }
+
+
+def current_rss_mb() -> float:
+    # Resident set size of this process right now (Linux), falls back to the peak
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
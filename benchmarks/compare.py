@@ -0,0 +1,111 @@
+"""
+Compare two benchmark suite reports and flag regressions per endpoint.
+
+    python -m benchmarks.compare before.json after.json --threshold 10
+
+An endpoint regresses when its p95 or p99 latency grows, or its throughput
+drops, by more than the threshold percent. It also regresses when its error
+rate (non-2xx responses) grows by more than --max-error-points percentage
+points, so an endpoint that got fast by failing is not taken for a speed-up.
+Endpoints with fewer than --min-requests samples in either run are reported
+but never flagged, they are too noisy to judge. Exits with status 1 when
+anything regressed so it can gate CI.
+"""
+import argparse
+import json
+import sys
+
+# metric -> True when a higher value is better
+METRICS = {
+    "throughput_rps": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "error_rate_pct": False,
+}
+GATED = ("throughput_rps", "p95_ms", "p99_ms", "error_rate_pct")
+# Compared in percentage points, a relative change from 0% errors means nothing
+ABSOLUTE = {"error_rate_pct"}
+
+
+def change_pct(before: float, after: float) -> float:
+    if not before:
+        return 0.0
+    return (after - before) / before * 100
+
+
+def with_error_rate(stats: dict) -> dict:
+    requests = stats["requests"]
+    return {**stats, "error_rate_pct": round(stats.get("errors", 0) / requests * 100, 2) if requests else 0.0}
+
+
+def compare(
+    before: dict, after: dict, threshold: float, min_requests: int, max_error_points: float = 1.0,
+) -> tuple[list[dict], list[dict]]:
+    rows, regressions = [], []
+    for scenario, result in after["scenarios"].items():
+        baseline = before["scenarios"].get(scenario)
+        if baseline is None:
+            continue
+        for endpoint, stats in result["endpoints"].items():
+            old = baseline["endpoints"].get(endpoint)
+            if old is None:
+                continue
+            old, stats = with_error_rate(old), with_error_rate(stats)
+            judged = min(old["requests"], stats["requests"]) >= min_requests
+            for metric, higher_is_better in METRICS.items():
+                if metric in ABSOLUTE:
+                    delta, limit = stats[metric] - old[metric], max_error_points
+                else:
+                    delta, limit = change_pct(old[metric], stats[metric]), threshold
+                worse = -delta if higher_is_better else delta
+                row = {
+                    "scenario": scenario,
+                    "endpoint": endpoint,
+                    "metric": metric,
+                    "before": old[metric],
+                    "after": stats[metric],
+                    "change_pct": round(delta, 1),
+                    "regressed": judged and metric in GATED and worse > limit,
+                }
+                rows.append(row)
+                if row["regressed"]:
+                    regressions.append(row)
+    return rows, regressions
+
+
+def print_table(rows: list[dict]):
+    print(f"{'scenario':<18} {'endpoint':<22} {'metric':<15} {'before':>10} {'after':>10} {'change':>8}")
+    for row in rows:
+        flag = "  REGRESSION" if row["regressed"] else ""
+        unit = "pp" if row["metric"] in ABSOLUTE else "%"
+        print(
+            f"{row['scenario']:<18} {row['endpoint']:<22} {row['metric']:<15} "
+            f"{row['before']:>10} {row['after']:>10} {row['change_pct']:>7}{unit}{flag}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed change in percent")
+    parser.add_argument("--min-requests", type=int, default=50)
+    parser.add_argument("--max-error-points", type=float, default=1.0, help="allowed error rate increase in percentage points")
+    parser.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    args = parser.parse_args()
+
+    with open(args.before) as before_file, open(args.after) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+
+    rows, regressions = compare(before, after, args.threshold, args.min_requests, args.max_error_points)
+    if args.json:
+        print(json.dumps({"threshold": args.threshold, "rows": rows, "regressions": regressions}, indent=2))
+    else:
+        print_table(rows)
+        print(f"\n{len(regressions)} regression(s) over {args.threshold}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
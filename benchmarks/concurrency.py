@@ -0,0 +1,212 @@
+"""
+Stress test of concurrent match writes: checks that the per-match
+invariants hold and that retried requests do their work once.
+
+    python -m benchmarks.concurrency --players 600 --matches 20 --role-changes 5
+
+Every player tries at once to join one of a few matches, far more players
+than seats. A share of them (--retry-share) retries with the same
+Idempotency-Key, both while the first request is still running and after
+it answered, as clients do after a timeout. Then every player that got in
+changes roles --role-changes times, all players concurrently.
+
+Afterwards the database must show:
+- at most six players per match, one plays row per successful join and no
+  row for a rejected one
+- no role held twice in a team and round
+- every player's roles as set by their last successful role change
+- every replayed response equal to the original
+The run is repeated with WRITE_RETRY_ATTEMPTS=1 (no retries) to show how
+many requests the retries save from a 409. The admission in-flight limit is
+off so every request reaches the database.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("concurrency")
+os.environ.setdefault("ADMISSION_MAX_IN_FLIGHT", "0")
+
+import httpx
+from sqlalchemy import delete, func, select
+
+from app.database import engine
+from app.idempotency import idempotency_cache
+from app.main import app
+from app.manage import migrate
+from app.models import Game, GameStatus, GameType, Plays, Role
+from app.retries import write_retries
+from benchmarks.seed import seed_players
+
+ROLES = [role.value for role in Role]
+
+
+def seed_matches(count: int) -> list[str]:
+    match_ids = [f"cc{i}" for i in range(count)]
+    with engine.begin() as conn:
+        conn.execute(delete(Plays).where(Plays.match_id.in_(match_ids)))
+        conn.execute(delete(Game).where(Game.match_id.in_(match_ids)))
+        conn.execute(Game.__table__.insert(), [
+            {"match_id": match_id, "status": GameStatus.STARTED, "game_type": GameType.PUBLIC}
+            for match_id in match_ids
+        ])
+    return match_ids
+
+
+async def join(client, rng, username: str, match_ids: list[str], retry_share: float) -> dict:
+    body = {"username": username, "match_id": rng.choice(match_ids), "team": rng.choice(["TEAM1", "TEAM2"])}
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    retries = rng.random() < retry_share
+
+    async def early_retry():
+        await asyncio.sleep(rng.uniform(0, 0.005))
+        return await client.post("/games/AddPlayerToMatch", json=body, headers=headers)
+
+    first, early = await asyncio.gather(
+        client.post("/games/AddPlayerToMatch", json=body, headers=headers),
+        early_retry() if retries else asyncio.sleep(0),
+    )
+    late = await client.post("/games/AddPlayerToMatch", json=body, headers=headers) if retries else None
+    return {"body": body, "first": first, "early": early if retries else None, "late": late}
+
+
+async def change_roles(client, rng, username: str, match_id: str, changes: int) -> dict:
+    # Sequential per player, so the last successful change is the final state
+    last, statuses = {}, []
+    for _ in range(changes):
+        response = await client.put("/games/ChangePlayerRole", json={
+            "username": username, "match_id": match_id, "round": rng.randint(1, 3), "role": rng.choice(ROLES),
+        })
+        statuses.append(response.status_code)
+        if response.status_code == 200:
+            last = response.json()["roles"]
+    return {"username": username, "match_id": match_id, "roles": last, "statuses": statuses}
+
+
+def count_statuses(statuses) -> dict:
+    counts = {}
+    for status in statuses:
+        counts[str(status)] = counts.get(str(status), 0) + 1
+    return counts
+
+
+def retries_of(result: dict) -> list:
+    return [response for response in (result["early"], result["late"]) if response is not None]
+
+
+def replays_of(result: dict) -> list:
+    return [response for response in retries_of(result) if response.headers.get("idempotent-replayed")]
+
+
+def role_name(role) -> str | None:
+    return role.value if role is not None else None
+
+
+async def run_once(client, players: int, matches: int, role_changes: int, retry_share: float, seed: int) -> dict:
+    rng = random.Random(seed)
+    match_ids = seed_matches(matches)
+    retries_before = write_retries.stats()
+
+    start = time.perf_counter()
+    joins = await asyncio.gather(*(
+        join(client, rng, f"p{i}", match_ids, retry_share) for i in range(players)
+    ))
+    join_seconds = time.perf_counter() - start
+    joined = {result["body"]["username"]: result["body"]["match_id"] for result in joins if result["first"].status_code == 200}
+
+    start = time.perf_counter()
+    roles = await asyncio.gather(*(
+        change_roles(client, rng, username, match_id, role_changes) for username, match_id in joined.items()
+    ))
+    role_seconds = time.perf_counter() - start
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(Plays.username, Plays.match_id, Plays.team, Plays.role1, Plays.role2, Plays.role3)
+            .where(Plays.match_id.in_(match_ids))
+        ).all()
+        largest_match = conn.scalar(
+            select(func.max(select(func.count()).where(Plays.match_id == Game.match_id).scalar_subquery()))
+            .where(Game.match_id.in_(match_ids))
+        )
+    stored = {row.username: row for row in rows}
+
+    taken, duplicate_roles = set(), 0
+    for row in rows:
+        for round_number, role in enumerate((row.role1, row.role2, row.role3), 1):
+            if role is not None:
+                slot = (row.match_id, row.team, round_number, role)
+                duplicate_roles += slot in taken
+                taken.add(slot)
+
+    checks = {
+        "max_players_per_match": largest_match,
+        "cap_held": largest_match <= 6,
+        "rows_match_successful_joins": set(stored) == set(joined)
+            and all(stored[username].match_id == match_id for username, match_id in joined.items()),
+        "no_duplicate_roles": duplicate_roles == 0,
+        "final_roles_match_last_change": all(
+            result["roles"] == {
+                "role1": role_name(stored[result["username"]].role1),
+                "role2": role_name(stored[result["username"]].role2),
+                "role3": role_name(stored[result["username"]].role3),
+            }
+            for result in roles if result["roles"]
+        ),
+        "replays_equal_original": all(
+            replay.content == result["first"].content for result in joins for replay in replays_of(result)
+        ),
+    }
+    retries_after = write_retries.stats()
+    return {
+        "checks": checks,
+        "all_passed": all(value for key, value in checks.items() if key != "max_players_per_match"),
+        "joins": {
+            "first_attempts": count_statuses(result["first"].status_code for result in joins),
+            "early_retries": count_statuses(result["early"].status_code for result in joins if result["early"]),
+            "late_retries": count_statuses(result["late"].status_code for result in joins if result["late"]),
+            "replayed": sum(len(replays_of(result)) for result in joins),
+            "seconds": round(join_seconds, 2),
+        },
+        "role_changes": {
+            "statuses": count_statuses(status for result in roles for status in result["statuses"]),
+            "seconds": round(role_seconds, 2),
+        },
+        "write_retries": retries_after["retries"] - retries_before["retries"],
+        "gave_up": retries_after["exhausted"] - retries_before["exhausted"],
+    }
+
+
+async def run(players: int, matches: int, role_changes: int, retry_share: float) -> dict:
+    migrate()
+    seed_players(players)
+    report = {"players": players, "seats": matches * 6}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            report["with_retries"] = await run_once(client, players, matches, role_changes, retry_share, seed=24)
+            attempts, write_retries.attempts = write_retries.attempts, 1
+            report["without_retries"] = await run_once(client, players, matches, role_changes, retry_share, seed=24)
+            write_retries.attempts = attempts
+        report["idempotency"] = idempotency_cache.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=600)
+    parser.add_argument("--matches", type=int, default=20)
+    parser.add_argument("--role-changes", type=int, default=5, help="role changes per player that got in")
+    parser.add_argument("--retry-share", type=float, default=0.3, help="share of joins retried with the same key")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.players, args.matches, args.role_changes, args.retry_share)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
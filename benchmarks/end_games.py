@@ -0,0 +1,73 @@
+"""
+Throughput of ending matches: the old per-match ORM loop (load plays, flip
+win_or_lose in Python, commit per match) against the set-based batch path
+used by /games/EndGame and /games/EndGames.
+
+    python -m benchmarks.end_games --matches 5000 --batch 500
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("end_games")
+
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal
+from app.manage import migrate
+from app.models import Game, GameResult, GameStatus, Plays, Team
+from app.routers.games import end_games
+from app.schemas.game import EndGameRequest
+from benchmarks.seed import seed_open_matches, seed_players
+
+
+async def orm_loop(match_ids: list[str]):
+    # The EndGame implementation before the set-based rewrite
+    async with AsyncSessionLocal() as db:
+        for match_id in match_ids:
+            game = await db.get(Game, match_id)
+            plays = (await db.execute(select(Plays).filter(Plays.match_id == match_id))).scalars().all()
+            for play in plays:
+                play.win_or_lose = GameResult.WIN if play.team == Team.TEAM1 else GameResult.LOSE
+            game.status = GameStatus.FINISHED
+            await db.commit()
+
+
+async def bulk(match_ids: list[str], batch: int):
+    requests = [EndGameRequest(match_id=match_id, team=Team.TEAM1, win_or_lose=GameResult.WIN) for match_id in match_ids]
+    async with AsyncSessionLocal() as db:
+        for start in range(0, len(requests), batch):
+            await end_games(db, requests[start:start + batch])
+
+
+async def run(matches: int, batch: int) -> dict:
+    migrate()
+    seed_players()
+    run_id = uuid.uuid4().hex[:8]
+    report = {}
+    for name, call in (
+        ("orm_loop", lambda ids: orm_loop(ids)),
+        ("set_based_batches", lambda ids: bulk(ids, batch)),
+    ):
+        match_ids = seed_open_matches(matches, f"{name}-{run_id}-")
+        start = time.perf_counter()
+        await call(match_ids)
+        elapsed = time.perf_counter() - start
+        report[name] = {"matches": matches, "seconds": round(elapsed, 2), "matches_per_second": round(matches / elapsed)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--matches", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.matches, args.batch)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
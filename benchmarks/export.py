@@ -0,0 +1,127 @@
+"""
+Rows per second and memory of the plays export, and page latency of the
+match-history endpoint.
+
+    python -m benchmarks.export --plays 1000000 --players 1000
+
+Streams every plays row through the ExportPlays handler as CSV, and as
+Arrow when pyarrow is installed, and one player's history as NDJSON for
+comparison. Reports rows/s, bytes per row and RSS growth sampled while
+streaming. The response bodies are iterated directly: httpx's ASGI
+transport would buffer the whole body first. Then walks one player's whole
+history page by page through the in-process ASGI app and reports page
+latency, which keyset pagination keeps flat however deep the page.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("export")
+
+import httpx
+
+from app.config import STREAM_BATCH_SIZE
+from app.database import AsyncSessionLocal
+from app.export import ExportFormat, pyarrow
+from app.main import app
+from app.manage import migrate
+from app.routers.players import get_match_history
+from app.routers.stats import export_plays
+from benchmarks.common import current_rss_mb, summarize
+from benchmarks.seed import seed_players, seed_plays
+
+
+def count_lines(chunk: bytes) -> int:
+    return chunk.count(b"\n")
+
+
+def arrow_batches(chunk: bytes) -> int:
+    # One record batch of STREAM_BATCH_SIZE rows per chunk (the last one may be short,
+    # the rows are taken from the database). Arrow chunks cannot be decoded on their
+    # own, the dictionaries only come with the first one
+    return STREAM_BATCH_SIZE if chunk else 0
+
+
+async def stream(handler, count_rows, sample_every: int, rows_total: int | None = None, **params) -> dict:
+    baseline = current_rss_mb()
+    peak, rows, size = baseline, 0, 0
+    next_sample = sample_every
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        response = await handler(db=db, **params)
+    async for chunk in response.body_iterator:
+        size += len(chunk)
+        rows += count_rows(chunk)
+        if rows >= next_sample:
+            peak = max(peak, current_rss_mb())
+            next_sample += sample_every
+    elapsed = time.perf_counter() - start
+    if rows_total is not None:
+        rows = rows_total
+    return {
+        "rows": rows,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(rows / elapsed),
+        "bytes_per_row": round(size / rows, 1) if rows else 0.0,
+        "rss_growth_mb": round(peak - baseline, 1),
+    }
+
+
+async def walk_history(client, username: str, limit: int) -> dict:
+    samples, pages, cursor = [], 0, None
+    start = time.perf_counter()
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["after"] = cursor
+        request_start = time.perf_counter()
+        response = await client.get(f"/players/{username}/history", params=params)
+        samples.append(time.perf_counter() - request_start)
+        pages += 1
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    report = summarize(samples, time.perf_counter() - start)
+    report["first_page_ms"] = round(samples[0] * 1000, 2)
+    report["last_page_ms"] = round(samples[-1] * 1000, 2)
+    return report
+
+
+async def run(plays: int, players: int, sample_every: int, limit: int) -> dict:
+    migrate()
+    seed_players(players)
+    rows = seed_plays(plays, players=players)
+    report = {"plays_rows": rows}
+    export = dict(after=None, until=None)
+    report["export_csv"] = await stream(export_plays, count_lines, sample_every, format=ExportFormat.CSV, **export)
+    report["export_csv"]["rows"] -= 1  # the header line
+    if pyarrow is not None:
+        report["export_arrow"] = await stream(
+            export_plays, arrow_batches, sample_every, rows_total=rows, format=ExportFormat.ARROW, **export,
+        )
+    # NDJSON of one player, for the per-row cost of the JSON path
+    report["history_ndjson_one_player"] = await stream(
+        get_match_history, count_lines, sample_every, username="p1", after=None, limit=0, stream=True,
+    )
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            report["history_pages"] = await walk_history(client, "p1", limit)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plays", type=int, default=1_000_000)
+    parser.add_argument("--players", type=int, default=1_000)
+    parser.add_argument("--sample-every", type=int, default=50_000)
+    parser.add_argument("--limit", type=int, default=100, help="history page size")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.plays, args.players, args.sample_every, args.limit)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Leaderboard queries on a large population: the in-memory ranked boards
+against the equivalent SQL over player_stats (ORDER BY ... LIMIT for top-N,
+COUNT(*) of better players for a rank, which scans without a dedicated index).
+
+    python -m benchmarks.leaderboard --players 1000000 --queries 1000
+
+Reports the snapshot load and board build times, then latency of top-100,
+rank with 5 neighbours and single-player updates (what EndGame does).
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from benchmarks.common import current_rss_mb, use_local_sqlite
+
+db_path = use_local_sqlite("leaderboard")
+
+from sqlalchemy import func, insert, select
+
+from app.manage import migrate
+from app.database import AsyncSessionLocal, engine
+from app.leaderboard import Leaderboard, LeaderboardMetric
+from app.models import PlayerStats, Role
+from benchmarks.common import summarize
+from benchmarks.seed import seed_players
+
+
+def seed_stats(players: int, batch: int = 50_000):
+    # Random careers: up to 500 games, role games/wins split out of the totals
+    rng = random.Random(13)
+    with engine.begin() as conn:
+        existing = conn.scalar(select(func.count()).select_from(PlayerStats))
+        for start in range(existing, players, batch):
+            rows = []
+            for i in range(start, min(start + batch, players)):
+                games = rng.randint(1, 500)
+                wins = rng.randint(0, games)
+                row = {"username": f"p{i}", "wins": wins, "losses": games - wins, "games_played": games}
+                for role in Role:
+                    role_games = rng.randint(0, games)
+                    row[f"{role.value.lower()}_games"] = role_games
+                    row[f"{role.value.lower()}_wins"] = min(wins, rng.randint(0, role_games))
+                rows.append(row)
+            conn.execute(insert(PlayerStats), rows)
+
+
+async def time_calls(call, args: list) -> dict:
+    samples = []
+    start = time.perf_counter()
+    for arg in args:
+        call_start = time.perf_counter()
+        await call(arg)
+        samples.append(time.perf_counter() - call_start)
+    return summarize(samples, time.perf_counter() - start)
+
+
+async def run(players: int, queries: int) -> dict:
+    migrate()
+    seed_players(players)
+    seed_stats(players)
+    usernames = [f"p{random.randrange(players)}" for _ in range(queries)]
+    report = {"players": players}
+
+    board = Leaderboard(max_age=3600)
+    rss_before = current_rss_mb()
+    async with AsyncSessionLocal() as db:
+        start = time.perf_counter()
+        await board.top(db, LeaderboardMetric.WINS, None, 0, 1)
+        report["load_and_build_wins_seconds"] = round(time.perf_counter() - start, 2)
+        start = time.perf_counter()
+        for metric in LeaderboardMetric:
+            for role in (None, *Role):
+                await board.top(db, metric, role, 0, 1)
+        report["build_all_boards_seconds"] = round(time.perf_counter() - start, 2)
+        report["rss_mb_for_all_boards"] = round(current_rss_mb() - rss_before)
+
+        memory = {}
+        memory["top100"] = await time_calls(
+            lambda _: board.top(db, LeaderboardMetric.WINS, None, 0, 100), usernames)
+        memory["top100_at_offset_500k"] = await time_calls(
+            lambda _: board.top(db, LeaderboardMetric.WINS, None, min(500_000, players // 2), 100), usernames)
+        memory["rank_and_neighbours"] = await time_calls(
+            lambda username: board.around(db, LeaderboardMetric.WIN_RATE, Role.MINER, username, 5), usernames)
+
+        async def update(username):
+            # One more won game, the way EndGame moves a player
+            stats = board._stats[username]
+            board.update([(username, (stats[0] + 1, stats[1] + 1, *stats[2:]))])
+
+        memory["update_all_boards"] = await time_calls(update, usernames)
+        report["in_memory"] = memory
+
+        wins = {username: (await db.execute(select(PlayerStats.wins).where(PlayerStats.username == username))).scalar()
+                for username in usernames[:100]}
+        sql = {}
+        sql["top100"] = await time_calls(lambda _: db.execute(
+            select(PlayerStats.username, PlayerStats.wins).order_by(PlayerStats.wins.desc(), PlayerStats.username).limit(100)
+        ), usernames[:20])
+        sql["rank"] = await time_calls(lambda username: db.execute(
+            select(func.count()).select_from(PlayerStats).where(PlayerStats.wins > wins[username])
+        ), usernames[:20])
+        report["sql"] = sql
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.players, args.queries)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+ChangePlayerRole latency with matches validated against the database (the
+default path) and against the in-memory live match registry with
+write-behind, over the in-process ASGI app.
+
+    python -m benchmarks.live_matches --matches 500 --clients 50 --duration 10
+
+Both runs use fresh matches with six players each. Clients pick random
+(player, round, role) triples, so a share of the requests are rejected role
+collisions, which exercise the same validation in both modes.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("live_matches")
+
+import httpx
+
+from app.manage import migrate
+from app.live_matches import live_matches
+from app.main import app
+from benchmarks.common import summarize
+from benchmarks.seed import PLAYERS, seed_open_matches, seed_players
+
+ROLES = ("MANAGER", "MINER", "WARRIOR")
+
+
+async def run_mode(enabled: bool, matches: int, clients: int, duration: float) -> dict:
+    live_matches.enabled = enabled
+    match_ids = seed_open_matches(matches, f"live-{enabled}-{uuid.uuid4().hex[:8]}-")
+    samples, statuses = [], {}
+    rng = random.Random(14)
+
+    async def client_loop(client, deadline):
+        while time.perf_counter() < deadline:
+            i = rng.randrange(matches)
+            username = f"p{(i * 6 + rng.randrange(6)) % PLAYERS}"
+            start = time.perf_counter()
+            response = await client.put("/games/ChangePlayerRole", json={
+                "username": username, "match_id": match_ids[i], "round": rng.randint(1, 3), "role": rng.choice(ROLES),
+            })
+            samples.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(client_loop(client, start + duration) for _ in range(clients)))
+            elapsed = time.perf_counter() - start
+    report = summarize(samples, elapsed)
+    report["statuses"] = statuses
+    if enabled:
+        report["registry"] = live_matches.stats()
+    return report
+
+
+async def run(matches: int, clients: int, duration: float) -> dict:
+    migrate()
+    seed_players()
+    return {
+        "database": await run_mode(False, matches, clients, duration),
+        "live_registry": await run_mode(True, matches, clients, duration),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--matches", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.matches, args.clients, args.duration)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Load benchmark for the API: N concurrent clients hammer a handful of read
+and write endpoints and the script prints p50/p99 latency per endpoint.
+
+Run it against a server started from the tree you want to measure, e.g.
+
+    python -m app.manage bootstrap
+    uvicorn app.main:app --port 8000
+    python -m benchmarks.load_latency --url http://localhost:8000 --clients 100
+
+Checking out the commit before the async port and running the same command
+gives the "before" numbers. Registration needs an existing icon row, pass
+its id with --icon-id.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+
+from benchmarks.common import player_payload, summarize
+
+
+async def seed(client: httpx.AsyncClient, players: int, icon_id: int) -> list[str]:
+    # Register a small population of players to read back during the run
+    usernames = []
+    for i in range(players):
+        username = f"bench{uuid.uuid4().hex[:10]}"
+        await client.post("/players/RegisterPlayer", json=player_payload(username, icon_id))
+        usernames.append(username)
+    return usernames
+
+
+async def client_loop(client, usernames, deadline, samples, worker_id):
+    i = worker_id
+    while time.perf_counter() < deadline:
+        username = usernames[i % len(usernames)]
+        i += 1
+        if i % 10 == 0:
+            name, call = "CreateMatch", client.post(
+                "/games/CreateMatch", params={"match_id": f"m{uuid.uuid4().hex[:16]}"})
+        elif i % 2 == 0:
+            name, call = "GetPlayerStats", client.get(f"/stats/GetPlayerStats/{username}")
+        else:
+            name, call = "GetPlayer", client.get("/players/GetPlayer", params={"username": username})
+        start = time.perf_counter()
+        await call
+        samples.setdefault(name, []).append(time.perf_counter() - start)
+
+
+async def run(url: str, clients: int, duration: float, players: int, icon_id: int) -> dict:
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        usernames = await seed(client, players, icon_id)
+        samples: dict[str, list[float]] = {}
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(
+            client_loop(client, usernames, deadline, samples, worker_id)
+            for worker_id in range(clients)
+        ))
+        elapsed = time.perf_counter() - start
+
+    report = {name: summarize(values, elapsed) for name, values in samples.items()}
+    report["all"] = summarize([v for values in samples.values() for v in values], elapsed)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--icon-id", type=int, default=1)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.url, args.clients, args.duration, args.players, args.icon_id))
+    print(json.dumps({"clients": args.clients, "endpoints": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Matchmaking simulation: N players enqueue concurrently through the in-process
+ASGI app and long-poll for their match. Reports how long players waited,
+matches formed per second, and how even the snake-drafted teams are.
+
+    python -m benchmarks.matchmaking --players 10000 --ramp 5
+
+--ramp spreads the enqueues over that many seconds (0 = all at once).
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("matchmaking")
+
+import httpx
+from sqlalchemy import select
+
+from app.manage import migrate, rebuild_stats
+from app.database import engine
+from app.main import app
+from app.matchmaking import matchmaking_queue
+from app.models import PlayerStats
+from benchmarks.common import summarize
+from benchmarks.seed import seed_players, seed_plays
+
+
+async def player(client, username: str, delay: float, waits: list, assignments: dict):
+    await asyncio.sleep(delay)
+    start = time.perf_counter()
+    response = await client.post("/matchmaking/Enqueue", params={"wait": 30}, json={"username": username})
+    while response.status_code == 200 and response.json()["status"] == "QUEUED":
+        response = await client.post("/matchmaking/Enqueue", params={"wait": 30}, json={"username": username})
+    if response.status_code == 200:
+        waits.append(time.perf_counter() - start)
+        assignments[username] = response.json()
+
+
+async def run(players: int, ramp: float) -> dict:
+    migrate()
+    seed_players(players)
+    seed_plays(players * 10, players)
+    rebuild_stats()
+    with engine.connect() as conn:
+        wins = dict(conn.execute(select(PlayerStats.username, PlayerStats.wins)).all())
+
+    # Leave any remainder that cannot fill a match out of the run
+    usernames = [f"p{i}" for i in range(players - players % 6)]
+    rng = random.Random(15)
+    waits, assignments = [], {}
+    limits = httpx.Limits(max_connections=None)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", limits=limits, timeout=120) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                player(client, username, rng.uniform(0, ramp), waits, assignments) for username in usernames
+            ))
+            elapsed = time.perf_counter() - start
+        stats = matchmaking_queue.stats()
+
+    # Team strength gap per match, in summed wins
+    matches = {assignment["match_id"]: assignment["players"] for assignment in assignments.values()}
+    gaps = []
+    for teams in matches.values():
+        totals = {"TEAM1": 0, "TEAM2": 0}
+        for username, team in teams.items():
+            totals[team] += wins.get(username, 0)
+        gaps.append(abs(totals["TEAM1"] - totals["TEAM2"]))
+    return {
+        "players": len(usernames),
+        "matched": len(assignments),
+        "matches": len(matches),
+        "seconds": round(elapsed, 2),
+        "matches_per_second": round(len(matches) / elapsed, 1),
+        "wait": summarize(waits, elapsed),
+        "team_wins_gap_mean": round(sum(gaps) / len(gaps), 2) if gaps else 0,
+        # Time from enqueue to assignment inside the server, without HTTP overhead
+        "queue_wait_mean_ms": round(stats["wait_seconds"]["sum"] / max(stats["wait_seconds"]["count"], 1) * 1000, 2),
+        "queue": {key: stats[key] for key in ("matches_created", "failed_batches", "queued")},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=10_000)
+    parser.add_argument("--ramp", type=float, default=0.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.players, args.ramp)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+EndGame latency as post-game work grows, and how fast the outbox drains.
+
+    python -m benchmarks.outbox --matches 300 --clients 10 --events 50000
+
+Ends matches through the in-process ASGI app with 0, 1 and 4 extra
+game_ended handlers that each cost --handler-ms per batch. The work runs in
+the outbox consumer, so EndGame latency should not move. Also reports
+consumer lag after the run, and the raw drain rate over --events queued
+events with a no-op handler.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("outbox")
+
+import httpx
+from sqlalchemy import insert
+
+from app.database import engine
+from app.main import app
+from app.manage import add_rule_achievements, migrate
+from app.models import OutboxEvent
+from app.outbox import outbox, GAME_ENDED
+from benchmarks.common import summarize
+from benchmarks.seed import seed_open_matches, seed_players
+
+BENCH_EVENT = "bench_event"
+
+
+def slow_handler(cost: float):
+    async def handle(db, events):
+        await asyncio.sleep(cost)
+    return handle
+
+
+async def end_matches(client, match_ids: list[str], clients: int) -> dict:
+    samples, pending = [], list(match_ids)
+
+    async def client_loop():
+        while pending:
+            match_id = pending.pop()
+            start = time.perf_counter()
+            await client.put("/games/EndGame", json={"match_id": match_id, "team": "TEAM1", "win_or_lose": "WIN"})
+            samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(clients)))
+    return summarize(samples, time.perf_counter() - start)
+
+
+async def wait_drained(timeout: float = 120) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        await outbox.refresh_lag()
+        if not outbox.pending:
+            break
+        await asyncio.sleep(0.05)
+    return round(time.perf_counter() - start, 2)
+
+
+async def drain_rate(events: int) -> dict:
+    outbox.handler(BENCH_EVENT)(slow_handler(0))
+    with engine.begin() as conn:
+        conn.execute(insert(OutboxEvent), [{"event_type": BENCH_EVENT, "payload": {"n": i}} for i in range(events)])
+    start = time.perf_counter()
+    while await outbox.drain_once():
+        pass
+    elapsed = time.perf_counter() - start
+    return {"events": events, "seconds": round(elapsed, 2), "events_per_second": round(events / elapsed)}
+
+
+async def run(matches: int, clients: int, events: int, handler_ms: float) -> dict:
+    migrate()
+    await add_rule_achievements()
+    seed_players()
+    # Seeded up front: the sync seeding would block the loop while the consumer holds SQLite's write lock
+    runs = {handlers: seed_open_matches(matches, f"outbox-{uuid.uuid4().hex[:8]}-") for handlers in (0, 1, 4)}
+    report = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            registered = 0
+            for handlers, match_ids in runs.items():
+                while registered < handlers:
+                    outbox.handler(GAME_ENDED)(slow_handler(handler_ms / 1000))
+                    registered += 1
+                result = await end_matches(client, match_ids, clients)
+                await outbox.refresh_lag()
+                result["outbox_pending_after_run"] = outbox.pending
+                result["outbox_lag_seconds_after_run"] = outbox.oldest_pending_seconds
+                result["seconds_to_drain"] = await wait_drained()
+                report[f"end_game_with_{handlers}_extra_handlers"] = result
+        await outbox.stop()
+        report["drain"] = await drain_rate(events)
+    report["consumer"] = {key: value for key, value in outbox.stats().items() if key != "batch_seconds"}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--matches", type=int, default=300)
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--events", type=int, default=50_000)
+    parser.add_argument("--handler-ms", type=float, default=50.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.matches, args.clients, args.events, args.handler_ms)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
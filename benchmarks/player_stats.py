@@ -0,0 +1,79 @@
+"""
+Compares the old GetPlayerStats aggregation (GROUP BY over every plays row of
+the player) with the player_stats primary key lookup, on a seeded dataset
+where each player has a long career.
+
+    python -m benchmarks.player_stats --plays 1000000 --players 1000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("player_stats")
+
+from sqlalchemy import func, select
+
+from app.aggregates import rebuild_player_stats
+from app.database import AsyncSessionLocal, engine
+from app.manage import migrate
+from app.models import PlayerStats, Plays
+from benchmarks.common import summarize
+from benchmarks.seed import seed_players, seed_plays
+
+
+async def time_query(make_statement, usernames: list[str]) -> dict:
+    samples = []
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        for username in usernames:
+            query_start = time.perf_counter()
+            (await db.execute(make_statement(username))).all()
+            samples.append(time.perf_counter() - query_start)
+    return summarize(samples, time.perf_counter() - start)
+
+
+async def run(plays: int, players: int, lookups: int) -> dict:
+    migrate()
+    seed_players(players)
+    rows = seed_plays(plays, players=players)
+
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        rebuild_player_stats(conn)
+    rebuild_seconds = time.perf_counter() - start
+
+    usernames = [f"p{random.randrange(players)}" for _ in range(lookups)]
+    group_by = await time_query(
+        lambda username: select(func.count(Plays.win_or_lose), Plays.win_or_lose)
+        .filter(Plays.username == username)
+        .group_by(Plays.win_or_lose),
+        usernames,
+    )
+    primary_key = await time_query(
+        lambda username: select(PlayerStats).filter(PlayerStats.username == username),
+        usernames,
+    )
+    return {
+        "plays_rows": rows,
+        "plays_per_player": rows // players,
+        "rebuild_seconds": round(rebuild_seconds, 2),
+        "group_by_over_plays": group_by,
+        "player_stats_lookup": primary_key,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plays", type=int, default=1_000_000)
+    parser.add_argument("--players", type=int, default=1_000)
+    parser.add_argument("--lookups", type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.plays, args.players, args.lookups)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Data-size benchmark for the plays indexes. Seeds the plays table in steps
+(default up to 1M rows) and, at each step, times AddPlayerToMatch,
+ChangePlayerRole and EndGame on fresh matches. With the indexes in place the
+per-request latency should stay flat as the table grows.
+
+    python -m benchmarks.plays_scale --steps 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("plays_scale")
+
+import httpx
+
+from app.main import app
+from app.manage import migrate
+from app.models import Role
+from benchmarks.common import summarize
+from benchmarks.seed import PLAYERS, seed_players, seed_plays
+
+ROLES = list(Role)
+
+async def probe(client: httpx.AsyncClient, matches: int, counter) -> dict:
+    samples: dict[str, list[float]] = {}
+
+    async def timed(name, call):
+        start = time.perf_counter()
+        response = await call
+        samples.setdefault(name, []).append(time.perf_counter() - start)
+        return response
+
+    start = time.perf_counter()
+    for _ in range(matches):
+        match_id = f"probe{next(counter)}"
+        await client.post("/games/CreateMatch", params={"match_id": match_id})
+        for slot in range(6):
+            await timed("AddPlayerToMatch", client.post("/games/AddPlayerToMatch", json={
+                "username": f"p{slot}", "match_id": match_id, "team": "TEAM1" if slot < 3 else "TEAM2",
+            }))
+        for slot in range(6):
+            await timed("ChangePlayerRole", client.put("/games/ChangePlayerRole", json={
+                "username": f"p{slot}", "match_id": match_id, "round": 1, "role": ROLES[slot % 3].value,
+            }))
+        await timed("EndGame", client.put("/games/EndGame", json={
+            "match_id": match_id, "team": "TEAM1", "win_or_lose": "WIN",
+        }))
+    elapsed = time.perf_counter() - start
+    return {name: summarize(values, elapsed) for name, values in samples.items()}
+
+
+async def run(steps: list[int], matches: int) -> list[dict]:
+    migrate()
+    seed_players(PLAYERS)
+    counter = itertools.count(int(time.time()))
+    report = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for step in steps:
+            start = time.perf_counter()
+            rows = seed_plays(step)
+            seed_seconds = time.perf_counter() - start
+            report.append({
+                "plays_rows": rows,
+                "seed_seconds": round(seed_seconds, 1),
+                "endpoints": await probe(client, matches, counter),
+            })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--matches", type=int, default=20, help="probe matches per step")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.steps, args.matches)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Pool saturation stress test. Opens far more concurrent checkouts than the
+pool allows against a local SQLite file (or any DATABASE_URL) and reports
+the pool telemetry: peak checked-out connections, overflow use, checkout
+waits, timeouts and connection churn.
+
+    python -m benchmarks.pool_saturation --tasks 200 --pool-size 5 --max-overflow 5
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import use_local_sqlite
+
+use_local_sqlite("pool_saturation")
+
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.database import ASYNC_DATABASE_URL, create_pooled_async_engine
+from app.metrics import PoolMetrics
+from benchmarks.common import summarize
+
+
+async def worker(engine, metrics: PoolMetrics, hold: float, latencies: list[float]):
+    start = time.perf_counter()
+    try:
+        async with metrics.measure_wait():
+            conn = await engine.connect()
+    except PoolTimeoutError:
+        return
+    try:
+        await conn.execute(text("SELECT 1"))
+        await asyncio.sleep(hold)
+    finally:
+        await conn.close()
+    latencies.append(time.perf_counter() - start)
+
+
+async def run(args) -> dict:
+    metrics = PoolMetrics()
+    engine = create_pooled_async_engine(
+        ASYNC_DATABASE_URL,
+        metrics,
+        pool_size=args.pool_size,
+        max_overflow=args.max_overflow,
+        pool_timeout=args.pool_timeout,
+        pool_recycle=args.pool_recycle,
+    )
+    latencies: list[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(engine, metrics, args.hold, latencies) for _ in range(args.tasks)))
+    elapsed = time.perf_counter() - start
+    report = {
+        "tasks": args.tasks,
+        "completed": len(latencies),
+        "latency": summarize(latencies, elapsed),
+        "pool": metrics.snapshot(),
+    }
+    await engine.dispose()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--hold", type=float, default=0.05, help="seconds each task keeps its connection")
+    parser.add_argument("--pool-size", type=int, default=5)
+    parser.add_argument("--max-overflow", type=int, default=5)
+    parser.add_argument("--pool-timeout", type=float, default=0.5)
+    parser.add_argument("--pool-recycle", type=int, default=-1)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
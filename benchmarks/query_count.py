@@ -0,0 +1,81 @@
+"""
+Counts SQL statements per request for the match write paths
+(CreateMatch, AddPlayerToMatch, ChangePlayerRole) by listening to the
+engine's cursor events while the app is driven in-process.
+
+    python -m benchmarks.query_count --matches 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("query_count")
+
+import httpx
+from sqlalchemy import event
+
+from app.database import SessionLocal, async_engine
+from app.main import app
+from app.manage import migrate
+from app.models import Icon
+from benchmarks.common import player_payload
+
+statements: list[str] = []
+
+
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+
+async def measure(client: httpx.AsyncClient, counts: dict, name: str, call):
+    statements.clear()
+    response = await call
+    counts.setdefault(name, []).append(len(statements))
+    return response
+
+
+async def run(matches: int) -> dict:
+    migrate()
+    with SessionLocal() as db:
+        if not db.get(Icon, 1):
+            db.add(Icon(icon_id=1, icon_name="bench"))
+            db.commit()
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_statement)
+    counts: dict[str, list[int]] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(6):
+            await client.post("/players/RegisterPlayer", json=player_payload(f"qc{i}", 1))
+        for m in range(matches):
+            match_id = f"qc-{os.getpid()}-{m}"
+            await measure(client, counts, "CreateMatch", client.post("/games/CreateMatch", params={"match_id": match_id}))
+            for i in range(6):
+                await measure(client, counts, "AddPlayerToMatch", client.post("/games/AddPlayerToMatch", json={
+                    "username": f"qc{i}", "match_id": match_id, "team": "TEAM1" if i < 3 else "TEAM2",
+                }))
+            for i, role in enumerate(["MANAGER", "MINER", "WARRIOR"] * 2):
+                await measure(client, counts, "ChangePlayerRole", client.put("/games/ChangePlayerRole", json={
+                    "username": f"qc{i}", "match_id": match_id, "round": 1, "role": role,
+                }))
+    event.remove(async_engine.sync_engine, "before_cursor_execute", count_statement)
+
+    return {
+        name: {"requests": len(values), "statements_per_request": statistics.fmean(values), "max": max(values)}
+        for name, values in counts.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--matches", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.matches)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
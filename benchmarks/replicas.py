@@ -0,0 +1,120 @@
+"""
+Read-replica routing over the in-process ASGI app with local SQLite files:
+the primary, two replicas copied from it after seeding (a replication
+snapshot that never catches up), and one unreachable replica to exercise
+failover.
+
+    python -m benchmarks.replicas --clients 50 --duration 10
+
+Checks read-your-writes (a freshly registered player is readable at once
+although the replicas never see it) and compares a mixed read/write load
+with reads spread over the replicas against everything on the primary.
+On one machine SQLite replicas share the CPU, so the point is the routing
+and the per-replica spread rather than raw throughput.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("replicas")
+replica_paths = [os.path.join(tempfile.gettempdir(), f"replicas_r{i}.db") for i in range(2)]
+os.environ.setdefault("DATABASE_REPLICA_URLS", ",".join(
+    [f"sqlite:///{path}" for path in replica_paths] + ["sqlite:////nonexistent-dir/replica.db"]
+))
+
+import httpx
+
+from app.cache import invalidate_player
+from app.manage import migrate
+from app.main import app
+from app.replicas import replicas
+from benchmarks.common import player_payload, summarize
+from benchmarks.seed import seed_achievements, seed_players
+
+PLAYERS = 2000
+
+
+async def read_your_writes(client) -> dict:
+    username = f"ryw{random.randrange(10**9)}"
+    registered = await client.post("/players/RegisterPlayer", json=player_payload(username, 1))
+    own_read = await client.get("/players/GetPlayer", params={"username": username})
+    # Forget the write (and the cached profile): the read now lands on a replica that never saw the player
+    replicas._written.clear()
+    invalidate_player(username)
+    replica_read = await client.get("/players/GetPlayer", params={"username": username})
+    return {
+        "register": registered.status_code,
+        "read_after_own_write": own_read.status_code,
+        "read_from_lagging_replica": replica_read.status_code,
+    }
+
+
+async def load(client, clients: int, duration: float) -> dict:
+    samples, statuses = [], {}
+    rng = random.Random(17)
+
+    async def client_loop(deadline):
+        while time.perf_counter() < deadline:
+            username = f"p{rng.randrange(PLAYERS)}"
+            pick = rng.random()
+            start = time.perf_counter()
+            if pick < 0.1:
+                response = await client.post("/achievements/AddPlayerAchievement", params={
+                    "achievement_id": rng.randint(1, 100), "username": username,
+                })
+            elif pick < 0.4:
+                response = await client.get("/players/GetPlayer", params={"username": username})
+            elif pick < 0.7:
+                response = await client.get(f"/stats/GetPlayerStats/{username}")
+            else:
+                response = await client.get("/achievements/GetPlayerAchievements", params={"username": username})
+            samples.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(start + duration) for _ in range(clients)))
+    report = summarize(samples, time.perf_counter() - start)
+    report["statuses"] = statuses
+    return report
+
+
+async def run(clients: int, duration: float) -> dict:
+    migrate()
+    seed_players(PLAYERS)
+    seed_achievements(100, 2, players=PLAYERS)
+    for path in replica_paths:
+        shutil.copyfile(db_path, path)
+
+    report = {}
+    configured = replicas.replicas
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            report["read_your_writes"] = await read_your_writes(client)
+            report["with_replicas"] = await load(client, clients, duration)
+            report["routing"] = replicas.stats()
+            for replica in report["routing"]["replicas"].values():
+                del replica["db_pool"]
+            replicas.replicas = []
+            report["primary_only"] = await load(client, clients, duration)
+            replicas.replicas = configured
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.clients, args.duration)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
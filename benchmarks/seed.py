@@ -0,0 +1,98 @@
+"""
+Direct-to-database seeding helpers shared by the benchmarks. Import this only
+after `benchmarks.common.use_local_sqlite` so the app picks up the right database.
+Players are named p0, p1, ... with password BENCH_PASSWORD and all use icon 1.
+"""
+from functools import lru_cache
+
+from sqlalchemy import func, insert, select
+
+from app.database import engine
+from app.models import Achievement, Achieves, Game, GameResult, Gender, GameStatus, GameType, Icon, Player, Plays, Role, Team
+from app.utils import hash_password
+
+PLAYERS = 10_000
+ROLES = list(Role)
+BENCH_PASSWORD = "benchpass"
+
+
+@lru_cache(maxsize=1)
+def bench_password_hash() -> str:
+    # One real bcrypt hash shared by every seeded player, so logins work
+    return hash_password(BENCH_PASSWORD)
+
+
+def seed_players(count: int = PLAYERS, batch: int = 50_000):
+    with engine.begin() as conn:
+        if conn.scalar(select(Icon.icon_id).where(Icon.icon_id == 1)) is None:
+            conn.execute(insert(Icon), [{"icon_id": 1, "icon_name": "bench"}])
+        existing = conn.scalar(select(func.count()).select_from(Player).where(Player.username.like("p%")))
+        password = bench_password_hash() if existing < count else None
+        for start in range(existing, count, batch):
+            conn.execute(insert(Player), [
+                {"username": f"p{i}", "name": "Bench", "gender": Gender.Male, "password": password, "icon_id": 1}
+                for i in range(start, min(start + batch, count))
+            ])
+
+
+def seed_plays(target: int, players: int = PLAYERS, batch: int = 60_000):
+    # Six players per finished match, roles spread over both teams, TEAM1 wins every other match
+    with engine.begin() as conn:
+        current = conn.scalar(select(func.count()).select_from(Plays))
+        match_no = conn.scalar(select(func.count()).select_from(Game))
+        while current < target:
+            games, plays = [], []
+            for _ in range(min(batch, target - current) // 6 or 1):
+                match_id = f"seed{match_no}"
+                games.append({"match_id": match_id, "status": GameStatus.FINISHED, "game_type": GameType.PUBLIC})
+                for slot in range(6):
+                    team1 = slot < 3
+                    plays.append({
+                        "username": f"p{(match_no * 6 + slot) % players}",
+                        "match_id": match_id,
+                        "team": Team.TEAM1 if team1 else Team.TEAM2,
+                        "role1": ROLES[slot % 3],
+                        "role2": ROLES[(slot + 1) % 3],
+                        "role3": ROLES[(slot + 2) % 3],
+                        "win_or_lose": GameResult.WIN if team1 == (match_no % 2 == 0) else GameResult.LOSE,
+                    })
+                match_no += 1
+            conn.execute(insert(Game), games)
+            conn.execute(insert(Plays), plays)
+            current += len(plays)
+    return current
+
+
+def seed_open_matches(count: int, prefix: str, players: int = PLAYERS) -> list[str]:
+    # STARTED matches with six players each and no result yet
+    match_ids = [f"{prefix}{i}" for i in range(count)]
+    with engine.begin() as conn:
+        conn.execute(insert(Game), [
+            {"match_id": match_id, "status": GameStatus.STARTED, "game_type": GameType.PUBLIC}
+            for match_id in match_ids
+        ])
+        conn.execute(insert(Plays), [
+            {
+                "username": f"p{(i * 6 + slot) % players}",
+                "match_id": match_id,
+                "team": Team.TEAM1 if slot < 3 else Team.TEAM2,
+            }
+            for i, match_id in enumerate(match_ids)
+            for slot in range(6)
+        ])
+    return match_ids
+
+
+def seed_achievements(count: int, grants_per_player: int = 0, players: int = PLAYERS):
+    # A catalog of `count` achievements, each seeded player owning the first `grants_per_player`
+    with engine.begin() as conn:
+        existing = conn.scalar(select(func.count()).select_from(Achievement))
+        if existing < count:
+            conn.execute(insert(Achievement), [
+                {"name": f"Achievement {i}", "description": "Seeded for benchmarks"} for i in range(existing, count)
+            ])
+        achieve_ids = list(conn.scalars(select(Achievement.achieve_id).order_by(Achievement.achieve_id).limit(grants_per_player)))
+        if achieve_ids and not conn.scalar(select(func.count()).select_from(Achieves)):
+            conn.execute(insert(Achieves), [
+                {"username": f"p{i}", "achieve_id": achieve_id} for i in range(players) for achieve_id in achieve_ids
+            ])
@@ -0,0 +1,103 @@
+"""
+Serialization cost per 1k rows for the hot read endpoints: the response_model
+path (ORM objects validated into PlayerOut / AchievementOut by FastAPI, then
+rendered by the default response class) against the fast path (selected
+columns as row tuples, rendered by FastJSONResponse).
+
+    python -m benchmarks.serialization --rows 1000 --repeat 200
+
+Fetch and serialization are timed separately, and both paths must produce
+byte-identical bodies.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("serialization")
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy import select
+
+from app.manage import migrate
+from app.database import AsyncSessionLocal
+from app.models import Achievement, Player
+from app.profiling import ProfiledJSONResponse
+from app.responses import FastJSONResponse, orjson, row_dicts
+from app.routers.achievements import ACHIEVEMENT_COLUMNS
+from app.routers.players import PLAYER_OUT_COLUMNS
+from app.schemas.achievement import AchievementOut
+from app.schemas.player import PlayerOut
+from benchmarks.seed import seed_achievements, seed_players
+
+
+async def time_per_1k(call, rows: int, repeat: int) -> float:
+    # Best of `repeat`, in microseconds per 1000 rows
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await call()
+        best = min(best, time.perf_counter() - start)
+    return round(best / rows * 1000 * 1e6, 1)
+
+
+async def compare(db, model, schema, columns, rows: int, repeat: int) -> dict:
+    field = create_model_field(name="Response", type_=list[schema], mode="serialization")
+    objects = list((await db.execute(select(model).limit(rows))).scalars())
+    tuples = (await db.execute(select(*columns).limit(rows))).all()
+
+    async def orm_render():
+        content = await serialize_response(field=field, response_content=objects)
+        return ProfiledJSONResponse(content).body
+
+    async def fast_render():
+        return FastJSONResponse(row_dicts(tuples[0]._fields, tuples)).body
+
+    if await orm_render() != await fast_render():
+        raise SystemExit(f"{model.__name__}: fast path body differs from the response_model body")
+
+    async def orm_fetch():
+        db.expunge_all()  # otherwise the identity map hands back the same objects
+        (await db.execute(select(model).limit(rows))).scalars().all()
+
+    async def fast_fetch():
+        (await db.execute(select(*columns).limit(rows))).all()
+
+    return {
+        "rows": len(objects),
+        "response_model": {
+            "fetch_us_per_1k": await time_per_1k(orm_fetch, len(objects), repeat),
+            "serialize_us_per_1k": await time_per_1k(orm_render, len(objects), repeat),
+        },
+        "fast_json": {
+            "fetch_us_per_1k": await time_per_1k(fast_fetch, len(objects), repeat),
+            "serialize_us_per_1k": await time_per_1k(fast_render, len(objects), repeat),
+        },
+    }
+
+
+async def run(rows: int, repeat: int) -> dict:
+    migrate()
+    seed_players(rows)
+    seed_achievements(rows)
+    async with AsyncSessionLocal() as db:
+        return {
+            "encoder": "orjson" if orjson is not None else "json",
+            "players": await compare(db, Player, PlayerOut, PLAYER_OUT_COLUMNS, rows, repeat),
+            "achievements": await compare(db, Achievement, AchievementOut, ACHIEVEMENT_COLUMNS, rows, repeat),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.rows, args.repeat)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Import-to-first-request latency of a fresh worker process.
+
+    python -m benchmarks.startup --runs 5 --rtt-ms 2
+
+Each run starts a new interpreter that imports app.main, enters the
+lifespan and sends two requests through the in-process ASGI app:
+GetAllAchievements (catalog cache) and GetPlayer (needs a pool connection).
+Modes:
+- import_create_all: what importing app.main used to do, create_all right
+  after the import, no warm-up
+- cold: no schema work at import, warm-up disabled
+- warm: no schema work at import, the lifespan warms the pool and catalogs
+Also checks that app.main imports with no DATABASE_URL at all.
+
+Reported values are medians over --runs. SQL statements are counted from
+process start until the lifespan has finished, i.e. before serving. On a
+local SQLite file connects and statements are nearly free, --rtt-ms adds
+the round trips a remote database would charge. The emulated delay blocks
+the event loop, so the warm-up's concurrent connects add up here instead of
+overlapping as they would over a network.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("startup")
+
+MODES = {
+    "import_create_all": {"STARTUP_WARM_CONNECTIONS": "0", "STARTUP_WARM_CACHES": "0"},
+    "cold": {"STARTUP_WARM_CONNECTIONS": "0", "STARTUP_WARM_CACHES": "0"},
+    "warm": {},
+}
+
+
+def child(mode: str, rtt: float):
+    # Runs in the fresh process. Nothing from `app` is imported before this point
+    start = time.perf_counter()
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.pool import Pool
+    statements = []
+
+    def on_statement(*args):
+        statements.append(args[2])
+        time.sleep(rtt)
+
+    event.listen(Engine, "before_cursor_execute", on_statement)
+    event.listen(Pool, "connect", lambda *args: time.sleep(rtt * 3))  # TCP, auth and session setup
+
+    from app.main import app
+    if mode == "no_database_url":
+        print(json.dumps({"imported": True, "import_ms": round((time.perf_counter() - start) * 1000, 1)}))
+        return
+    if mode == "import_create_all":
+        from app.database import get_engine
+        from app.models import Base
+        Base.metadata.create_all(bind=get_engine())
+    imported = time.perf_counter()
+
+    async def serve() -> dict:
+        import httpx
+        async with app.router.lifespan_context(app):
+            ready = time.perf_counter()
+            before_serving = len(statements)
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                request_start = time.perf_counter()
+                catalog = await client.get("/achievements/GetAllAchievements")
+                catalog_done = time.perf_counter()
+                player = await client.get("/players/GetPlayer", params={"username": "p1"})
+                player_done = time.perf_counter()
+        return {
+            "import_ms": (imported - start) * 1000,
+            "lifespan_ms": (ready - imported) * 1000,
+            "first_catalog_request_ms": (catalog_done - request_start) * 1000,
+            "first_player_request_ms": (player_done - catalog_done) * 1000,
+            "import_to_first_response_ms": (player_done - start) * 1000,
+            "statements_before_serving": before_serving,
+            "statuses": [catalog.status_code, player.status_code],
+        }
+
+    print(json.dumps(asyncio.run(serve())))
+
+
+def spawn(mode: str, env: dict, rtt_ms: float) -> dict:
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child", mode, "--rtt-ms", str(rtt_ms)],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_start_to_exit_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def run(runs: int, rtt_ms: float) -> dict:
+    from app.manage import bootstrap
+    from benchmarks.seed import seed_achievements, seed_players
+
+    bootstrap()
+    seed_players(100)
+    seed_achievements(50)
+
+    report = {"rtt_ms": rtt_ms}
+    base_env = {**os.environ, "SLOW_REQUEST_MS": "1e9", "OUTBOX_CONSUMER": "0"}
+    for mode, overrides in MODES.items():
+        results = [spawn(mode, {**base_env, **overrides}, rtt_ms) for _ in range(runs)]
+        report[mode] = {
+            key: round(statistics.median(result[key] for result in results), 1)
+            for key in results[0] if key != "statuses"
+        }
+        report[mode]["statuses"] = results[0]["statuses"]
+    report["no_database_url"] = spawn("no_database_url", {**base_env, "DATABASE_URL": ""}, rtt_ms)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="emulated database round trip, added to every statement and 3x to every connect")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.rtt_ms / 1000)
+    else:
+        print(json.dumps(run(args.runs, args.rtt_ms), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Memory profile of the NDJSON streaming mode. Seeds the achievements table
+with 500k rows, consumes /achievements/GetAllAchievements?stream=true and
+samples RSS as rows arrive. RSS should stay flat instead of growing with
+the row count.
+
+    python -m benchmarks.stream_memory --rows 500000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import use_local_sqlite
+
+db_path = use_local_sqlite("stream_memory")
+
+from sqlalchemy import func, insert, select
+
+from app.database import AsyncSessionLocal, engine
+from app.manage import migrate
+from app.models import Achievement
+from app.routers.achievements import get_all_achievements
+from benchmarks.common import current_rss_mb
+
+
+def seed_achievements(rows: int, batch: int = 50_000):
+    with engine.begin() as conn:
+        current = conn.scalar(select(func.count()).select_from(Achievement))
+        while current < rows:
+            size = min(batch, rows - current)
+            conn.execute(insert(Achievement), [
+                {"name": f"Achievement {current + i}", "description": "Seeded for the streaming benchmark"}
+                for i in range(size)
+            ])
+            current += size
+
+
+async def run(rows: int, sample_every: int) -> dict:
+    migrate()
+    seed_achievements(rows)
+    baseline = current_rss_mb()
+    samples = []
+    received = 0
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        response = await get_all_achievements(stream=True, db=db)
+    async for chunk in response.body_iterator:
+        lines = chunk.count(b"\n")
+        if (received + lines) // sample_every > received // sample_every:
+            samples.append({"rows": received + lines, "rss_mb": round(current_rss_mb(), 1)})
+        received += lines
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": received,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(received / elapsed),
+        "baseline_rss_mb": round(baseline, 1),
+        "samples": samples,
+        "rss_growth_mb": round(max(s["rss_mb"] for s in samples) - baseline, 1) if samples else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--sample-every", type=int, default=50_000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.rows, args.sample_every)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
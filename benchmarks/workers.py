@@ -0,0 +1,180 @@
+"""
+Throughput of the multi-worker server (app/server.py) from one worker up to
+one per core.
+
+    python -m benchmarks.workers --duration 10 --clients 64
+    python -m benchmarks.workers --workers 1 2 4 8 --client-processes 4
+
+For each worker count the script starts `python -m app.server` with shared
+memory on, waits until every worker answers, then drives GetPlayer and
+GetPlayerStats from --client-processes processes (so the load generator is
+not the bottleneck) with --clients concurrent connections in total. It
+reports throughput and latency, how the requests spread over the workers
+(from the shared counters in /metrics), and how long SIGTERM takes to
+drain the server while a long-poll request is still open; that request must
+still get its answer.
+
+Scaling needs free cores: the client processes share the machine with the
+workers, so on a host with few cores the numbers flatten early. The load
+is reads only, so SQLite works; set DATABASE_URL to measure against MySQL.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.common import use_local_sqlite
+
+use_local_sqlite("workers")
+
+import httpx
+
+from benchmarks.common import summarize
+from benchmarks.suite import free_port
+
+DRAIN_POLL_WAIT = 2.0  # seconds the long-poll request is held open during the drain
+
+
+def start_server(workers: int) -> tuple[subprocess.Popen, str]:
+    # The server inherits DATABASE_URL from this process
+    port = free_port()
+    env = {**os.environ, "SLOW_REQUEST_MS": "1e9", "TOKEN_SECRET": os.getenv("TOKEN_SECRET") or "bench-secret"}
+    server = subprocess.Popen([
+        sys.executable, "-m", "app.server", "--workers", str(workers),
+        "--host", "127.0.0.1", "--port", str(port), "--shared-memory", "--log-level", "warning",
+    ], env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("app.server exited during startup")
+        try:
+            stats = httpx.get(url + "/metrics", timeout=1).json()["server"]
+            if sum(1 for row in stats["workers"] if row["pid"]) == workers:
+                return server, url
+        except (httpx.TransportError, ValueError, KeyError):
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("app.server did not become ready within 60s")
+
+
+async def client_loop(client, usernames: list[str], offset: int, deadline: float, samples: list[float]):
+    i = offset
+    while time.perf_counter() < deadline:
+        username = usernames[i % len(usernames)]
+        i += 1
+        start = time.perf_counter()
+        if i % 2:
+            await client.get("/players/GetPlayer", params={"username": username})
+        else:
+            await client.get(f"/stats/GetPlayerStats/{username}")
+        samples.append(time.perf_counter() - start)
+
+
+async def drive(url: str, clients: int, offset: int, duration: float, usernames: list[str]) -> list[float]:
+    samples: list[float] = []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            client_loop(client, usernames, offset + i, deadline, samples) for i in range(clients)
+        ))
+    return samples
+
+
+def client_process(url: str, clients: int, offset: int, duration: float, usernames: list[str]) -> list[float]:
+    return asyncio.run(drive(url, clients, offset, duration, usernames))
+
+
+def drain(server: subprocess.Popen, url: str) -> dict:
+    # Open a long-poll, stop the server while it waits, and time the shutdown
+    result = {}
+
+    async def long_poll():
+        async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+            response = await client.post(
+                "/matchmaking/Enqueue", params={"wait": DRAIN_POLL_WAIT}, json={"username": "p0"},
+            )
+            result["in_flight_status"] = response.status_code
+
+    async def stop():
+        await asyncio.sleep(0.3)
+        result["started"] = time.perf_counter()
+        server.send_signal(signal.SIGTERM)
+        await asyncio.get_running_loop().run_in_executor(None, server.wait)
+        result["seconds"] = round(time.perf_counter() - result.pop("started"), 2)
+
+    async def both():
+        await asyncio.gather(long_poll(), stop())
+
+    try:
+        asyncio.run(both())
+    except httpx.TransportError as exc:
+        result["in_flight_status"] = f"failed: {exc!r}"
+        server.wait()
+    result["exit_code"] = server.returncode
+    return result
+
+
+def run_workers(workers: int, args, usernames: list[str]) -> dict:
+    server, url = start_server(workers)
+    try:
+        per_process = max(1, args.clients // args.client_processes)
+        with ProcessPoolExecutor(args.client_processes) as pool:
+            # Short warm-up so every worker has its connections and caches
+            list(pool.map(client_process, *zip(*[
+                (url, per_process, p * per_process, 1.0, usernames) for p in range(args.client_processes)
+            ])))
+            start = time.perf_counter()
+            results = list(pool.map(client_process, *zip(*[
+                (url, per_process, p * per_process, args.duration, usernames) for p in range(args.client_processes)
+            ])))
+            elapsed = time.perf_counter() - start
+        stats = httpx.get(url + "/metrics", timeout=10).json()["server"]
+        report = summarize([sample for samples in results for sample in samples], elapsed)
+        report["requests_per_worker"] = [row["requests"] for row in stats["workers"]]
+        report["server_errors"] = stats["totals"]["server_errors"]
+        report["drain"] = drain(server, url)
+        return report
+    finally:
+        if server.poll() is None:
+            server.kill()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cores = os.cpu_count() or 1
+    default_workers = sorted({1, *(2 ** i for i in range(1, cores.bit_length()) if 2 ** i <= cores), cores})
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers)
+    parser.add_argument("--players", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=64, help="concurrent connections across all client processes")
+    parser.add_argument("--client-processes", type=int, default=max(1, min(4, cores // 2)))
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    from app.manage import migrate
+    from benchmarks.seed import seed_players
+
+    migrate()
+    seed_players(args.players)
+    usernames = [f"p{i}" for i in range(args.players)]
+
+    report = {"cores": cores, "clients": args.clients, "client_processes": args.client_processes, "runs": {}}
+    for workers in args.workers:
+        report["runs"][workers] = run_workers(workers, args, usernames)
+    base = report["runs"][args.workers[0]]["throughput_rps"]
+    report["speedup"] = {
+        workers: round(run["throughput_rps"] / base, 2) if base else None for workers, run in report["runs"].items()
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()